@@ -1,5 +1,59 @@
-from cascade_trainer import *
-from enums import *
-from neural_net import *
-from train_data import *
-from trainer import *
+'''
+The public names of the submodules are resolved lazily: importing pyfann
+loads neither the libfann extension nor NumPy, and each submodule is
+imported the first time one of its names is looked up.  So a program that
+only uses the enums never loads the extension, which is loaded when a
+network or training data is first touched.
+'''
+import importlib
+import os
+
+_exports = {
+    'async_batching': ['AsyncNeuralNet'],
+    'cascade_trainer': ['CascadeTrainer'],
+    'connection': ['Connection', 'connection_dtype'],
+    'cross_validation': ['FoldResult', 'cross_validate'],
+    'enums': ['activation_func', 'error_func', 'net_type', 'stop_func',
+              'train_algorithm'],
+    'model_registry': ['ModelRegistry'],
+    'neural_net': ['FixedNeuralNet', 'ForwardEngine', 'FrozenNeuralNet',
+                   'NeuralNet', 'SparseNeuralNet',
+                   'create_engine_from_binary_file',
+                   'create_network_from_binary_file',
+                   'create_network_from_file', 'create_shortcut_network',
+                   'create_sparse_network', 'create_standard_network'],
+    'parameter_search': ['search_training_parameters'],
+    'process_pool': ['ProcessPoolNet'],
+    'train_data': ['TrainData', 'TrainDataChunks', 'TrainDataView',
+                   'read_train_data_from_binary_file',
+                   'read_train_data_from_file'],
+    'trainer': ['EpochRecord', 'Trainer'],
+}
+
+_submodules = set(_exports) | set(['bench', 'profiling'])
+
+_modules_by_name = dict((name, module) for module, names in _exports.items()
+                        for name in names)
+
+__all__ = sorted(_modules_by_name) + ['profiling']
+
+def __getattr__(name):
+    module = _modules_by_name.get(name)
+    if module is not None:
+        value = getattr(importlib.import_module('.' + module, __name__),
+                        name)
+    elif name in _submodules:
+        value = importlib.import_module('.' + name, __name__)
+    else:
+        raise AttributeError('module ' + __name__ + ' has no attribute ' +
+                             name)
+    # Later lookups find the name without going through __getattr__.
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_modules_by_name) | _submodules)
+
+# Profiling a whole process has to start before the first libfann call.
+if os.environ.get('PYFANN_PROFILE'):
+    from . import profiling
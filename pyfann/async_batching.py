@@ -0,0 +1,175 @@
+import asyncio
+import numpy as np
+from .neural_net import NeuralNet
+
+class AsyncNeuralNet(object):
+    '''
+    An asyncio front end that gathers concurrent predictions into batches.
+
+    Every call of predict queues one input and waits for its outputs.  The
+    queued inputs are run as one run_batch forward pass as soon as
+    max_batch_size of them are waiting, or when the oldest of them has
+    waited max_latency seconds.  The forward pass runs on an executor, so
+    the event loop goes on queueing requests meanwhile, and several batches
+    may be in flight at once.
+
+    A NeuralNet is frozen (see NeuralNet.freeze) so that concurrent batches
+    can share it; changes made to it afterwards are not seen.  Any other
+    object with run_batch and get_num_input, such as a ForwardEngine, a
+    FixedNeuralNet or a ProcessPoolNet, is used as it is and must support
+    the concurrency of the executor.
+
+    An AsyncNeuralNet belongs to the event loop that first calls predict.
+    '''
+
+    def __init__(self, neural_net, max_batch_size=64, max_latency=0.005,
+                 executor=None):
+        '''
+        Constructor
+
+        @param max_batch_size: The largest number of inputs run in one
+            batch.
+        @param max_latency: The longest time in seconds that a request waits
+            for its batch to fill.
+        @param executor: The concurrent.futures executor the batches run on,
+            by default that of the event loop.
+        '''
+        if max_batch_size < 1:
+            raise ValueError('max_batch_size must be at least 1')
+        if max_latency < 0:
+            raise ValueError('max_latency must not be negative')
+        if isinstance(neural_net, NeuralNet):
+            neural_net = neural_net.freeze()
+        self._runner = neural_net
+        self._num_input = neural_net.get_num_input()
+        self._max_batch_size = max_batch_size
+        self._max_latency = max_latency
+        self._executor = executor
+        # The waiting requests, as (input, future, enqueue time) tuples.
+        self._pending = []
+        self._timer = None
+        self.reset_stats()
+
+    async def predict(self, input_data):
+        '''
+        Will run input through the neural network as part of a batch,
+        returning a list of outputs.
+        '''
+        row = np.asarray(input_data, dtype=np.float32)
+        if row.shape != (self._num_input,):
+            raise ValueError('input_data must have ' + str(self._num_input) +
+                             ' values')
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((row, future, loop.time()))
+        self._requests += 1
+        self._max_queue_depth = max(self._max_queue_depth,
+                                    len(self._pending))
+        if len(self._pending) >= self._max_batch_size:
+            self._dispatch(loop)
+        elif self._timer is None:
+            self._timer = loop.call_at(loop.time() + self._max_latency,
+                                       self._dispatch, loop)
+        return await future
+
+    def get_max_batch_size(self):
+        '''
+        Returns the largest number of inputs run in one batch.
+        '''
+        return self._max_batch_size
+
+    def get_max_latency(self):
+        '''
+        Returns the longest time in seconds that a request waits for its
+        batch to fill.
+        '''
+        return self._max_latency
+
+    def get_stats(self):
+        '''
+        Return statistics of the batching as a dict.
+
+        requests is the number of predict calls and batches the number of
+        forward passes run for them; mean_batch_size and max_batch_size
+        describe the batches.  queue_depth is the number of requests
+        waiting for a batch now and max_queue_depth the most there ever
+        were, in_flight the number of batches running now.
+        deadline_batches is the number of batches sent by max_latency
+        rather than by filling up.
+        '''
+        return {
+            'requests': self._requests,
+            'batches': self._batches,
+            'mean_batch_size': (float(self._batched) / self._batches
+                                if self._batches else 0.0),
+            'max_batch_size': self._largest_batch,
+            'queue_depth': len(self._pending),
+            'max_queue_depth': self._max_queue_depth,
+            'in_flight': self._in_flight,
+            'deadline_batches': self._deadline_batches,
+        }
+
+    def reset_stats(self):
+        '''
+        Forget the statistics recorded so far.
+        '''
+        self._requests = 0
+        self._batches = 0
+        self._batched = 0
+        self._largest_batch = 0
+        self._max_queue_depth = len(self._pending)
+        self._in_flight = 0
+        self._deadline_batches = 0
+
+    def _dispatch(self, loop):
+        '''
+        Send the waiting requests to the executor, in batches of at most
+        max_batch_size, leaving a partial batch to its deadline unless it
+        is already due.
+        '''
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            # Requests whose caller went away do not take a place.
+            self._pending = [request for request in self._pending
+                             if not request[1].cancelled()]
+            if not self._pending:
+                break
+            deadline = self._pending[0][2] + self._max_latency
+            if (len(self._pending) < self._max_batch_size and
+                    deadline > loop.time()):
+                self._timer = loop.call_at(deadline, self._dispatch, loop)
+                break
+            if len(self._pending) < self._max_batch_size:
+                self._deadline_batches += 1
+            batch = self._pending[:self._max_batch_size]
+            del self._pending[:self._max_batch_size]
+            self._run(loop, batch)
+
+    def _run(self, loop, batch):
+        inputs = np.stack([row for row, _, _ in batch])
+        self._batches += 1
+        self._batched += len(batch)
+        self._largest_batch = max(self._largest_batch, len(batch))
+        self._in_flight += 1
+        done = loop.run_in_executor(self._executor, self._runner.run_batch,
+                                    inputs)
+        done.add_done_callback(lambda done: self._deliver(batch, done))
+
+    def _deliver(self, batch, done):
+        self._in_flight -= 1
+        error = None
+        if not done.cancelled():
+            error = done.exception()
+            if error is None:
+                outputs = done.result()
+        for i, (_, future, _) in enumerate(batch):
+            if future.done():
+                continue
+            if done.cancelled():
+                future.cancel()
+            elif error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(outputs[i].tolist())
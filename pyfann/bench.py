@@ -0,0 +1,311 @@
+'''
+Benchmarks of the inference and training hot paths.
+
+Run with
+
+    python -m pyfann.bench [--output results.json]
+
+Networks are built with create_standard_network, create_sparse_network and
+create_shortcut_network at several sizes.  For each of them the latency
+percentiles of single-sample run, the throughput of run_batch and of the
+ForwardEngine, and the epoch time of Trainer.train for every
+train_algorithm are measured.  Pruned copies of every network are run as
+a SparseNeuralNet and compared with the dense ForwardEngine for latency,
+throughput and model size.  The results are written as JSON so that two
+versions can be diffed.
+
+Every network is benchmarked in a fresh interpreter, so that its
+peak_memory_bytes, the growth of the peak resident memory from before its
+patterns and network are made to the end of its benchmarks, is its own
+and not the high water mark of the cases run before it.
+
+The time taken by import pyfann in a fresh interpreter is measured too.
+Run with --check-import-budget to only check it, in a CI job for instance:
+the exit status is 1 if the import takes more than the budget, or if it
+loads the libfann extension or NumPy.
+'''
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from timeit import default_timer
+try:
+    import resource
+except ImportError:
+    resource = None
+import numpy as np
+from .enums import train_algorithm
+from .neural_net import (ForwardEngine, create_standard_network,
+                         create_sparse_network, create_shortcut_network)
+from .train_data import TrainData
+from .trainer import Trainer
+
+DEFAULT_SIZES = [[8, 16, 4], [64, 128, 16], [256, 512, 256, 32]]
+
+DEFAULT_SPARSITIES = [0.5, 0.8, 0.95]
+
+# Seconds that import pyfann may take.
+IMPORT_BUDGET = 0.05
+
+# Modules that import pyfann must leave to the first use of a network.
+_heavy_modules = ['fann2.libfann', 'numpy']
+
+_import_code = '''
+import sys
+from timeit import default_timer
+start = default_timer()
+import pyfann
+elapsed = default_timer() - start
+print(repr(elapsed))
+print(' '.join(m for m in %r if m in sys.modules))
+''' % (_heavy_modules,)
+
+_networks = [
+    ('standard', create_standard_network),
+    ('sparse', lambda layers: create_sparse_network(0.5, layers)),
+    ('shortcut', create_shortcut_network),
+]
+
+_case_code = '''
+import json
+import sys
+from pyfann.bench import bench_case
+print(json.dumps(bench_case(**json.loads(sys.stdin.read()))))
+'''
+
+def bench_run(neural_net, inputs):
+    '''
+    Latency percentiles of the run method of neural_net, in seconds.
+    '''
+    rows = inputs.tolist()
+    times = np.empty(len(rows))
+    for i, row in enumerate(rows):
+        start = default_timer()
+        neural_net.run(row)
+        times[i] = default_timer() - start
+    return {
+        'calls': len(rows),
+        'mean': float(times.mean()),
+        'p50': float(np.percentile(times, 50)),
+        'p90': float(np.percentile(times, 90)),
+        'p99': float(np.percentile(times, 99)),
+        'max': float(times.max()),
+    }
+
+def bench_batch(runner, inputs, repeat):
+    '''
+    Throughput of runner.run_batch, in samples per second.
+    '''
+    out = runner.run_batch(inputs)
+    start = default_timer()
+    for _ in range(repeat):
+        runner.run_batch(inputs, out)
+    elapsed = default_timer() - start
+    return len(inputs) * repeat / elapsed if elapsed > 0 else 0.0
+
+def bench_train(neural_net, train_data, epochs):
+    '''
+    Mean seconds per Trainer.train epoch for every training algorithm.
+    '''
+    trainer = Trainer(neural_net, train_data)
+    results = {}
+    for algorithm in train_algorithm:
+        neural_net.randomize_weights()
+        trainer.set_training_algorithm(algorithm)
+        trainer.train()
+        start = default_timer()
+        for _ in range(epochs):
+            trainer.train()
+        results[algorithm.name] = (default_timer() - start) / epochs
+    return results
+
+def bench_pruning(neural_net, inputs, repeat, sparsities=None):
+    '''
+    Latency, throughput and model size of pruned copies of neural_net run
+    as a SparseNeuralNet, against the dense ForwardEngine.
+    '''
+    dense = ForwardEngine(neural_net)
+    dense_latency = bench_run(dense, inputs)['p50']
+    dense_throughput = bench_batch(dense, inputs, repeat)
+    dense_bytes = dense.get_model_bytes()
+    results = []
+    for sparsity in sparsities or DEFAULT_SPARSITIES:
+        pruned = neural_net.copy()
+        pruned.prune(sparsity=sparsity)
+        sparse = pruned.to_sparse()
+        latency = bench_run(sparse, inputs)['p50']
+        throughput = bench_batch(sparse, inputs, repeat)
+        model_bytes = sparse.get_model_bytes()
+        results.append({
+            'sparsity': sparsity,
+            'connections': sparse.get_num_connections(),
+            'run_p50': latency,
+            'dense_run_p50': dense_latency,
+            'latency_reduction': 1.0 - latency / dense_latency,
+            'samples_per_second': throughput,
+            'dense_samples_per_second': dense_throughput,
+            'model_bytes': model_bytes,
+            'dense_model_bytes': dense_bytes,
+            'memory_reduction': 1.0 - float(model_bytes) / dense_bytes,
+        })
+    return results
+
+def bench_import(repeat=5):
+    '''
+    The best time of import pyfann in repeat fresh interpreters, in seconds,
+    and the heavy modules it loaded.
+    '''
+    times = []
+    for _ in range(repeat):
+        lines = subprocess.check_output(
+            [sys.executable, '-c', _import_code], env=_child_env(),
+            universal_newlines=True).splitlines()
+        times.append(float(lines[0]))
+        loaded = lines[1].split() if len(lines) > 1 else []
+    return {'seconds': min(times), 'loaded_modules': loaded}
+
+def check_import_budget(budget=IMPORT_BUDGET):
+    '''
+    Returns the result of bench_import and a list of the ways it breaks
+    the budget, empty if it does not.
+    '''
+    result = bench_import()
+    failures = []
+    if result['seconds'] > budget:
+        failures.append('import pyfann took %.4f s, more than the budget '
+                        'of %.4f s' % (result['seconds'], budget))
+    for module in result['loaded_modules']:
+        failures.append('import pyfann loaded ' + module)
+    return result, failures
+
+def _child_env():
+    '''
+    The environment of the fresh interpreters, which import this pyfann.
+    '''
+    env = dict(os.environ)
+    env.pop('PYFANN_PROFILE', None)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join(
+        [root] + [path for path in [env.get('PYTHONPATH')] if path])
+    return env
+
+def peak_memory():
+    '''
+    Peak resident memory of the process in bytes, or None if unknown.
+    '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def bench_case(network, layers, samples, batch_repeat, epochs, seed,
+               sparsities):
+    '''
+    Run every benchmark of one network and return its results as a dict.
+    Meant to run in a fresh interpreter, see run_benchmarks.
+    '''
+    baseline = peak_memory()
+    random = np.random.RandomState(seed)
+    inputs = random.uniform(-1, 1, (samples, layers[0]))
+    inputs = inputs.astype(np.float32)
+    outputs = random.uniform(-1, 1, (samples, layers[-1]))
+    train_data = TrainData.from_arrays(inputs, outputs.astype(np.float32))
+    neural_net = dict(_networks)[network](layers)
+    result = {
+        'network': network,
+        'layers': list(layers),
+        'connections': neural_net.get_total_connections(),
+        'run_latency': bench_run(neural_net, inputs),
+        'run_batch_samples_per_second':
+            bench_batch(neural_net, inputs, batch_repeat),
+        'engine_samples_per_second':
+            bench_batch(ForwardEngine(neural_net), inputs, batch_repeat),
+        'train_epoch_seconds': bench_train(neural_net, train_data, epochs),
+        'pruning': bench_pruning(neural_net, inputs, batch_repeat,
+                                 sparsities),
+        'peak_memory_bytes': None,
+    }
+    if baseline is not None:
+        result['peak_memory_bytes'] = peak_memory() - baseline
+    return result
+
+def run_benchmarks(sizes=None, samples=1000, batch_repeat=10, epochs=5,
+                   seed=0, sparsities=None):
+    '''
+    Run every benchmark and return the results as a dict.  Every network
+    runs bench_case in its own fresh interpreter, on patterns drawn from a
+    numpy.random.RandomState(seed).
+    '''
+    sizes = sizes or DEFAULT_SIZES
+    results = []
+    for layers in sizes:
+        for name, _ in _networks:
+            case = {'network': name, 'layers': list(layers),
+                    'samples': samples, 'batch_repeat': batch_repeat,
+                    'epochs': epochs, 'seed': seed, 'sparsities': sparsities}
+            output = subprocess.check_output(
+                [sys.executable, '-c', _case_code], env=_child_env(),
+                input=json.dumps(case), universal_newlines=True)
+            results.append(json.loads(output))
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'samples': samples,
+        'import': bench_import(),
+        'results': results,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m pyfann.bench',
+        description='Benchmark pyfann inference and training.')
+    parser.add_argument('--output', help='write the JSON results here '
+                        'instead of stdout')
+    parser.add_argument('--samples', type=int, default=1000,
+                        help='number of samples (default: %(default)s)')
+    parser.add_argument('--batch-repeat', type=int, default=10,
+                        help='run_batch calls per measurement '
+                        '(default: %(default)s)')
+    parser.add_argument('--epochs', type=int, default=5,
+                        help='epochs per training algorithm '
+                        '(default: %(default)s)')
+    parser.add_argument('--layers', action='append',
+                        help='comma separated layer sizes, may be repeated '
+                        '(default: ' + ' '.join(
+                            ','.join(map(str, layers))
+                            for layers in DEFAULT_SIZES) + ')')
+    parser.add_argument('--sparsity', type=float, action='append',
+                        help='fraction of the connections pruned, may be '
+                        'repeated (default: ' + ' '.join(
+                            str(sparsity) for sparsity in DEFAULT_SPARSITIES)
+                        + ')')
+    parser.add_argument('--check-import-budget', type=float, nargs='?',
+                        const=IMPORT_BUDGET, metavar='SECONDS',
+                        help='only check that import pyfann takes less '
+                        'than SECONDS (default: %s) and loads neither the '
+                        'extension nor NumPy' % IMPORT_BUDGET)
+    args = parser.parse_args(argv)
+    if args.check_import_budget is not None:
+        result, failures = check_import_budget(args.check_import_budget)
+        print(json.dumps(result, indent=2, sort_keys=True))
+        for failure in failures:
+            sys.stderr.write(failure + '\n')
+        sys.exit(1 if failures else 0)
+    sizes = None
+    if args.layers:
+        sizes = [[int(n) for n in layers.split(',')] for layers in args.layers]
+    results = run_benchmarks(sizes, args.samples, args.batch_repeat,
+                             args.epochs, sparsities=args.sparsity)
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main()
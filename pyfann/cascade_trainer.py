@@ -1,4 +1,9 @@
-from trainer import Trainer
+import fann2.libfann
+import numpy as np
+from .enums import activation_func, net_type, stop_func, train_algorithm
+from .neural_net import (ForwardEngine, _activation_funcs, _activation_derivs,
+                         _group_neurons, _read_topology)
+from .trainer import Trainer, _ParallelTraining, _threaded_updates
 
 class CascadeTrainer(Trainer):
     '''
@@ -18,125 +23,697 @@ class CascadeTrainer(Trainer):
     of hidden layers with one shorcut connected neuron in each.
     '''
 
-
-    def __init__(self, params):
+    # The propaties kept in libfann, which go over to the network created
+    # for every new neuron.
+    _cascade_prop_names = [
+    'cascade_output_change_fraction',
+    'cascade_output_stagnation_epochs',
+    'cascade_candidate_change_fraction',
+    'cascade_candidate_stagnation_epochs',
+    'cascade_weight_multiplier',
+    'cascade_candidate_limit',
+    'cascade_max_out_epochs',
+    'cascade_max_cand_epochs',
+    'cascade_activation_steepnesses',
+    'cascade_num_candidate_groups'
+    ]
+
+    def __init__(self, neural_net, train_datas):
         '''
         Constructor
+
+        neural_net should be a shortcut network without hidden layers, as
+        created by create_shortcut_network([num_input, num_output]).
+        '''
+        Trainer.__init__(self, neural_net, train_datas)
+        # fann2 cannot read these propaties from libfann, or set some of
+        # them, so they are kept here, starting from the libfann defaults.
+        self._activation_functions = list(_default_activation_functions)
+        self._activation_steepnesses = list(_default_activation_steepnesses)
+        self._min_out_epochs = 50
+        self._min_cand_epochs = 50
+
+    def cascade_train(self, max_neurons, neurons_between_reports=0,
+                      disired_error=0.0):
+        '''
+        Trains on an entire dataset, for a period of time using the Cascade2
+        training algorithm.
+
+        This algorithm adds neurons to the neural network while training,
+        which means that it needs to start with an ANN without any hidden
+        layers.  The neural network should also use shortcut connections.
+
+        The training follows fann_cascadetrain_on_data, but runs in NumPy
+        rather than in libfann, which fann2 does not let set the activation
+        functions of the candidates and the minimum out and candidate
+        epochs.  With more than one thread (see set_num_threads), the
+        candidate neurons are trained in parallel, one share of them per
+        thread, and the output connections are trained with the patterns
+        split across the threads; the result does not depend on the number
+        of threads.
+
+        @param max_neurons: The maximum number of neurons to be added to
+            the neural network
+        @param neurons_between_reports: The number of neurons between
+            printing a status report to stdout. A value of zero means no
+            reports should be printed
+        @param desired_error: The desired MSE or bit fail, depending on
+            which stop function is chosen by set_train_stop_function.
+        '''
+        if self.neural_net._pruned is not None:
+            raise ValueError('cascade training of a pruned network is not '
+                             'supported')
+        parallel = self._parallel
+        if parallel is None:
+            self._parallel = _ParallelTraining(1)
+        try:
+            self._cascade(max_neurons, neurons_between_reports,
+                          disired_error)
+        finally:
+            if parallel is None:
+                self._parallel.close()
+                self._parallel = None
+
+    def _cascade(self, max_neurons, neurons_between_reports, disired_error):
+        '''
+        fann_cascadetrain_on_data on the threads of self._parallel.
+        '''
+        if self.neural_net.get_network_type() != net_type.SHORTCUT:
+            raise ValueError('cascade training needs a shortcut network')
+        algorithm = self.get_training_algorithm()
+        if algorithm not in (train_algorithm.RPROP,
+                             train_algorithm.QUICKPROP):
+            raise ValueError('cascade training only supports RPROP and '
+                             'QUICKPROP')
+        update = _threaded_updates[algorithm]
+        inputs, outputs = self._scaled(self.train_datas)._get_arrays()
+        stop_function = self.get_train_stop_function()
+        total_epochs = 0
+        for neurons in range(max_neurons + 1):
+            engine = ForwardEngine(self.neural_net)
+            engine._check_trainable()
+            epochs, mse, bit_fail = self._train_outputs(
+                engine, inputs, outputs, update, disired_error)
+            total_epochs += epochs
+            error = bit_fail if stop_function == stop_func.BIT else mse
+            if (neurons_between_reports and
+                    (neurons % neurons_between_reports == 0 or
+                     neurons == max_neurons or error <= disired_error)):
+                print('Neurons     %3d. Current error: %.6f. Epochs %5d. '
+                      'Bit fail %3d.' % (neurons, mse, total_epochs,
+                                         bit_fail))
+            if error <= disired_error or neurons == max_neurons:
+                break
+            candidate, epochs = self._train_candidates(engine, inputs,
+                                                       outputs, update)
+            total_epochs += epochs
+            self._install_candidate(*candidate)
+
+    def _train_outputs(self, engine, inputs, outputs, update, disired_error):
+        '''
+        Train the connections to the output neurons until the error
+        stagnates, as fann_train_outputs does.
+
+        Returns the number of epochs, the MSE and the bit fail.
+        '''
+        parallel = self._parallel
+        last = engine._layers[-1]
+        ks = np.concatenate([last.weight_index[0], last.bias_index[0]])
+        weights = self.neural_net.get_weights()
+        output_weights = weights[ks]
+        parallel.algorithm = None
+        parallel.prepare(self, self.get_training_algorithm(), len(ks))
+        error_function = self.get_train_error_function()
+        bit_fail_limit = self.get_bit_fail_limit()
+        stop_function = self.get_train_stop_function()
+        stagnation = _Stagnation(self.get_cascade_output_change_fraction(),
+                                 self.get_cascade_output_stagnation_epochs(),
+                                 self.get_cascade_min_out_epochs(),
+                                 self.get_cascade_max_out_epochs())
+
+        def gradient(inputs, outputs, error_function, bit_fail_limit):
+            return _output_gradient(engine, inputs, outputs, error_function,
+                                    bit_fail_limit)
+
+        initial_error = None
+        epoch = 0
+        try:
+            while True:
+                slopes = parallel.slopes(engine, inputs, outputs,
+                                         error_function, bit_fail_limit,
+                                         gradient)
+                update(self, parallel, output_weights, slopes, len(inputs))
+                weights[ks] = output_weights
+                engine.set_weights(weights)
+                epoch += 1
+                if stop_function == stop_func.BIT:
+                    error = parallel.bit_fail
+                else:
+                    error = parallel.mse
+                if error <= disired_error:
+                    break
+                if initial_error is None:
+                    initial_error = parallel.mse
+                elif stagnation.stagnated(epoch - 1,
+                                          initial_error - parallel.mse):
+                    break
+        finally:
+            self.neural_net.set_weights(weights)
+        return epoch, parallel.mse, parallel.bit_fail
+
+    def _train_candidates(self, engine, inputs, outputs, update):
+        '''
+        Train the candidate neurons until the best score stagnates, as
+        fann_train_candidates does, one share of the candidates per thread.
+
+        The score of a candidate is how much of the summed squared error of
+        the outputs it would remove, its output weights being fitted to the
+        residual errors along with its input weights.
+
+        Returns the (activation function, steepness, input weights, output
+        weights) of the best candidate and the number of epochs.
         '''
+        values, sums, errors, squared_error, bit_fail = \
+            engine._output_errors(inputs, outputs,
+                                  self.get_train_error_function(),
+                                  self.get_bit_fail_limit())
+        num_hidden = engine._num_neurons - engine._num_output
+        # Every candidate gets input from all the neurons but the outputs
+        # and from a bias neuron, the last column.
+        candidate_inputs = np.ones((len(inputs), num_hidden + 1),
+                                   dtype=np.float32)
+        candidate_inputs[:, :num_hidden] = values[:, :num_hidden]
+        residuals = errors[:, num_hidden:]
+        error_sum = float(np.dot(residuals.ravel(), residuals.ravel()))
+
+        candidates = [(func, steepness)
+                      for func in self.get_cascade_activation_functions()
+                      for steepness in self.get_cascade_activation_steepnesses()
+                      for _ in range(self.get_cascade_num_candidate_groups())]
+        for func, steepness in candidates:
+            if func not in _activation_derivs:
+                raise ValueError('cannot train activation function ' +
+                                 func.name)
+        initial_step = 0.0
+        if self.get_training_algorithm() == train_algorithm.RPROP:
+            initial_step = self.get_rprop_delta_zero()
+        bounds = np.linspace(0, len(candidates), self._parallel.num_threads + 1)
+        bounds = bounds.astype(int).tolist()
+        shares = [_CandidateShare(candidates[lo:hi], num_hidden + 1,
+                                  engine._num_output, initial_step)
+                  for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+
+        limit = self.get_cascade_candidate_limit()
+        stagnation = _Stagnation(
+            self.get_cascade_candidate_change_fraction(),
+            self.get_cascade_candidate_stagnation_epochs(),
+            self.get_cascade_min_cand_epochs(),
+            self.get_cascade_max_cand_epochs())
+        epoch = 0
+        while True:
+            scores = self._parallel.pool.map(
+                lambda share: share.train_epoch(
+                    self, update, candidate_inputs, residuals, error_sum),
+                shares)
+            epoch += 1
+            best_score = max(score.max() for score in scores)
+            if error_sum <= 0.0 or best_score / error_sum > limit:
+                break
+            if stagnation.stagnated(epoch - 1, best_score):
+                break
+
+        share, scores = max(zip(shares, scores),
+                            key=lambda pair: pair[1].max())
+        best = int(np.argmax(scores))
+        func, steepness = share.candidates[best]
+        params = share.params[best]
+        return ((func, steepness, params[:num_hidden + 1],
+                 params[num_hidden + 1:]), epoch)
+
+    def _install_candidate(self, func, steepness, input_weights,
+                           output_weights):
+        '''
+        Add a candidate neuron to the network as a new hidden layer, as
+        fann_install_candidate does.
+
+        libfann cannot grow a network from the outside, so a shortcut
+        network one layer larger is created and everything is copied into
+        it: the weights, the activation functions and steepnesses, and the
+        training propaties.
+        '''
+        old = self.neural_net._fann
+        (network_type, layers, biases, from_neuron, to_neuron, weights, funcs,
+         steepnesses) = _read_topology(old)
+        new_layers = layers[:-1] + [1] + layers[-1:]
+        fann = fann2.libfann.neural_net()
+        fann.create_shortcut_array(new_layers)
+        new_biases = fann.get_bias_array()
+        first = _first_neurons(layers, biases)
+        new_first = _first_neurons(new_layers, new_biases)
+        output_layer = len(layers) - 1
+
+        # Where every neuron of the old network, bias neurons included,
+        # went in the new one.
+        remap = np.empty(first[-1], dtype=np.intp)
+        for layer in range(len(layers)):
+            new_layer = layer if layer < output_layer else layer + 1
+            count = layers[layer] + biases[layer]
+            remap[first[layer]:first[layer] + count] = \
+                new_first[new_layer] + np.arange(count)
+
+        connections = np.asarray(fann.get_connection_array(),
+                                 dtype=np.float64).reshape(-1, 3)
+        new_from = connections[:, 0].astype(np.intp)
+        new_to = connections[:, 1].astype(np.intp)
+        new_weights = np.zeros(len(connections))
+        total = new_first[-1]
+        old_keys = remap[from_neuron] * total + remap[to_neuron]
+        order = np.argsort(old_keys)
+        keys = new_from * total + new_to
+        found = np.minimum(np.searchsorted(old_keys[order], keys),
+                           max(len(order) - 1, 0))
+        known = old_keys[order][found] == keys
+        new_weights[known] = weights[order[found[known]]]
+
+        hidden = new_first[output_layer]
+        sources = [remap[first[layer] + neuron]
+                   for layer in range(output_layer)
+                   for neuron in range(layers[layer])]
+        sources.append(remap[first[0] + layers[0]])
+        source_weights = dict(zip(sources, input_weights.tolist()))
+        into = np.nonzero(new_to == hidden)[0]
+        new_weights[into] = [source_weights.get(source, 0.0)
+                             for source in new_from[into].tolist()]
+        out_of = np.nonzero(new_from == hidden)[0]
+        new_weights[out_of] = (output_weights[new_to[out_of] -
+                                              new_first[output_layer + 1]] *
+                               self.get_cascade_weight_multiplier())
+        fann.set_weight_array(list(zip(new_from.tolist(), new_to.tolist(),
+                                       new_weights.tolist())))
+
+        neuron_index = 0
+        for layer in range(1, len(layers)):
+            new_layer = layer if layer < output_layer else layer + 1
+            for neuron in range(layers[layer]):
+                fann.set_activation_function(funcs[neuron_index], new_layer,
+                                             neuron)
+                fann.set_activation_steepness(
+                    float(steepnesses[neuron_index]), new_layer, neuron)
+                neuron_index += 1
+        fann.set_activation_function(func.value, output_layer, 0)
+        fann.set_activation_steepness(float(steepness), output_layer, 0)
+
+        propaties = self.get_training_propaties()
+        cascade_propaties = [(name, getattr(self, 'get_' + name)())
+                             for name in self._cascade_prop_names]
+        self.neural_net._fann = fann
+        self.set_training_propaties(**propaties)
+        for name, value in cascade_propaties:
+            getattr(self, 'set_' + name)(value)
+        old.destroy()
 
     def get_cascade_output_change_fraction(self):
-        """
-        """
+        '''
+        The cascade output change fraction is a number between 0 and 1
+        determining how large a fraction the MSE should change within
+        get_cascade_output_stagnation_epochs during training of the output
+        connections, in order for the training not to stagnate.  If the
+        training stagnates, the training of the output connections will be
+        ended and new candidates will be prepared.
+
+        The default cascade output change fraction is 0.01.
+        '''
+        return self.neural_net._fann.get_cascade_output_change_fraction()
 
-    def set_cascade_output_change_fraction(self):
-        """
-        """
+    def set_cascade_output_change_fraction(self, change_fraction):
+        '''
+        Sets the cascade output change fraction.
+        '''
+        self.neural_net._fann.set_cascade_output_change_fraction(
+            change_fraction)
 
     def get_cascade_output_stagnation_epochs(self):
-        """
-        """
+        '''
+        The number of cascade output stagnation epochs determines the
+        number of epochs training is allowed to continue without changing
+        the MSE by a fraction of get_cascade_output_change_fraction.
+
+        The default number of cascade output stagnation epochs is 12.
+        '''
+        return self.neural_net._fann.get_cascade_output_stagnation_epochs()
 
-    def set_cascade_output_stagnation_epochs(self):
-        """
-        """
+    def set_cascade_output_stagnation_epochs(self, stagnation_epochs):
+        '''
+        Sets the number of cascade output stagnation epochs.
+        '''
+        self.neural_net._fann.set_cascade_output_stagnation_epochs(
+            stagnation_epochs)
 
     def get_cascade_candidate_change_fraction(self):
-        """
-        """
+        '''
+        The cascade candidate change fraction is a number between 0 and 1
+        determining how large a fraction the best candidate score should
+        change within get_cascade_candidate_stagnation_epochs during
+        training of the candidate neurons, in order for the training not to
+        stagnate.  If the training stagnates, the training of the candidate
+        neurons will be ended and the best candidate will be selected.
+
+        The default cascade candidate change fraction is 0.01.
+        '''
+        return self.neural_net._fann.get_cascade_candidate_change_fraction()
 
-    def set_cascade_candidate_change_fraction(self):
-        """
-        """
+    def set_cascade_candidate_change_fraction(self, change_fraction):
+        '''
+        Sets the cascade candidate change fraction.
+        '''
+        self.neural_net._fann.set_cascade_candidate_change_fraction(
+            change_fraction)
 
     def get_cascade_candidate_stagnation_epochs(self):
-        """
-        """
+        '''
+        The number of cascade candidate stagnation epochs determines the
+        number of epochs training is allowed to continue without changing
+        the best candidate score by a fraction of
+        get_cascade_candidate_change_fraction.
 
-    def set_cascade_candidate_stagnation_epochs(self):
-        """
-        """
+        The default number of cascade candidate stagnation epochs is 12.
+        '''
+        return self.neural_net._fann.get_cascade_candidate_stagnation_epochs()
+
+    def set_cascade_candidate_stagnation_epochs(self, stagnation_epochs):
+        '''
+        Sets the number of cascade candidate stagnation epochs.
+        '''
+        self.neural_net._fann.set_cascade_candidate_stagnation_epochs(
+            stagnation_epochs)
 
     def get_cascade_weight_multiplier(self):
-        """
-        """
+        '''
+        The weight multiplier is a parameter which is used to multiply the
+        weights from the candidate neuron before adding the neuron to the
+        neural network.  This parameter is usually between 0 and 1, and is
+        used to make the training a bit less aggressive.
+
+        The default weight multiplier is 0.4.
+        '''
+        return self.neural_net._fann.get_cascade_weight_multiplier()
 
-    def set_cascade_weight_multiplier(self):
-        """
-        """
+    def set_cascade_weight_multiplier(self, weight_multiplier):
+        '''
+        Sets the weight multiplier.
+        '''
+        self.neural_net._fann.set_cascade_weight_multiplier(weight_multiplier)
 
     def get_cascade_candidate_limit(self):
-        """
-        """
+        '''
+        The candidate limit is a limit for how much the candidate neuron may
+        be trained.  The limit is a limit on the proportion between the MSE
+        and candidate score.
 
-    def set_cascade_candidate_limit(self):
-        """
-        """
+        The default candidate limit is 1000.0.
+        '''
+        return self.neural_net._fann.get_cascade_candidate_limit()
+
+    def set_cascade_candidate_limit(self, candidate_limit):
+        '''
+        Sets the candidate limit.
+        '''
+        self.neural_net._fann.set_cascade_candidate_limit(candidate_limit)
 
     def get_cascade_max_out_epochs(self):
-        """
-        """
+        '''
+        The maximum out epochs determines the maximum number of epochs the
+        output connections may be trained after adding a new candidate
+        neuron.
 
-    def set_cascade_max_out_epochs(self):
-        """
-        """
+        The default number of maximum out epochs is 150.
+        '''
+        return self.neural_net._fann.get_cascade_max_out_epochs()
+
+    def set_cascade_max_out_epochs(self, max_out_epochs):
+        '''
+        Sets the maximum out epochs.
+        '''
+        self.neural_net._fann.set_cascade_max_out_epochs(max_out_epochs)
 
     def get_cascade_min_out_epochs(self):
-        """
-        """
+        '''
+        The minimum out epochs determines the minimum number of epochs the
+        output connections must be trained after adding a new candidate
+        neuron.
+
+        The default number of minimum out epochs is 50.
+        '''
+        return self._min_out_epochs
 
-    def set_cascade_min_out_epochs(self):
-        """
-        """
+    def set_cascade_min_out_epochs(self, min_out_epochs):
+        '''
+        Sets the minimum out epochs.
+        '''
+        self._min_out_epochs = min_out_epochs
 
     def get_cascade_max_cand_epochs(self):
-        """
-        """
+        '''
+        The maximum candidate epochs determines the maximum number of epochs
+        the input connections to the candidates may be trained before adding
+        a new candidate neuron.
 
-    def set_cascade_max_cand_epochs(self):
-        """
-        """
+        The default number of maximum candidate epochs is 150.
+        '''
+        return self.neural_net._fann.get_cascade_max_cand_epochs()
+
+    def set_cascade_max_cand_epochs(self, max_cand_epochs):
+        '''
+        Sets the max candidate epochs.
+        '''
+        self.neural_net._fann.set_cascade_max_cand_epochs(max_cand_epochs)
 
     def get_cascade_min_cand_epochs(self):
-        """
-        """
+        '''
+        The minimum candidate epochs determines the minimum number of epochs
+        the input connections to the candidates may be trained before adding
+        a new candidate neuron.
+
+        The default number of minimum candidate epochs is 50.
+        '''
+        return self._min_cand_epochs
 
-    def set_cascade_min_cand_epochs(self):
-        """
-        """
+    def set_cascade_min_cand_epochs(self, min_cand_epochs):
+        '''
+        Sets the min candidate epochs.
+        '''
+        self._min_cand_epochs = min_cand_epochs
 
     def get_cascade_num_candidates(self):
-        """
-        """
+        '''
+        The number of candidates used during training (calculated by
+        multiplying get_cascade_activation_functions_count,
+        get_cascade_activation_steepnesses_count and
+        get_cascade_num_candidate_groups).
+
+        The default number of candidates is 10 * 4 * 2 = 80.
+        '''
+        return (self.get_cascade_activation_functions_count() *
+                self.get_cascade_activation_steepnesses_count() *
+                self.get_cascade_num_candidate_groups())
 
     def get_cascade_activation_functions_count(self):
-        """
-        """
+        '''
+        The number of activation functions in the
+        get_cascade_activation_functions list.
+        '''
+        return len(self._activation_functions)
 
     def get_cascade_activation_functions(self):
-        """
-        """
+        '''
+        The cascade activation functions list is a list of the different
+        activation functions used by the candidates, as activation_func.
 
-    def set_cascade_activation_functions(self):
-        """
-        """
+        The default activation functions are SIGMOID, SIGMOID_SYMMETRIC,
+        GAUSSIAN, GAUSSIAN_SYMMETRIC, ELLIOT, ELLIOT_SYMMETRIC,
+        SIN_SYMMETRIC, COS_SYMMETRIC, SIN and COS.
+        '''
+        return list(self._activation_functions)
+
+    def set_cascade_activation_functions(self, activation_functions):
+        '''
+        Sets the list of cascade candidate activation functions.
+        '''
+        activation_functions = [activation_func(f)
+                                for f in activation_functions]
+        if not activation_functions:
+            raise ValueError('activation_functions must not be empty')
+        self._activation_functions = activation_functions
 
     def get_cascade_activation_steepnesses_count(self):
-        """
-        """
+        '''
+        The number of activation steepnesses in the
+        get_cascade_activation_steepnesses list.
+        '''
+        return len(self._activation_steepnesses)
 
     def get_cascade_activation_steepnesses(self):
-        """
-        """
+        '''
+        The cascade activation steepnesses list is a list of the different
+        activation steepnesses used by the candidates.
+
+        The default activation steepnesses are 0.25, 0.50, 0.75 and 1.00.
+        '''
+        return list(self._activation_steepnesses)
 
-    def set_cascade_activation_steepnesses(self):
-        """
-        """
+    def set_cascade_activation_steepnesses(self, activation_steepnesses):
+        '''
+        Sets the list of cascade candidate activation steepnesses.
+        '''
+        activation_steepnesses = [float(s) for s in activation_steepnesses]
+        if not activation_steepnesses:
+            raise ValueError('activation_steepnesses must not be empty')
+        self.neural_net._fann.set_cascade_activation_steepnesses(
+            activation_steepnesses)
+        self._activation_steepnesses = activation_steepnesses
 
     def get_cascade_num_candidate_groups(self):
-        """
-        """
+        '''
+        The number of candidate groups is the number of groups of identical
+        candidates which will be used during training.
+
+        The default number of candidate groups is 2.
+        '''
+        return self.neural_net._fann.get_cascade_num_candidate_groups()
+
+    def set_cascade_num_candidate_groups(self, num_candidate_groups):
+        '''
+        Sets the number of candidate groups.
+        '''
+        self.neural_net._fann.set_cascade_num_candidate_groups(
+            num_candidate_groups)
+
+_default_activation_functions = [
+    activation_func.SIGMOID, activation_func.SIGMOID_SYMMETRIC,
+    activation_func.GAUSSIAN, activation_func.GAUSSIAN_SYMMETRIC,
+    activation_func.ELLIOT, activation_func.ELLIOT_SYMMETRIC,
+    activation_func.SIN_SYMMETRIC, activation_func.COS_SYMMETRIC,
+    activation_func.SIN, activation_func.COS]
+
+_default_activation_steepnesses = [0.25, 0.5, 0.75, 1.0]
+
+class _Stagnation(object):
+    '''
+    The stagnation test of fann_train_outputs and fann_train_candidates.
 
-    def set_cascade_num_candidate_groups(self):
-        """
-        """
+    Whenever the improvement moves by more than change_fraction from the
+    last goal, a new goal is set and stagnation_epochs more epochs are
+    allowed to reach it.
+    '''
+
+    def __init__(self, change_fraction, stagnation_epochs, min_epochs,
+                 max_epochs):
+        self.change_fraction = change_fraction
+        self.stagnation_epochs = stagnation_epochs
+        self.min_epochs = min_epochs
+        self.max_epochs = max_epochs
+        self.target = 0.0
+        self.backslide = -1.0e20
+        self.stagnation = max_epochs
+
+    def stagnated(self, epoch, improvement):
+        '''
+        Returns whether the training should end after epoch, counted from
+        0, given the improvement it reached.
+        '''
+        if improvement > self.target or improvement < self.backslide:
+            self.target = improvement * (1.0 + self.change_fraction)
+            self.backslide = improvement * (1.0 - self.change_fraction)
+            self.stagnation = epoch + self.stagnation_epochs
+        return (epoch + 1 >= self.max_epochs or
+                (epoch >= self.stagnation and epoch >= self.min_epochs))
+
+class _CandidateShare(object):
+    '''
+    The candidate neurons trained on one thread and their training state.
+
+    Every row of params holds the input weights of a candidate, the bias
+    weight last, followed by its output weights.
+    '''
 
+    def __init__(self, candidates, num_inputs, num_output, initial_step):
+        self.candidates = candidates
+        self.num_inputs = num_inputs
+        self.params = np.random.uniform(
+            -0.1, 0.1, (len(candidates), num_inputs + num_output))
+        self.params = self.params.astype(np.float32)
+        self.groups = _group_neurons([func for func, _ in candidates])
+        self.steepness = np.array([s for _, s in candidates],
+                                  dtype=np.float32)
+        self.max_sum = 150.0 / self.steepness
+        # The state the weight updates of trainer expect.
+        self.prev_steps = np.full(self.params.size, initial_step,
+                                  dtype=np.float32)
+        self.prev_slopes = np.zeros(self.params.size, dtype=np.float32)
+        self.mse = 0.0
+        self.sarprop_epoch = 0
+
+    def train_epoch(self, trainer, update, inputs, residuals, error_sum):
+        '''
+        Score the candidates on all the patterns and update their weights
+        once.  Returns the scores, taken before the update.
+        '''
+        input_weights = self.params[:, :self.num_inputs]
+        output_weights = self.params[:, self.num_inputs:]
+        sums = np.dot(inputs, input_weights.T)
+        sums *= self.steepness
+        np.clip(sums, -self.max_sum, self.max_sum, out=sums)
+        values = np.empty_like(sums)
+        # Untrained candidates easily saturate; exp overflowing is fine.
+        with np.errstate(over='ignore'):
+            for func, candidates in self.groups:
+                if candidates is None:
+                    values[...] = _activation_funcs[func](sums)
+                else:
+                    values[:, candidates] = _activation_funcs[func](
+                        sums[:, candidates])
+        diff = values[:, :, np.newaxis] * output_weights - \
+            residuals[:, np.newaxis, :]
+        scores = error_sum - np.einsum('nco,nco->c', diff, diff)
+
+        slopes = np.empty_like(self.params)
+        slopes[:, self.num_inputs:] = -2.0 * np.einsum('nc,nco->co', values,
+                                                       diff)
+        errors = -2.0 * np.einsum('nco,co->nc', diff, output_weights)
+        for func, candidates in self.groups:
+            if candidates is None:
+                candidates = slice(None)
+            errors[:, candidates] *= _activation_derivs[func](
+                self.steepness[candidates], values[:, candidates],
+                sums[:, candidates])
+        slopes[:, :self.num_inputs] = np.dot(errors.T, inputs)
+        update(trainer, self, self.params.reshape(-1), slopes.reshape(-1),
+               len(inputs))
+        return scores
+
+def _output_gradient(engine, inputs, outputs, error_function, bit_fail_limit):
+    '''
+    ForwardEngine._gradient restricted to the connections to the output
+    neurons, in the order of their weight indices and then of their bias
+    indices.
+    '''
+    values, sums, errors, squared_error, bit_fail = engine._output_errors(
+        inputs, outputs, error_function, bit_fail_limit)
+    last = engine._layers[-1]
+    layer_errors = errors[:, last.start:last.end]
+    weight_slopes = np.dot(values[:, last.lo:last.start].T, layer_errors)
+    ks, rows, cols = last.weight_index
+    bias_ks, bias_cols = last.bias_index
+    slopes = np.concatenate([weight_slopes[rows, cols],
+                             layer_errors.sum(axis=0)[bias_cols]])
+    return slopes.astype(np.float32), squared_error, bit_fail
+
+def _first_neurons(layers, biases):
+    '''
+    The index of the first neuron of every layer, as libfann numbers them,
+    and the total number of neurons last.
+    '''
+    first = [0]
+    for num, num_bias in zip(layers, biases):
+        first.append(first[-1] + num + num_bias)
+    return first
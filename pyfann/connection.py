@@ -1,11 +1,17 @@
-class Connection(object):
-    '''
-    classdocs
-    '''
+from collections import namedtuple
+import numpy as np
 
+# The NumPy type of one connection in the structured arrays of
+# NeuralNet.get_weights(structured=True): the neuron the connection comes
+# from and the neuron it goes to, as libfann numbers them, and its weight.
+connection_dtype = np.dtype([('from_neuron', np.uint32),
+                             ('to_neuron', np.uint32),
+                             ('weight', np.float64)])
 
-    def __init__(self, params):
-        '''
-        Constructor
-        '''
-        
\ No newline at end of file
+class Connection(namedtuple('Connection', [
+        'from_neuron', 'to_neuron', 'weight'])):
+    '''
+    One connection of a neural network, as a record of a structured array
+    of connection_dtype.
+    '''
+    __slots__ = ()
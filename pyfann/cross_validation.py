@@ -0,0 +1,125 @@
+import multiprocessing
+from collections import namedtuple
+from multiprocessing import shared_memory
+import numpy as np
+from .train_data import TrainData
+from .trainer import Trainer
+
+class FoldResult(namedtuple('FoldResult', [
+        'fold', 'MSE', 'bit_fail', 'num_train', 'num_test'])):
+    '''
+    The result of one fold of cross_validate.
+
+    MSE and bit_fail are those of Trainer.test on the held out patterns of
+    the fold, after training on the num_train other patterns.
+    '''
+    __slots__ = ()
+
+def cross_validate(neural_net, train_data, k=5, max_epochs=100,
+                   shuffle=True, seed=None, processes=None):
+    '''
+    Estimates how well neural_net trains on train_data by k-fold cross
+    validation.
+
+    The patterns are split into k folds of nearly equal size, after a
+    shuffle drawn from a numpy.random.RandomState(seed) if shuffle is true.
+    For every fold, a NeuralNet.copy() of neural_net is trained for
+    max_epochs with Trainer.train_for, with the training propaties of
+    neural_net, on the patterns of the other folds, then tested on the
+    patterns of the fold.  The folds are trained concurrently on a pool of
+    worker processes.  The shuffle is drawn once, here, and the folds are
+    handed to the workers, so that they are disjoint even when seed is
+    None.
+
+    The patterns, scaled if neural_net has scaling parameters, are copied
+    once into shared memory, and every worker makes its folds out of
+    TrainData views of it, so no pattern is pickled.  The workers are
+    forked, so that they inherit the network; this needs a platform that
+    supports fork.
+
+    @param processes: The number of worker processes, by default the
+        number of CPUs.
+    @return: A list of k FoldResult, in the order of the folds.
+    '''
+    global _cv_network
+    num_data = train_data.length()
+    if not 2 <= k <= num_data:
+        raise ValueError('k must be between 2 and the number of patterns')
+    inputs, outputs = train_data._scaled(neural_net._scaling)._get_arrays()
+    block = shared_memory.SharedMemory(
+        create=True, size=max(inputs.nbytes + outputs.nbytes, 1))
+    try:
+        layout = []
+        offset = 0
+        for array in (inputs, outputs):
+            shared = np.ndarray(array.shape, dtype=array.dtype,
+                                buffer=block.buf, offset=offset)
+            shared[...] = array
+            layout.append((offset, array.shape, array.dtype.str))
+            offset += array.nbytes
+        _cv_network = neural_net
+        pool = multiprocessing.get_context('fork').Pool(
+            min(processes or multiprocessing.cpu_count(), k), _init_worker,
+            (block.name, layout,
+             _fold_indices(num_data, k, shuffle, seed)))
+        try:
+            results = pool.map(_train_fold,
+                               [(fold, max_epochs) for fold in range(k)])
+        finally:
+            pool.close()
+            pool.join()
+            _cv_network = None
+    finally:
+        block.close()
+        block.unlink()
+    return [FoldResult(*result) for result in results]
+
+def _fold_indices(num_data, k, shuffle, seed):
+    '''
+    Returns the pattern indices of every fold.
+    '''
+    if shuffle:
+        order = np.random.RandomState(seed).permutation(num_data)
+    else:
+        order = np.arange(num_data)
+    return np.array_split(order, k)
+
+# The network being cross-validated, inherited by the forked workers.
+_cv_network = None
+
+# State of a worker process: the shared patterns and the folds.
+_worker_block = None
+_worker_data = None
+_worker_folds = None
+
+def _init_worker(block_name, layout, folds):
+    global _worker_block, _worker_data, _worker_folds
+    block = _worker_block = shared_memory.SharedMemory(name=block_name)
+    data = _worker_data = TrainData()
+    data._input, data._output = [
+        np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=offset)
+        for offset, shape, dtype in layout]
+    data._length = data._input.shape[0]
+    data._addDone = False
+    _worker_folds = folds
+
+def _train_fold(task):
+    '''
+    Trains a copy of the network on all the folds but one, and returns the
+    fields of its FoldResult.
+    '''
+    fold, max_epochs = task
+    test_indices = _worker_folds[fold]
+    train_indices = np.concatenate(
+        [indices for i, indices in enumerate(_worker_folds) if i != fold])
+    candidate = _cv_network.copy()
+    # The shared patterns are already scaled.
+    candidate._scaling = None
+    trainer = Trainer(candidate, _worker_data.view(train_indices))
+    trainer.train_for(max_epochs)
+    trainer.train_datas = _worker_data.view(test_indices)
+    # test_data resets the MSE and the bit fail before testing, so both are
+    # those of the held out patterns.
+    mse = trainer.test()
+    return (fold, mse, candidate._fann.get_bit_fail(), len(train_indices),
+            len(test_indices))
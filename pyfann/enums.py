@@ -1,5 +1,8 @@
 from enum import Enum
-import fann2.libfann
+
+# The values are those of the enums of fann_data.h, which are part of the
+# libfann ABI, rather than the constants of fann2.libfann, so that the enums
+# can be used without loading the extension.
 
 class net_type(Enum):
     '''
@@ -9,12 +12,12 @@ class net_type(Enum):
     '''
     Each layer only has connections to the next layer
     '''
-    LAYER = fann2.libfann.LAYER
+    LAYER = 0
 
     '''
     Each layer has connections to all following layers
     '''
-    SHORTCUT = fann2.libfann.SHORTCUT
+    SHORTCUT = 1
 
 class error_func(Enum):
     '''
@@ -24,7 +27,7 @@ class error_func(Enum):
     '''
     Standard linear error function.
     '''
-    LINEAR = fann2.libfann.ERRORFUNC_LINEAR
+    LINEAR = 0
 
     '''
     Tanh error function, usually better but can require a lower learning rate.
@@ -34,7 +37,7 @@ class error_func(Enum):
     This activation function is not recommended for cascade training and
     incremental training.
     '''
-    TANH = fann2.libfann.ERRORFUNC_TANH
+    TANH = 1
 
 class stop_func(Enum):
     '''
@@ -44,7 +47,7 @@ class stop_func(Enum):
     '''
     Stop criteria is Mean Square Error (MSE) value.
     '''
-    MSE = fann2.libfann.STOPFUNC_MSE
+    MSE = 0
     
     
     '''
@@ -55,7 +58,7 @@ class stop_func(Enum):
     The bits are counted in all of the training data, so this number can be higher
     than the number of training data.
     '''
-    BIT = fann2.libfann.STOPFUNC_BIT
+    BIT = 1
 
 class activation_func(Enum):
     '''
@@ -70,22 +73,24 @@ class activation_func(Enum):
     and fann_set_activation_steepness.
     '''
     
-    LINEAR = fann2.libfann.LINEAR
-    THRESHOLD = fann2.libfann.THRESHOLD
-    THRESHOLD_SYMMETRIC = fann2.libfann.THRESHOLD_SYMMETRIC
-    SIGMOID = fann2.libfann.SIGMOID
-    SIGMOID_STEPWISE = fann2.libfann.SIGMOID_STEPWISE
-    SIGMOID_SYMMETRIC = fann2.libfann.SIGMOID_SYMMETRIC
-    SIGMOID_SYMMETRIC_STEPWISE = fann2.libfann.SIGMOID_SYMMETRIC_STEPWISE
-    GAUSSIAN = fann2.libfann.GAUSSIAN
-    GAUSSIAN_SYMMETRIC = fann2.libfann.GAUSSIAN_SYMMETRIC
-    GAUSSIAN_STEPWISE = fann2.libfann.GAUSSIAN_STEPWISE
-    ELLIOT = fann2.libfann.ELLIOT
-    ELLIOT_SYMMETRIC = fann2.libfann.ELLIOT_SYMMETRIC
-    LINEAR_PIECE = fann2.libfann.LINEAR_PIECE
-    LINEAR_PIECE_SYMMETRIC = fann2.libfann.LINEAR_PIECE_SYMMETRIC
-    SIN_SYMMETRIC = fann2.libfann.SIN_SYMMETRIC
-    COS_SYMMETRIC = fann2.libfann.COS_SYMMETRIC
+    LINEAR = 0
+    THRESHOLD = 1
+    THRESHOLD_SYMMETRIC = 2
+    SIGMOID = 3
+    SIGMOID_STEPWISE = 4
+    SIGMOID_SYMMETRIC = 5
+    SIGMOID_SYMMETRIC_STEPWISE = 6
+    GAUSSIAN = 7
+    GAUSSIAN_SYMMETRIC = 8
+    GAUSSIAN_STEPWISE = 9
+    ELLIOT = 10
+    ELLIOT_SYMMETRIC = 11
+    LINEAR_PIECE = 12
+    LINEAR_PIECE_SYMMETRIC = 13
+    SIN_SYMMETRIC = 14
+    COS_SYMMETRIC = 15
+    SIN = 16
+    COS = 17
 
 class train_algorithm(Enum):
     '''
@@ -105,7 +110,7 @@ class train_algorithm(Enum):
     For this reason some problems, will train very fast with this algorithm,
     while other more advanced problems will not train very well.
     '''
-    INCREMENTAL = fann2.libfann.TRAIN_INCREMENTAL
+    INCREMENTAL = 0
     
     '''
     Standard backpropagation algorithm, where the weights are updated after
@@ -117,7 +122,7 @@ class train_algorithm(Enum):
     incremental training, some problems will reach a better solutions with this
     algorithm.
     '''
-    BATCH = fann2.libfann.TRAIN_BATCH
+    BATCH = 1
     
     '''
     A more advanced batch training algorithm which achieves good results for many
@@ -133,7 +138,7 @@ class train_algorithm(Enum):
     which is an variety of the standard RPROP training algorithm.
     
     '''
-    RPROP = fann2.libfann.TRAIN_RPROP
+    RPROP = 2
     
     '''
     A more advanced batch training algorithm which achieves good results for many
@@ -145,6 +150,6 @@ class train_algorithm(Enum):
     algorithm works.  The quickprop training algorithm is described by
     [Fahlman, 1988].
     '''
-    QUICKPROP = fann2.libfann.TRAIN_QUICKPROP
+    QUICKPROP = 3
     
-    SARPROP = fann2.libfann.TRAIN_SARPROP
\ No newline at end of file
+    SARPROP = 4
\ No newline at end of file
@@ -0,0 +1,221 @@
+import os
+import threading
+from collections import OrderedDict
+from .neural_net import create_network_from_file
+
+class ModelRegistry(object):
+    '''
+    A least recently used cache of networks loaded with
+    create_network_from_file, keyed by path and modification time.
+
+    The cache may be bounded by a number of entries, by an estimate of the
+    memory used by the networks, or both.  When a cached file changes, the
+    new version is loaded in the background while get keeps returning the
+    old network.  Once loaded, the new network replaces the old one in a
+    single step, so callers never wait for a reload nor see a partly loaded
+    network.  Networks handed out earlier stay valid for as long as they are
+    referenced.
+
+    Files should be replaced atomically (written elsewhere and renamed);
+    a reload that fails keeps the old network and is only retried once the
+    file changes again.  Likewise a cached network whose file was deleted is
+    still returned, until it is evicted or removed.
+    '''
+
+    def __init__(self, max_entries=None, max_bytes=None, poll_interval=None):
+        '''
+        Constructor
+
+        @param max_entries: The maximum number of cached networks, or None.
+        @param max_bytes: The maximum estimated memory of the cached
+            networks, or None.  The network used last is always kept.
+        @param poll_interval: If given, a background thread checks the
+            cached files for changes every poll_interval seconds and get
+            does not touch the file system for cached networks.  Otherwise
+            get checks the modification time of the file on every call.
+        '''
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._loading = {}
+        self._reloading = set()
+        self._closed = threading.Event()
+        self._watcher = None
+        if poll_interval:
+            self._watcher = threading.Thread(target=self._watch,
+                                             args=(poll_interval,))
+            self._watcher.daemon = True
+            self._watcher.start()
+
+    def get(self, filename):
+        '''
+        Returns the network stored in filename, loading it on first use.
+        '''
+        key = os.path.abspath(filename)
+        stamp = None
+        if self._watcher is None:
+            try:
+                stamp = _stamp(key)
+            except OSError:
+                # Keep serving the cached network, if any; otherwise
+                # loading it fails below.
+                pass
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if stamp is not None and entry.outdated(stamp):
+                    self._reload_in_background(key)
+                return entry.model
+            loaded = self._loading.get(key)
+            first = loaded is None
+            if first:
+                loaded = self._loading[key] = threading.Event()
+        if not first:
+            loaded.wait()
+            return self.get(filename)
+        try:
+            stamp = _stamp(key)
+            model = create_network_from_file(key)
+            with self._lock:
+                self._store(key, stamp, model)
+        finally:
+            with self._lock:
+                del self._loading[key]
+            loaded.set()
+        return model
+
+    def remove(self, filename):
+        '''
+        Drops the network stored in filename from the cache.
+        '''
+        with self._lock:
+            entry = self._entries.pop(os.path.abspath(filename), None)
+            if entry is not None:
+                self._bytes -= entry.size
+
+    def clear(self):
+        '''
+        Drops every network from the cache.
+        '''
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def close(self):
+        '''
+        Stops the background watcher, if any.
+        '''
+        self._closed.set()
+        if self._watcher is not None:
+            self._watcher.join()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _store(self, key, stamp, model):
+        '''
+        Caches model, evicting the least recently used networks to stay
+        within budget.  Must be called with the lock held.
+        '''
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old.size
+        entry = _Entry(stamp, model)
+        self._entries[key] = entry
+        self._bytes += entry.size
+        self._evict()
+
+    def _evict(self):
+        '''
+        Evicts the least recently used networks until the cache is within
+        budget.  Must be called with the lock held.
+        '''
+        while len(self._entries) > 1 and (
+                (self._max_entries is not None and
+                 len(self._entries) > self._max_entries) or
+                (self._max_bytes is not None and
+                 self._bytes > self._max_bytes)):
+            evicted = self._entries.popitem(last=False)[1]
+            self._bytes -= evicted.size
+
+    def _reload_in_background(self, key):
+        '''
+        Starts reloading key on its own thread, unless it already is.  Must
+        be called with the lock held.
+        '''
+        if key in self._reloading:
+            return
+        self._reloading.add(key)
+        reloader = threading.Thread(target=self._reload, args=(key,))
+        reloader.daemon = True
+        reloader.start()
+
+    def _reload(self, key):
+        stamp = None
+        try:
+            stamp = _stamp(key)
+            model = create_network_from_file(key)
+        except Exception:
+            model = None
+        with self._lock:
+            self._reloading.discard(key)
+            entry = self._entries.get(key)
+            if model is None and entry is not None:
+                # Do not try this version of the file again.
+                entry.failed_stamp = stamp
+            elif entry is not None:
+                # Swap in place so the least recently used order is kept.
+                new = _Entry(stamp, model)
+                self._bytes += new.size - entry.size
+                self._entries[key] = new
+                # The new version may be larger than the old one.
+                self._evict()
+
+    def _watch(self, poll_interval):
+        while not self._closed.wait(poll_interval):
+            with self._lock:
+                entries = list(self._entries.items())
+            for key, entry in entries:
+                try:
+                    changed = entry.outdated(_stamp(key))
+                except OSError:
+                    changed = False
+                if changed:
+                    with self._lock:
+                        if key in self._reloading:
+                            continue
+                        self._reloading.add(key)
+                    self._reload(key)
+
+class _Entry(object):
+    '''
+    A cached network with the modification stamp of its file and an
+    estimate of its size in bytes.  failed_stamp is the stamp of the last
+    version of the file that failed to load, if any.
+    '''
+
+    def __init__(self, stamp, model):
+        self.stamp = stamp
+        self.failed_stamp = None
+        self.model = model
+        # A connection costs a weight and a neuron pointer in libfann, a
+        # neuron about 48 bytes.
+        self.size = (12 * model.get_total_connections() +
+                     48 * model.get_total_neurons())
+
+    def outdated(self, stamp):
+        '''
+        Whether the file, now at stamp, should be loaded again.
+        '''
+        return stamp != self.stamp and stamp != self.failed_stamp
+
+def _stamp(filename):
+    '''
+    Returns what identifies a version of a file: its modification time and
+    size.
+    '''
+    stat = os.stat(filename)
+    return stat.st_mtime, stat.st_size
@@ -1,5 +1,33 @@
-import fann2.libfann
-from enums import net_type, activation_func
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import numpy as np
+try:
+    import scipy.sparse
+except ImportError:
+    scipy = None
+from .connection import connection_dtype
+from .enums import net_type, activation_func, error_func
+
+# Header of the binary network format: magic, format version, network type,
+# number of layers, number of non-input neurons and number of connections.
+# It is followed by little-endian arrays: the neurons and the bias neurons
+# of every layer, the activation function and steepness of every non-input
+# neuron, and the from neuron, to neuron and weight of every connection in
+# the order of get_connection_array.  The steepnesses and the weights are
+# 64 bit floats, as libfann keeps them, the other values 32 bit integers.
+# Version 4 files, written for networks with scaling parameters, end with
+# the input scale and shift and the output scale and shift as 32 bit
+# floats.  Versions 1 and 2 are versions 3 and 4 with 32 bit steepnesses
+# and weights, and are still read.
+_BINARY_MAGIC = b'FANNNETB'
+_BINARY_VERSION = 3
+_BINARY_SCALING_VERSION = 4
+_BINARY_SINGLE_VERSION = 1
+_BINARY_SINGLE_SCALING_VERSION = 2
+_BINARY_HEADER = struct.Struct('<8sIIIII')
 
 class NeuralNet(object):
     '''
@@ -7,13 +35,22 @@ class NeuralNet(object):
     '''
 
     # TODO need this?
-    def __init__(self):
+    def __init__(self, fann=None):
         '''
         Constructor
         
         Do not call this directly
         '''
-        self._fann = None
+        self._fann = fann
+        self._scaling = None
+        # The connections removed by prune, as a mask over the connections
+        # in the order of get_connection_array, and as the zero weight
+        # connections to write into libfann.
+        self._pruned = None
+        self._pruned_connections = None
+        # The fann the from and to neuron lists of set_weights were read
+        # from, and the lists.
+        self._connection_neurons = None
 
     def __del__(self):
         '''
@@ -55,9 +92,206 @@ class NeuralNet(object):
         outputs, the number of which being equal to the number of neurons
         in the output layer.
         '''
-        return self._fann.run(input_data)
+        if self._scaling is None:
+            return self._fann.run(input_data)
+        inputs = self._scaling.scale_input(
+            np.asarray(input_data, dtype=np.float32))
+        outputs = np.asarray(self._fann.run(inputs), dtype=np.float32)
+        return self._scaling.descale_output(outputs, outputs).tolist()
+
+    def run_batch(self, input_data, out=None):
+        '''
+        Will run every row of a 2-D array through the neural network,
+        returning an array of shape (n_samples, num_output).
+
+        input_data may be a NumPy array or any object supporting the buffer
+        protocol.  If out is given it must be a writable float32 array of
+        shape (n_samples, num_output); the outputs are written into it and
+        it is returned instead of a new array.
+
+        fann2 has no batch entry point, so every row is still one call of
+        libfann's run, and its inputs and outputs still go through Python
+        lists.  For evaluation of the whole batch at once, run it through
+        the ForwardEngine or the FrozenNeuralNet of a trained network.
+        '''
+        inputs = np.asarray(input_data, dtype=np.float32)
+        if inputs.ndim != 2 or inputs.shape[1] != self.get_num_input():
+            raise ValueError('input_data must have shape (n_samples, ' +
+                             str(self.get_num_input()) + ')')
+        shape = (inputs.shape[0], self.get_num_output())
+        if out is None:
+            out = np.empty(shape, dtype=np.float32)
+        elif out.shape != shape or out.dtype != np.float32:
+            raise ValueError('out must be a float32 array of shape ' +
+                             str(shape))
+        if self._scaling is not None:
+            inputs = self._scaling.scale_input(inputs)
+        run = self._fann.run
+        for i, row in enumerate(inputs):
+            out[i] = run(row)
+        if self._scaling is not None:
+            self._scaling.descale_output(out, out)
+        return out
 
-    def save(self, filename):
+    def set_scaling_params(self, train_data, new_input_min=-1.0,
+                           new_input_max=1.0, new_output_min=-1.0,
+                           new_output_max=1.0):
+        '''
+        Calculate input and output scaling parameters for future use based
+        on training data.
+
+        As in libfann, every input and output is standardized with the mean
+        and the standard deviation it has in train_data, then mapped from
+        [-1, 1] to [new_min, new_max].  The parameters are computed in one
+        vectorized pass over the training data arrays and kept with the
+        network, which from then on scales its inputs and descales its
+        outputs inside run and run_batch, and is trained by Trainer on
+        scaled copies of the training data.  Callers keep using unscaled
+        values throughout.
+
+        The parameters are saved by save(filename, binary=True) but not in
+        the configuration file.
+        '''
+        inputs, outputs = train_data._get_arrays()
+        self._scaling = _Scaling(
+            _scaling_params(inputs, new_input_min, new_input_max),
+            _scaling_params(outputs, new_output_min, new_output_max))
+
+    def set_input_scaling_params(self, train_data, new_input_min=-1.0,
+                                 new_input_max=1.0):
+        '''
+        Calculate input scaling parameters for future use based on training
+        data.  The outputs are left as they are.
+
+        More info available in set_scaling_params
+        '''
+        outputs = None
+        if self._scaling is not None:
+            outputs = self._scaling.output_params
+        self._scaling = _Scaling(
+            _scaling_params(train_data._get_arrays()[0], new_input_min,
+                            new_input_max), outputs)
+
+    def set_output_scaling_params(self, train_data, new_output_min=-1.0,
+                                  new_output_max=1.0):
+        '''
+        Calculate output scaling parameters for future use based on
+        training data.  The inputs are left as they are.
+
+        More info available in set_scaling_params
+        '''
+        inputs = None
+        if self._scaling is not None:
+            inputs = self._scaling.input_params
+        self._scaling = _Scaling(
+            inputs, _scaling_params(train_data._get_arrays()[1],
+                                    new_output_min, new_output_max))
+
+    def clear_scaling_params(self):
+        '''
+        Clears scaling parameters.
+        '''
+        self._scaling = None
+
+    def freeze(self):
+        '''
+        Return a FrozenNeuralNet, a read-only inference handle for this
+        network that threads can share instead of each using a copy.
+        '''
+        return FrozenNeuralNet(self)
+
+    def to_fixed(self, decimal_point=None):
+        '''
+        Return a FixedNeuralNet, a fixed point version of this network that
+        runs on integers only.
+
+        @param decimal_point: The number of bits after the fix point.  By
+            default it is chosen as save_to_fixed does.
+        '''
+        return FixedNeuralNet(self, decimal_point)
+
+    def to_sparse(self):
+        '''
+        Return a SparseNeuralNet, an inference handle for this network that
+        stores only its connections with non-zero weights, as after prune.
+        '''
+        return SparseNeuralNet(self)
+
+    def prune(self, threshold=None, sparsity=None):
+        '''
+        Remove the connections with the smallest weight magnitudes.
+
+        Either every connection whose weight is smaller than threshold in
+        magnitude is removed, or the smallest connections are removed until
+        a fraction sparsity of them is.  Bias connections are never
+        removed, and connections removed before stay removed.
+
+        libfann cannot take a connection out of a network, so a removed
+        connection is kept with a zero weight, which Trainer holds at zero
+        when the network is trained further.  to_sparse returns a network
+        that leaves them out.  Which connections were removed is not saved
+        with the network, but their zero weights are.
+
+        @return: The number of connections removed in all.
+        '''
+        if (threshold is None) == (sparsity is None):
+            raise ValueError('give either threshold or sparsity')
+        if sparsity is not None and not 0.0 <= sparsity <= 1.0:
+            raise ValueError('sparsity must be between 0 and 1')
+        (_, layers, biases, from_neuron, to_neuron, weights, _,
+         _) = _read_topology(self._fann)
+        prunable = ~_bias_connections(layers, biases, from_neuron)
+        pruned = np.zeros(len(weights), dtype=bool)
+        if self._pruned is not None:
+            pruned |= self._pruned
+        magnitude = np.abs(weights)
+        if threshold is not None:
+            pruned |= prunable & (magnitude < threshold)
+        else:
+            more = int(round(sparsity * prunable.sum())) - pruned.sum()
+            if more > 0:
+                candidates = np.nonzero(prunable & ~pruned)[0]
+                order = np.argsort(magnitude[candidates], kind='stable')
+                pruned[candidates[order[:more]]] = True
+        ks = np.nonzero(pruned)[0]
+        if len(ks) == 0:
+            self.clear_pruning()
+            return 0
+        self._pruned = pruned
+        self._pruned_connections = list(zip(
+            from_neuron[ks].tolist(), to_neuron[ks].tolist(),
+            [0.0] * len(ks)))
+        self._apply_pruning()
+        return len(ks)
+
+    def get_sparsity(self):
+        '''
+        Returns the fraction of the connections, bias connections excluded,
+        that prune removed.
+        '''
+        if self._pruned is None:
+            return 0.0
+        (_, layers, biases, from_neuron, _, _, _,
+         _) = _read_topology(self._fann)
+        prunable = ~_bias_connections(layers, biases, from_neuron)
+        return float(self._pruned.sum()) / max(prunable.sum(), 1)
+
+    def clear_pruning(self):
+        '''
+        Forget which connections prune removed.  Their weights stay zero
+        until the network is trained again.
+        '''
+        self._pruned = None
+        self._pruned_connections = None
+
+    def _apply_pruning(self):
+        '''
+        Set the weights of the removed connections back to zero.
+        '''
+        if self._pruned_connections is not None:
+            self._fann.set_weight_array(self._pruned_connections)
+
+    def save(self, filename, binary=False):
         '''
         Save the entire network to a configuration file.
 
@@ -70,17 +304,72 @@ class NeuralNet(object):
         to the file because they cannot safely be ported to a different
         location.  Also temporary parameters generated during training
         like get_MSE is not saved.
+
+        If binary is true, a compact binary file is written instead, to be
+        read by create_network_from_binary_file or
+        create_engine_from_binary_file.  It holds the topology, the
+        activation function and steepness of every neuron and the raw
+        weights, but none of the training parameters, and loads much faster
+        than the configuration file.
         '''
-        # TODO
+        if binary:
+            _save_binary(self._fann, filename, self._scaling)
+            return
+        if not self._fann.save(filename):
+            raise IOError("Failed to save.")
+
+    def save_to_fixed(self, filename):
+        '''
+        Saves the entire network to a configuration file.  But it is saved
+        in fixed point format no matter which format it is currently in.
+
+        This is useful for training a network in floating points, and then
+        later executing it in fixed point.
+
+        The function returns the bit position of the fix point, which can be
+        used to find out how accurate the fixed point network will be.  A
+        high value indicates high precision, and a low value indicates low
+        precision.
+
+        A negative value indicates very low precision, and a very strong
+        possibility for overflow.  (the actual fix point will be set to 0,
+        since a negative fix point does not make sense).
+
+        Generally, a fix point lower than 6 is bad, and should be avoided.
+        The best way to avoid this, is to have less connections to each
+        neuron, or just less neurons in each layer.
+
+        The fixed point use of this network is only intended for use on
+        machines that have no floating point processor, like an iPAQ.  On
+        normal computers the floating point version is actually faster.
+        '''
+        decimal_point = self._fann.save_to_fixed(filename)
+        if decimal_point is None or decimal_point < 0:
+            raise IOError("Failed to save.")
+        return decimal_point
 
     def copy(self):
         '''
-        Creates a copy of a fann structure.
+        Creates a copy of the network, with its training parameters.
 
-        Data in the user data fann_set_user_data is not copied,
-        but the user data pointer is copied.
+        fann2 does not wrap fann_copy, so the network is saved to a
+        configuration file in a temporary directory and created again from
+        it.
         '''
-        return NeuralNet(self._fann.copy())
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'copy.net')
+            self.save(filename)
+            fann = _libfann().neural_net()
+            if not fann.create_from_file(filename):
+                raise IOError("Failed to copy.")
+        finally:
+            shutil.rmtree(directory)
+        copy = NeuralNet(fann)
+        copy._scaling = self._scaling
+        copy._pruned = self._pruned
+        copy._pruned_connections = self._pruned_connections
+        return copy
 
     def get_num_input(self):
         '''
@@ -109,6 +398,67 @@ class NeuralNet(object):
         '''
         return self._fann.get_total_connections()
 
+    def get_weights(self, structured=False):
+        '''
+        Get the weights of all the connections in one call, in the order of
+        libfann's connection array.
+
+        By default the weights are returned as a flat float64 array, the
+        type libfann keeps them in, so set_weights(get_weights()) changes
+        nothing.  With
+        structured, an array of connection_dtype is returned instead, with
+        the from_neuron, to_neuron and weight of every connection.  Its
+        fields are views, so get_weights(True)['weight'] is the flat
+        weights without a copy.
+
+        fann2 gives no access to the memory libfann keeps the weights in,
+        so they are copied out with one bulk call rather than viewed.
+        '''
+        from_neuron, to_neuron, weights = _read_connections(self._fann)
+        if not structured:
+            return weights
+        connections = np.empty(len(weights), dtype=connection_dtype)
+        connections['from_neuron'] = from_neuron
+        connections['to_neuron'] = to_neuron
+        connections['weight'] = weights
+        return connections
+
+    def set_weights(self, weights):
+        '''
+        Set the weights of connections in one call.
+
+        weights is either a flat array with the weights of all the
+        connections, in the order of get_weights, or an array of
+        connection_dtype as returned by get_weights(structured=True), in
+        which case only the connections it holds are set.  Connections
+        removed by prune keep a zero weight.
+        '''
+        weights = np.asarray(weights)
+        if weights.dtype.names is not None:
+            from_neuron = weights['from_neuron'].tolist()
+            to_neuron = weights['to_neuron'].tolist()
+            weights = weights['weight']
+        else:
+            from_neuron, to_neuron = self._get_connection_neurons()
+            if weights.shape != (len(from_neuron),):
+                raise ValueError('expected ' + str(len(from_neuron)) +
+                                 ' weights')
+        self._fann.set_weight_array(list(zip(
+            from_neuron, to_neuron, weights.astype(np.float64).tolist())))
+        self._apply_pruning()
+
+    def _get_connection_neurons(self):
+        '''
+        Returns the from and to neurons of every connection as lists, read
+        once per fann.
+        '''
+        cached = self._connection_neurons
+        if cached is None or cached[0] is not self._fann:
+            from_neuron, to_neuron, _ = _read_connections(self._fann)
+            cached = self._connection_neurons = (
+                self._fann, from_neuron.tolist(), to_neuron.tolist())
+        return cached[1:]
+
     def get_network_type(self):
         '''
         Get the type of neural network it was created as.
@@ -205,7 +555,7 @@ def create_standard_network(nums_neurons):
     '''
     Creates a standard fully connected backpropagation neural network.
     '''
-    fann = fann2.libfann.neural_net()
+    fann = _libfann().neural_net()
     fann.create_standard_array(nums_neurons)
     return NeuralNet(fann)
 
@@ -214,7 +564,7 @@ def create_sparse_network(connection_rate, nums_neurons):
     Creates a standard backpropagation neural network,
     which is not fully connected.
     '''
-    fann = fann2.libfann.neural_net()
+    fann = _libfann().neural_net()
     fann.create_sparse_array(connection_rate, nums_neurons)
     nn = NeuralNet()
     nn._fann = fann
@@ -230,8 +580,8 @@ def create_shortcut_network(nums_neurons):
     where all neurons are connected to all neurons in later layers.
     Including direct connections from the input layer to the output layer.
     '''
-    fann = fann2.libfann.neural_net()
-    fann.create_standard_array(nums_neurons)
+    fann = _libfann().neural_net()
+    fann.create_shortcut_array(nums_neurons)
     nn = NeuralNet()
     nn._fann = fann
     return nn
@@ -241,8 +591,1165 @@ def create_network_from_file(filename):
     Constructs a backpropagation neural network from a configuration file,
     which have been saved.
     '''
-    fann = fann2.libfann.neural_net()
-    fann.create_from_file(filename)
+    fann = _libfann().neural_net()
+    if not fann.create_from_file(filename):
+        raise IOError('failed to read a network from ' + filename)
     nn = NeuralNet()
     nn._fann = fann
     return nn
+
+def create_network_from_binary_file(filename):
+    '''
+    Constructs a backpropagation neural network from a binary file saved
+    with NeuralNet.save(filename, binary=True).
+
+    The file is memory-mapped, so no text is parsed.  The weights and the
+    activation functions round-trip exactly.  A sparse network is created
+    fully connected, with zero weights on the connections it did not have.
+    '''
+    topology, scaling = _read_binary(filename)
+    (network_type, layers, biases, from_neuron, to_neuron, weights, funcs,
+     steepnesses) = topology
+    fann = _libfann().neural_net()
+    if network_type == net_type.SHORTCUT:
+        fann.create_shortcut_array(layers)
+    else:
+        fann.create_standard_array(layers)
+    fann.randomize_weights(0.0, 0.0)
+    neuron_index = 0
+    for layer in range(1, len(layers)):
+        for neuron in range(layers[layer]):
+            fann.set_activation_function(funcs[neuron_index], layer, neuron)
+            fann.set_activation_steepness(float(steepnesses[neuron_index]),
+                                          layer, neuron)
+            neuron_index += 1
+    fann.set_weight_array(list(zip(from_neuron.tolist(), to_neuron.tolist(),
+                                   weights.tolist())))
+    neural_net = NeuralNet(fann)
+    neural_net._scaling = scaling
+    return neural_net
+
+def create_engine_from_binary_file(filename):
+    '''
+    Constructs a ForwardEngine from a binary file saved with
+    NeuralNet.save(filename, binary=True), without going through libfann.
+    '''
+    topology, scaling = _read_binary(filename)
+    engine = ForwardEngine.__new__(ForwardEngine)
+    engine._build(*topology[1:])
+    engine._scaling = scaling
+    return engine
+
+def _libfann():
+    '''
+    Returns the fann2.libfann extension, imported the first time a libfann
+    network or training data is made, so that ForwardEngine,
+    create_engine_from_binary_file and pyfann.bench import without it.
+    '''
+    import fann2.libfann
+    return fann2.libfann
+
+def _read_topology(fann):
+    '''
+    Returns the network type, the neurons and bias neurons of every layer,
+    the from neuron, to neuron and weight arrays of the connections and the
+    activation function and steepness of every non-input neuron of fann.
+    '''
+    layers = fann.get_layer_array()
+    funcs = []
+    steepnesses = []
+    for layer in range(1, len(layers)):
+        for neuron in range(layers[layer]):
+            funcs.append(fann.get_activation_function(layer, neuron))
+            steepnesses.append(fann.get_activation_steepness(layer, neuron))
+    from_neuron, to_neuron, weights = _read_connections(fann)
+    return (net_type(fann.get_network_type()), layers,
+            fann.get_bias_array(), from_neuron, to_neuron, weights, funcs,
+            np.asarray(steepnesses, dtype=np.float64))
+
+def _read_connections(fann):
+    '''
+    Returns the from neuron, to neuron and weight arrays of the connections
+    of fann, read with one call.
+    '''
+    connections = np.asarray(fann.get_connection_array(),
+                             dtype=np.float64).reshape(-1, 3)
+    return (connections[:, 0].astype(np.intp),
+            connections[:, 1].astype(np.intp),
+            np.ascontiguousarray(connections[:, 2]))
+
+def _bias_connections(layers, biases, from_neuron):
+    '''
+    A mask of the connections coming from bias neurons.
+    '''
+    is_bias = np.zeros(sum(layers) + sum(biases), dtype=bool)
+    index = 0
+    for num, num_bias in zip(layers, biases):
+        is_bias[index + num:index + num + num_bias] = True
+        index += num + num_bias
+    return is_bias[np.asarray(from_neuron, dtype=np.intp)]
+
+def _save_binary(fann, filename, scaling=None):
+    (network_type, layers, biases, from_neuron, to_neuron, weights, funcs,
+     steepnesses) = _read_topology(fann)
+    arrays = [(layers, '<u4'), (biases, '<u4'), (funcs, '<u4'),
+              (steepnesses, '<f8'), (from_neuron, '<u4'), (to_neuron, '<u4'),
+              (weights, '<f8')]
+    version = _BINARY_VERSION
+    if scaling is not None:
+        version = _BINARY_SCALING_VERSION
+        arrays.extend((array, '<f4') for array in
+                      scaling.input_params + scaling.output_params)
+    with open(filename, 'wb') as f:
+        f.write(_BINARY_HEADER.pack(_BINARY_MAGIC, version,
+                                    network_type.value, len(layers),
+                                    len(funcs), len(weights)))
+        for array, dtype in arrays:
+            np.asarray(array, dtype=dtype).tofile(f)
+
+def _read_binary(filename):
+    '''
+    Memory-maps a binary network file, returning what _read_topology does
+    and the scaling parameters, or None.
+    '''
+    data = np.memmap(filename, dtype=np.uint8, mode='r')
+    if len(data) < _BINARY_HEADER.size:
+        raise IOError(filename + ' is not a binary network file')
+    (magic, version, network_type, num_layers, num_neurons,
+     num_connections) = _BINARY_HEADER.unpack(
+         data[:_BINARY_HEADER.size].tobytes())
+    if magic != _BINARY_MAGIC:
+        raise IOError(filename + ' is not a binary network file')
+    if version not in (_BINARY_VERSION, _BINARY_SCALING_VERSION,
+                       _BINARY_SINGLE_VERSION, _BINARY_SINGLE_SCALING_VERSION):
+        raise IOError('unsupported binary network version ' + str(version))
+    real = '<f8'
+    if version in (_BINARY_SINGLE_VERSION, _BINARY_SINGLE_SCALING_VERSION):
+        real = '<f4'
+    counts = [(num_layers, '<u4'), (num_layers, '<u4'), (num_neurons, '<u4'),
+              (num_neurons, real), (num_connections, '<u4'),
+              (num_connections, '<u4'), (num_connections, real)]
+    if len(data) < _BINARY_HEADER.size + sum(
+            c * np.dtype(dtype).itemsize for c, dtype in counts):
+        raise IOError(filename + ' is truncated')
+    arrays = []
+    offset = _BINARY_HEADER.size
+    for count, dtype in counts:
+        arrays.append(np.frombuffer(data, dtype=dtype, count=count,
+                                    offset=offset))
+        offset += np.dtype(dtype).itemsize * count
+    layers, biases, funcs, steepnesses, from_neuron, to_neuron, weights = \
+        arrays
+    scaling = None
+    if version in (_BINARY_SCALING_VERSION, _BINARY_SINGLE_SCALING_VERSION):
+        num_input, num_output = int(layers[0]), int(layers[-1])
+        counts = [num_input, num_input, num_output, num_output]
+        if len(data) < offset + 4 * sum(counts):
+            raise IOError(filename + ' is truncated')
+        params = []
+        for count in counts:
+            params.append(np.array(np.frombuffer(
+                data, dtype='<f4', count=count, offset=offset),
+                                   dtype=np.float32))
+            offset += 4 * count
+        scaling = _Scaling(tuple(params[:2]), tuple(params[2:]))
+    return (net_type(network_type), layers.tolist(), biases.tolist(),
+            from_neuron, to_neuron, weights, funcs.tolist(),
+            steepnesses), scaling
+
+class _Scaling(object):
+    '''
+    The scaling parameters of a network, as (scale, shift) pairs of arrays
+    for the inputs and the outputs: the network sees value * scale + shift.
+    '''
+
+    def __init__(self, input_params, output_params):
+        self.input_params = input_params
+        self.output_params = output_params
+
+    def scale_input(self, inputs, out=None):
+        '''
+        Scale inputs, into out if given.
+        '''
+        if self.input_params is None:
+            if out is None:
+                return inputs
+            out[...] = inputs
+            return out
+        scale, shift = self.input_params
+        out = np.multiply(inputs, scale, out=out)
+        out += shift
+        return out
+
+    def scale_output(self, outputs):
+        '''
+        Scale desired outputs into a new array, for training.
+        '''
+        if self.output_params is None:
+            return outputs
+        scale, shift = self.output_params
+        return outputs * scale + shift
+
+    def descale_output(self, outputs, out=None):
+        '''
+        Undo the scaling of the outputs of the network, into out if given.
+        '''
+        if self.output_params is None:
+            if out is None:
+                return outputs
+            out[...] = outputs
+            return out
+        scale, shift = self.output_params
+        out = np.subtract(outputs, shift, out=out)
+        out /= scale
+        return out
+
+def _scaling_params(data, new_min, new_max):
+    '''
+    The (scale, shift) pair mapping every column of data the way
+    fann_set_scaling_params does: (value - mean) / deviation, taken from
+    [-1, 1] to [new_min, new_max].
+    '''
+    data = np.asarray(data, dtype=np.float64)
+    mean = data.mean(axis=0) if len(data) else np.zeros(data.shape[1])
+    deviation = data.std(axis=0) if len(data) else np.ones(data.shape[1])
+    deviation[deviation == 0.0] = 1.0
+    factor = (new_max - new_min) / 2.0
+    scale = factor / deviation
+    shift = factor - mean * scale + new_min
+    return scale.astype(np.float32), shift.astype(np.float32)
+
+# Breakpoints of the stepwise sigmoid approximations libfann uses for
+# SIGMOID_STEPWISE and SIGMOID_SYMMETRIC_STEPWISE in floating point mode.
+_STEPWISE_SUMS = [-2.64665246009826660156e+00, -1.47221946716308593750e+00,
+                  -5.49306154251098632812e-01, 5.49306154251098632812e-01,
+                  1.47221934795379638672e+00, 2.64665293693542480469e+00]
+_SIGMOID_STEPWISE_VALUES = [
+    4.99999988824129104614e-03, 5.00000007450580596924e-02,
+    2.50000000000000000000e-01, 7.50000000000000000000e-01,
+    9.49999988079071044922e-01, 9.95000004768371582031e-01]
+_SIGMOID_SYMMETRIC_STEPWISE_VALUES = [
+    -9.90000009536743164062e-01, -8.99999976158142089844e-01,
+    -5.00000000000000000000e-01, 5.00000000000000000000e-01,
+    8.99999976158142089844e-01, 9.90000009536743164062e-01]
+
+def _linear(x):
+    return x
+
+def _threshold(x):
+    return np.where(x < 0, 0.0, 1.0)
+
+def _threshold_symmetric(x):
+    return np.where(x < 0, -1.0, 1.0)
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-2.0 * x))
+
+def _sigmoid_stepwise(x):
+    return np.interp(x, _STEPWISE_SUMS, _SIGMOID_STEPWISE_VALUES,
+                     left=0.0, right=1.0)
+
+def _sigmoid_symmetric(x):
+    return 2.0 / (1.0 + np.exp(-2.0 * x)) - 1.0
+
+def _sigmoid_symmetric_stepwise(x):
+    return np.interp(x, _STEPWISE_SUMS, _SIGMOID_SYMMETRIC_STEPWISE_VALUES,
+                     left=-1.0, right=1.0)
+
+def _gaussian(x):
+    return np.exp(-x * x)
+
+def _gaussian_symmetric(x):
+    return np.exp(-x * x) * 2.0 - 1.0
+
+def _gaussian_stepwise(x):
+    # libfann has no implementation of this one and always yields zero.
+    return np.zeros_like(x)
+
+def _elliot(x):
+    return x * 0.5 / (1.0 + np.abs(x)) + 0.5
+
+def _elliot_symmetric(x):
+    return x / (1.0 + np.abs(x))
+
+def _linear_piece(x):
+    return np.clip(x, 0.0, 1.0)
+
+def _linear_piece_symmetric(x):
+    return np.clip(x, -1.0, 1.0)
+
+def _sin(x):
+    return np.sin(x) * 0.5 + 0.5
+
+def _cos(x):
+    return np.cos(x) * 0.5 + 0.5
+
+_activation_funcs = {
+    activation_func.LINEAR: _linear,
+    activation_func.THRESHOLD: _threshold,
+    activation_func.THRESHOLD_SYMMETRIC: _threshold_symmetric,
+    activation_func.SIGMOID: _sigmoid,
+    activation_func.SIGMOID_STEPWISE: _sigmoid_stepwise,
+    activation_func.SIGMOID_SYMMETRIC: _sigmoid_symmetric,
+    activation_func.SIGMOID_SYMMETRIC_STEPWISE: _sigmoid_symmetric_stepwise,
+    activation_func.GAUSSIAN: _gaussian,
+    activation_func.GAUSSIAN_SYMMETRIC: _gaussian_symmetric,
+    activation_func.GAUSSIAN_STEPWISE: _gaussian_stepwise,
+    activation_func.ELLIOT: _elliot,
+    activation_func.ELLIOT_SYMMETRIC: _elliot_symmetric,
+    activation_func.LINEAR_PIECE: _linear_piece,
+    activation_func.LINEAR_PIECE_SYMMETRIC: _linear_piece_symmetric,
+    activation_func.SIN_SYMMETRIC: np.sin,
+    activation_func.COS_SYMMETRIC: np.cos,
+    activation_func.SIN: _sin,
+    activation_func.COS: _cos,
+}
+
+# Derivatives of the activation functions as libfann computes them during
+# training, from the steepness, the value and the steepness-scaled sum.
+def _linear_derive(steepness, value, neuron_sum):
+    return steepness
+
+def _sigmoid_derive(steepness, value, neuron_sum):
+    value = np.clip(value, 0.01, 0.99)
+    return 2.0 * steepness * value * (1.0 - value)
+
+def _sigmoid_symmetric_derive(steepness, value, neuron_sum):
+    value = np.clip(value, -0.98, 0.98)
+    return steepness * (1.0 - value * value)
+
+def _gaussian_derive(steepness, value, neuron_sum):
+    return -2.0 * neuron_sum * value * steepness * steepness
+
+def _gaussian_symmetric_derive(steepness, value, neuron_sum):
+    return -2.0 * neuron_sum * (value + 1.0) * steepness * steepness
+
+def _gaussian_stepwise_derive(steepness, value, neuron_sum):
+    return np.zeros_like(value)
+
+def _elliot_derive(steepness, value, neuron_sum):
+    return steepness / (2.0 * (1.0 + np.abs(neuron_sum)) ** 2)
+
+def _elliot_symmetric_derive(steepness, value, neuron_sum):
+    return steepness / (1.0 + np.abs(neuron_sum)) ** 2
+
+def _sin_symmetric_derive(steepness, value, neuron_sum):
+    return steepness * np.cos(steepness * neuron_sum)
+
+def _cos_symmetric_derive(steepness, value, neuron_sum):
+    return -steepness * np.sin(steepness * neuron_sum)
+
+def _sin_derive(steepness, value, neuron_sum):
+    return steepness * np.cos(steepness * neuron_sum) * 0.5
+
+def _cos_derive(steepness, value, neuron_sum):
+    return -steepness * np.sin(steepness * neuron_sum) * 0.5
+
+_activation_derivs = {
+    activation_func.LINEAR: _linear_derive,
+    activation_func.LINEAR_PIECE: _linear_derive,
+    activation_func.LINEAR_PIECE_SYMMETRIC: _linear_derive,
+    activation_func.SIGMOID: _sigmoid_derive,
+    activation_func.SIGMOID_STEPWISE: _sigmoid_derive,
+    activation_func.SIGMOID_SYMMETRIC: _sigmoid_symmetric_derive,
+    activation_func.SIGMOID_SYMMETRIC_STEPWISE: _sigmoid_symmetric_derive,
+    activation_func.GAUSSIAN: _gaussian_derive,
+    activation_func.GAUSSIAN_SYMMETRIC: _gaussian_symmetric_derive,
+    activation_func.GAUSSIAN_STEPWISE: _gaussian_stepwise_derive,
+    activation_func.ELLIOT: _elliot_derive,
+    activation_func.ELLIOT_SYMMETRIC: _elliot_symmetric_derive,
+    activation_func.SIN_SYMMETRIC: _sin_symmetric_derive,
+    activation_func.COS_SYMMETRIC: _cos_symmetric_derive,
+    activation_func.SIN: _sin_derive,
+    activation_func.COS: _cos_derive,
+}
+
+_symmetric_funcs = frozenset([
+    activation_func.THRESHOLD_SYMMETRIC,
+    activation_func.SIGMOID_SYMMETRIC,
+    activation_func.SIGMOID_SYMMETRIC_STEPWISE,
+    activation_func.GAUSSIAN_SYMMETRIC,
+    activation_func.ELLIOT_SYMMETRIC,
+    activation_func.LINEAR_PIECE_SYMMETRIC,
+    activation_func.SIN_SYMMETRIC,
+    activation_func.COS_SYMMETRIC,
+])
+
+class ForwardEngine(object):
+    '''
+    A NumPy snapshot of a neural network that runs the forward pass as one
+    matrix multiply per layer.
+
+    The connections of the network are turned into a dense weight matrix
+    and a bias vector for every layer when the engine is created.  Each
+    layer reads the values of all the earlier layers it has connections
+    from, so networks with shortcut connections are handled as well as
+    standard and sparse ones (missing connections are zero weights).
+
+    The activation functions and steepnesses are taken per neuron, and the
+    sums are clipped the same way libfann does it, so the outputs match
+    NeuralNet.run up to floating point rounding.
+
+    The engine only holds NumPy arrays and does not call into libfann after
+    it has been created.  Changes made to the neural network afterwards are
+    not seen by the engine.
+    '''
+
+    def __init__(self, neural_net):
+        '''
+        Constructor
+
+        Reads the topology, the weights and the activation functions of
+        neural_net, and its scaling parameters.
+        '''
+        self._build(*_read_topology(neural_net._fann)[1:])
+        self._scaling = neural_net._scaling
+
+    def _build(self, layers, biases, from_neuron, to_neuron, weights, funcs,
+               steepnesses):
+        '''
+        Lay out the dense per layer matrices.
+
+        layers and biases hold the number of neurons and bias neurons of
+        every layer, as in get_layer_array and get_bias_array.
+        from_neuron, to_neuron and weights describe every connection, in the
+        order of get_connection_array.  funcs and steepnesses hold the
+        activation function and steepness of every non-input neuron in
+        order.
+        '''
+        self._scaling = None
+        # libfann numbers the neurons layer by layer, each layer followed
+        # by its bias neurons.  The engine keeps the values of the real
+        # neurons only, in the same order, and folds the bias neurons into
+        # bias vectors.
+        total = sum(layers) + sum(biases)
+        column = np.full(total, -1, dtype=np.intp)
+        layer_of = np.full(total, -1, dtype=np.intp)
+        index = 0
+        col = 0
+        for layer, (num, num_bias) in enumerate(zip(layers, biases)):
+            column[index:index + num] = np.arange(col, col + num)
+            layer_of[index:index + num] = layer
+            index += num + num_bias
+            col += num
+
+        self._from_neuron = np.asarray(from_neuron, dtype=np.intp)
+        self._to_neuron = np.asarray(to_neuron, dtype=np.intp)
+        from_col = column[self._from_neuron]
+        to_col = column[self._to_neuron]
+        to_layer = layer_of[self._to_neuron]
+        weights = np.asarray(weights, dtype=np.float32)
+        funcs = [activation_func(f) for f in funcs]
+        steepnesses = np.asarray(steepnesses, dtype=np.float32)
+
+        self._num_input = layers[0]
+        self._num_output = layers[-1]
+        self._num_neurons = col
+        self._num_connections = len(weights)
+        self._layers = []
+        start = layers[0]
+        for layer in range(1, len(layers)):
+            end = start + layers[layer]
+            ks = np.nonzero(to_layer == layer)[0]
+            bias_ks = ks[from_col[ks] < 0]
+            weight_ks = ks[from_col[ks] >= 0]
+            lo = from_col[weight_ks].min() if len(weight_ks) else start
+            rows = from_col[weight_ks] - lo
+            cols = to_col[weight_ks] - start
+            bias_cols = to_col[bias_ks] - start
+            matrix = np.zeros((start - lo, end - start), dtype=np.float32)
+            matrix[rows, cols] = weights[weight_ks]
+            bias = np.zeros(end - start, dtype=np.float32)
+            bias[bias_cols] = weights[bias_ks]
+            layer_funcs = funcs[start - layers[0]:end - layers[0]]
+            steepness = steepnesses[start - layers[0]:end - layers[0]]
+            self._layers.append(_EngineLayer(
+                lo, start, end, matrix, bias, _group_neurons(layer_funcs),
+                steepness, (weight_ks, rows, cols), (bias_ks, bias_cols)))
+            start = end
+
+    def get_num_input(self):
+        '''
+        Get the number of input neurons.
+        '''
+        return self._num_input
+
+    def get_num_output(self):
+        '''
+        Get the number of output neurons.
+        '''
+        return self._num_output
+
+    def get_model_bytes(self):
+        '''
+        Returns the number of bytes taken by the weights, biases and
+        steepnesses of the engine.
+        '''
+        return sum((layer.weights.nbytes if layer.sparse is None
+                    else layer.sparse.nbytes) +
+                   layer.bias.nbytes + layer.steepness.nbytes
+                   for layer in self._layers)
+
+    def get_layer_weights(self):
+        '''
+        Return a list with a (weights, bias) pair for every layer after the
+        input layer.
+
+        weights has one row per neuron the layer gets input from, starting
+        at the first such neuron and counting the neurons of the earlier
+        layers (bias neurons excluded) in order, and one column per neuron
+        of the layer.
+        '''
+        return [(layer.weights, layer.bias) for layer in self._layers]
+
+    def get_weights(self):
+        '''
+        Return the weights of all the connections as a flat array, in the
+        order of NeuralNet.get_connection_array.
+        '''
+        weights = np.empty(self._num_connections, dtype=np.float32)
+        for layer in self._layers:
+            ks, rows, cols = layer.weight_index
+            weights[ks] = layer.weights[rows, cols]
+            ks, cols = layer.bias_index
+            weights[ks] = layer.bias[cols]
+        return weights
+
+    def set_weights(self, weights):
+        '''
+        Set the weights of all the connections from a flat array, in the
+        order of get_weights.
+        '''
+        weights = np.asarray(weights, dtype=np.float32)
+        if weights.shape != (self._num_connections,):
+            raise ValueError('expected ' + str(self._num_connections) +
+                             ' weights')
+        for layer in self._layers:
+            ks, rows, cols = layer.weight_index
+            layer.weights[rows, cols] = weights[ks]
+            ks, cols = layer.bias_index
+            layer.bias[cols] = weights[ks]
+
+    def run(self, input_data):
+        '''
+        Will run input through the engine, returning a list of outputs.
+        '''
+        return self.run_batch([input_data])[0].tolist()
+
+    def run_batch(self, input_data, out=None):
+        '''
+        Will run every row of a 2-D array through the engine, returning an
+        array of shape (n_samples, num_output).
+
+        out behaves as in NeuralNet.run_batch.
+        '''
+        return self._run_batch(input_data, out)
+
+    def _run_batch(self, input_data, out, scratch=None):
+        '''
+        run_batch, taking the buffer for the neuron values from
+        scratch(n_samples) when given.
+        '''
+        inputs = np.asarray(input_data, dtype=np.float32)
+        if inputs.ndim != 2 or inputs.shape[1] != self._num_input:
+            raise ValueError('input_data must have shape (n_samples, ' +
+                             str(self._num_input) + ')')
+        shape = (inputs.shape[0], self._num_output)
+        if out is None:
+            out = np.empty(shape, dtype=np.float32)
+        elif out.shape != shape or out.dtype != np.float32:
+            raise ValueError('out must be a float32 array of shape ' +
+                             str(shape))
+        if scratch is None:
+            values = np.empty((inputs.shape[0], self._num_neurons),
+                              dtype=np.float32)
+        else:
+            values = scratch(inputs.shape[0])
+        if self._scaling is not None:
+            inputs = self._scaling.scale_input(
+                inputs, values[:, :self._num_input])
+        self._forward(inputs, values)
+        out[...] = values[:, self._num_neurons - self._num_output:]
+        if self._scaling is not None:
+            self._scaling.descale_output(out, out)
+        return out
+
+    def _forward(self, inputs, values, sums=None):
+        '''
+        Run the forward pass, writing the value of every neuron into the
+        columns of values.  If sums is given, the steepness-scaled sums
+        are stored in it too.
+        '''
+        values[:, :self._num_input] = inputs
+        for layer in self._layers:
+            if layer.sparse is None:
+                neuron_sums = np.dot(values[:, layer.lo:layer.start],
+                                     layer.weights)
+            else:
+                neuron_sums = layer.sparse.dot(
+                    values[:, layer.lo:layer.start])
+            neuron_sums += layer.bias
+            neuron_sums *= layer.steepness
+            np.clip(neuron_sums, -layer.max_sum, layer.max_sum,
+                    out=neuron_sums)
+            if sums is not None:
+                sums[:, layer.start:layer.end] = neuron_sums
+            block = values[:, layer.start:layer.end]
+            for func, neurons in layer.groups:
+                if neurons is None:
+                    block[...] = _activation_funcs[func](neuron_sums)
+                else:
+                    block[:, neurons] = _activation_funcs[func](
+                        neuron_sums[:, neurons])
+
+    def _freeze(self):
+        '''
+        Make the weights, biases and steepnesses read-only.
+        '''
+        for layer in self._layers:
+            for array in (layer.weights, layer.bias, layer.steepness,
+                          layer.max_sum):
+                array.flags.writeable = False
+
+    def _check_trainable(self):
+        '''
+        Raise ValueError if a neuron uses an activation function that
+        cannot be trained.
+        '''
+        for layer in self._layers:
+            for func, neurons in layer.groups:
+                if func not in _activation_derivs:
+                    raise ValueError('cannot train activation function ' +
+                                     func.name)
+
+    def _gradient(self, inputs, outputs, error_function, bit_fail_limit):
+        '''
+        Run the patterns forwards and the errors backwards as libfann does
+        during batch training.
+
+        Returns the slopes of all the connections, in the order of
+        get_weights, summed over the patterns, together with the summed
+        squared error and the number of failing bits.
+        '''
+        values, sums, errors, squared_error, bit_fail = self._output_errors(
+            inputs, outputs, error_function, bit_fail_limit)
+
+        for upper, lower in zip(self._layers[:0:-1], self._layers[-2::-1]):
+            lo = max(upper.lo, self._num_input)
+            errors[:, lo:upper.start] += np.dot(
+                errors[:, upper.start:upper.end],
+                upper.weights[lo - upper.lo:].T)
+            self._derive(lower, values, sums, errors)
+
+        slopes = np.empty(self._num_connections, dtype=np.float32)
+        for layer in self._layers:
+            layer_errors = errors[:, layer.start:layer.end]
+            weight_slopes = np.dot(values[:, layer.lo:layer.start].T,
+                                   layer_errors)
+            ks, rows, cols = layer.weight_index
+            slopes[ks] = weight_slopes[rows, cols]
+            ks, cols = layer.bias_index
+            slopes[ks] = layer_errors.sum(axis=0)[cols]
+        return slopes, squared_error, bit_fail
+
+    def _output_errors(self, inputs, outputs, error_function,
+                       bit_fail_limit):
+        '''
+        Run the patterns forwards and compute the errors of the output
+        neurons as fann_compute_MSE does.
+
+        Returns the values and the steepness-scaled sums of all the neurons,
+        an error array of the same shape holding the output errors, already
+        multiplied by the derivatives, and zeros elsewhere, the summed
+        squared error and the number of failing bits.
+        '''
+        num = len(inputs)
+        values = np.empty((num, self._num_neurons), dtype=np.float32)
+        sums = np.empty((num, self._num_neurons), dtype=np.float32)
+        errors = np.zeros((num, self._num_neurons), dtype=np.float32)
+        self._forward(inputs, values, sums)
+
+        last = self._layers[-1]
+        diff = (outputs - values[:, last.start:last.end]) * last.error_scale
+        squared_error = float(np.dot(diff.ravel(), diff.ravel()))
+        bit_fail = int(np.count_nonzero(np.abs(diff) >= bit_fail_limit))
+        if error_function == error_func.TANH:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                diff = np.where(diff < -.9999999, -17.0,
+                                np.where(diff > .9999999, 17.0,
+                                         np.log((1.0 + diff) / (1.0 - diff))))
+        errors[:, last.start:last.end] = diff
+        self._derive(last, values, sums, errors)
+        return values, sums, errors, squared_error, bit_fail
+
+    def _derive(self, layer, values, sums, errors):
+        '''
+        Multiply the errors of layer by the derivatives of its activation
+        functions.
+        '''
+        for func, neurons in layer.groups:
+            if neurons is None:
+                neurons = slice(layer.start, layer.end)
+                steepness = layer.steepness
+            else:
+                steepness = layer.steepness[neurons]
+                neurons = neurons + layer.start
+            errors[:, neurons] *= _activation_derivs[func](
+                steepness, values[:, neurons], sums[:, neurons])
+
+class FrozenNeuralNet(object):
+    '''
+    A read-only inference handle for a neural network that can be shared by
+    any number of threads.
+
+    The handle holds one ForwardEngine whose weights are made read-only, so
+    every thread uses the same copy of them.  The neuron values of a forward
+    pass go to a scratch buffer owned by the calling thread, which is kept
+    and reused by the following calls of that thread.  The forward pass is
+    made of NumPy operations that release the GIL, so concurrent calls run
+    in parallel on several cores.
+
+    Changes made to the neural network after it was frozen are not seen by
+    the handle.
+    '''
+
+    def __init__(self, neural_net):
+        '''
+        Constructor
+
+        Use NeuralNet.freeze rather than calling this directly.
+        '''
+        self._engine = ForwardEngine(neural_net)
+        self._engine._freeze()
+        self._local = threading.local()
+
+    def get_num_input(self):
+        '''
+        Get the number of input neurons.
+        '''
+        return self._engine.get_num_input()
+
+    def get_num_output(self):
+        '''
+        Get the number of output neurons.
+        '''
+        return self._engine.get_num_output()
+
+    def run(self, input_data):
+        '''
+        Will run input through the neural network, returning a list of
+        outputs.
+        '''
+        return self.run_batch([input_data])[0].tolist()
+
+    def run_batch(self, input_data, out=None):
+        '''
+        Will run every row of a 2-D array through the neural network,
+        returning an array of shape (n_samples, num_output).
+
+        out behaves as in NeuralNet.run_batch.  Each thread should pass its
+        own out buffer.
+        '''
+        return self._engine._run_batch(input_data, out, self._scratch)
+
+    def _scratch(self, num):
+        '''
+        Returns the neuron value buffer of the calling thread for num
+        patterns, growing it when needed.
+        '''
+        values = getattr(self._local, 'values', None)
+        if values is None or len(values) < num:
+            values = np.empty((num, self._engine._num_neurons),
+                              dtype=np.float32)
+            self._local.values = values
+        return values[:num]
+
+class SparseNeuralNet(object):
+    '''
+    An inference handle for a pruned neural network that stores only its
+    connections with non-zero weights.
+
+    The weights of every layer are kept in compressed sparse row form, one
+    row per neuron holding the neurons it has connections from, much as
+    libfann lays out the connections of every neuron.  The forward pass
+    multiplies these rows with the values of the earlier layers, with
+    scipy.sparse when it is installed and NumPy otherwise, so it does work
+    in proportion to the connections that are left.  Otherwise it runs as
+    a ForwardEngine does, and its outputs match it up to floating point
+    rounding.
+
+    Changes made to the neural network afterwards are not seen.
+    '''
+
+    def __init__(self, neural_net):
+        '''
+        Constructor
+
+        Use NeuralNet.to_sparse rather than calling this directly.
+        '''
+        engine = ForwardEngine(neural_net)
+        for layer in engine._layers:
+            layer.sparse = _CSRMatrix(layer.weights)
+            layer.weights = None
+        self._engine = engine
+
+    def get_num_input(self):
+        '''
+        Get the number of input neurons.
+        '''
+        return self._engine._num_input
+
+    def get_num_output(self):
+        '''
+        Get the number of output neurons.
+        '''
+        return self._engine._num_output
+
+    def get_num_connections(self):
+        '''
+        Returns the number of connections with non-zero weights, bias
+        connections excluded.
+        '''
+        return sum(len(layer.sparse.data) for layer in self._engine._layers)
+
+    def get_model_bytes(self):
+        '''
+        Returns the number of bytes taken by the weights, biases and
+        steepnesses of the network, to compare with
+        ForwardEngine.get_model_bytes.
+        '''
+        return self._engine.get_model_bytes()
+
+    def run(self, input_data):
+        '''
+        Will run input through the neural network, returning a list of
+        outputs.
+        '''
+        return self.run_batch([input_data])[0].tolist()
+
+    def run_batch(self, input_data, out=None):
+        '''
+        Will run every row of a 2-D array through the neural network,
+        returning an array of shape (n_samples, num_output).
+
+        out behaves as in NeuralNet.run_batch.
+        '''
+        return self._engine._run_batch(input_data, out)
+
+# The most products the NumPy sparse forward pass computes at once.
+_CSR_CHUNK = 1 << 20
+
+class _CSRMatrix(object):
+    '''
+    The non-zero weights of one layer in compressed sparse row form, one
+    row per neuron of the layer.
+    '''
+
+    def __init__(self, weights):
+        rows = np.asarray(weights, dtype=np.float32).T
+        nonzero = rows != 0
+        self.shape = rows.shape
+        self.indptr = np.zeros(rows.shape[0] + 1, dtype=np.int32)
+        np.cumsum(nonzero.sum(axis=1), out=self.indptr[1:])
+        self.indices = np.nonzero(nonzero)[1].astype(np.int32)
+        self.data = rows[nonzero]
+        self._matrix = None
+        if scipy is not None:
+            self._matrix = scipy.sparse.csr_matrix(
+                (self.data, self.indices, self.indptr), shape=self.shape)
+
+    @property
+    def nbytes(self):
+        return self.indptr.nbytes + self.indices.nbytes + self.data.nbytes
+
+    def dot(self, inputs):
+        '''
+        Returns inputs (n_samples, columns) times the transposed matrix, of
+        shape (n_samples, rows).
+        '''
+        if self._matrix is not None:
+            return np.asarray(self._matrix.dot(inputs.T),
+                              dtype=np.float32).T
+        sums = np.zeros((len(inputs), self.shape[0]), dtype=np.float32)
+        if len(self.data) == 0:
+            return sums
+        starts = self.indptr[:-1]
+        filled = starts < self.indptr[1:]
+        starts = starts[filled]
+        step = max(1, _CSR_CHUNK // len(self.data))
+        for lo in range(0, len(inputs), step):
+            products = inputs[lo:lo + step, self.indices] * self.data
+            sums[lo:lo + step, filled] = np.add.reduceat(products, starts,
+                                                         axis=1)
+        return sums
+
+class FixedNeuralNet(object):
+    '''
+    A fixed point version of a neural network, for machines without a fast
+    floating point unit.
+
+    As in libfann's fixed point mode, every weight, steepness and neuron
+    value is an integer holding the real value multiplied by
+    get_multiplier(), that is 2 to the power of get_decimal_point(), and
+    the sigmoid functions are replaced by their stepwise linear
+    approximations.  The forward pass runs on 64 bit integer arrays, so it
+    cannot overflow, and matches libfann's fixed point networks up to the
+    rounding of the lowest bits.
+
+    Only the LINEAR, THRESHOLD, SIGMOID, SIGMOID_STEPWISE and LINEAR_PIECE
+    activation functions, and their symmetric versions, exist in fixed
+    point.  Changes made to the neural network afterwards are not seen.
+    '''
+
+    def __init__(self, neural_net, decimal_point=None):
+        '''
+        Constructor
+
+        Use NeuralNet.to_fixed rather than calling this directly.
+        '''
+        engine = ForwardEngine(neural_net)
+        for layer in engine._layers:
+            for func, neurons in layer.groups:
+                if func not in _fixed_activation_funcs:
+                    raise ValueError('activation function ' + func.name +
+                                     ' has no fixed point version')
+        if decimal_point is None:
+            decimal_point = _fixed_decimal_point(engine)
+        multiplier = 1 << decimal_point
+        self._engine = engine
+        self._decimal_point = decimal_point
+        self._multiplier = multiplier
+        self._layers = [_FixedLayer(layer, multiplier)
+                        for layer in engine._layers]
+
+    def get_decimal_point(self):
+        '''
+        Returns the number of bits after the fix point.
+        '''
+        return self._decimal_point
+
+    def get_multiplier(self):
+        '''
+        Returns the multiplier that real values are multiplied by to get
+        their fixed point integers, 2 to the power of the decimal point.
+        '''
+        return self._multiplier
+
+    def get_num_input(self):
+        '''
+        Get the number of input neurons.
+        '''
+        return self._engine._num_input
+
+    def get_num_output(self):
+        '''
+        Get the number of output neurons.
+        '''
+        return self._engine._num_output
+
+    def run(self, input_data):
+        '''
+        Will run input through the fixed point network, returning a list of
+        real outputs.
+        '''
+        return self.run_batch([input_data])[0].tolist()
+
+    def run_batch(self, input_data, out=None):
+        '''
+        Will quantize every row of a 2-D array of real inputs, run them
+        through the fixed point network and return the real outputs as an
+        array of shape (n_samples, num_output).
+
+        out behaves as in NeuralNet.run_batch.
+        '''
+        inputs = np.asarray(input_data, dtype=np.float64)
+        scaling = self._engine._scaling
+        if scaling is not None:
+            inputs = scaling.scale_input(inputs)
+        shape = (len(inputs), self._engine._num_output)
+        if out is None:
+            out = np.empty(shape, dtype=np.float32)
+        elif out.shape != shape or out.dtype != np.float32:
+            raise ValueError('out must be a float32 array of shape ' +
+                             str(shape))
+        outputs = self.run_batch_fixed(np.rint(inputs * self._multiplier))
+        np.multiply(outputs, 1.0 / self._multiplier, out=out,
+                    casting='unsafe')
+        if scaling is not None:
+            scaling.descale_output(out, out)
+        return out
+
+    def run_batch_fixed(self, input_data):
+        '''
+        Will run every row of a 2-D array of fixed point inputs, integers
+        already multiplied by get_multiplier(), through the network and
+        return the fixed point outputs as an int64 array of shape
+        (n_samples, num_output).
+        '''
+        inputs = np.asarray(input_data, dtype=np.int64)
+        num_input = self._engine._num_input
+        if inputs.ndim != 2 or inputs.shape[1] != num_input:
+            raise ValueError('input_data must have shape (n_samples, ' +
+                             str(num_input) + ')')
+        decimal_point = self._decimal_point
+        values = np.empty((len(inputs), self._engine._num_neurons),
+                          dtype=np.int64)
+        values[:, :num_input] = inputs
+        for layer in self._layers:
+            neuron_sums = np.dot(values[:, layer.lo:layer.start],
+                                 layer.weights) >> decimal_point
+            neuron_sums += layer.bias
+            neuron_sums *= layer.steepness
+            neuron_sums >>= decimal_point
+            block = values[:, layer.start:layer.end]
+            for func, neurons in layer.groups:
+                if neurons is None:
+                    block[...] = _fixed_activation_funcs[func](
+                        neuron_sums, self._multiplier)
+                else:
+                    block[:, neurons] = _fixed_activation_funcs[func](
+                        neuron_sums[:, neurons], self._multiplier)
+        return values[:, -self._engine._num_output:]
+
+    def get_accuracy_loss(self, train_data):
+        '''
+        Compares the fixed point network with the floating point network it
+        was made from on the patterns of train_data.
+
+        Returns a dict with the MSE of the fixed point network, the
+        float_MSE of the floating point one (computed as Trainer.test
+        does), and the largest and the mean absolute difference between
+        their outputs, max_output_error and mean_output_error.
+        '''
+        inputs, outputs = train_data._get_arrays()
+        fixed = self.run_batch(inputs)
+        floating = self._engine.run_batch(inputs)
+        error_scale = self._engine._layers[-1].error_scale
+        scaling = self._engine._scaling
+        if scaling is not None:
+            outputs = scaling.scale_output(outputs)
+
+        def mse(actual):
+            if scaling is not None:
+                actual = scaling.scale_output(actual)
+            diff = (outputs - actual) * error_scale
+            return float(np.mean(diff * diff)) if diff.size else 0.0
+
+        diff = np.abs(fixed - floating)
+        return {
+            'MSE': mse(fixed),
+            'float_MSE': mse(floating),
+            'max_output_error': float(diff.max()) if diff.size else 0.0,
+            'mean_output_error': float(diff.mean()) if diff.size else 0.0,
+        }
+
+class _FixedLayer(object):
+    '''
+    One layer of a FixedNeuralNet, with integer weights, bias and
+    steepness.
+    '''
+
+    def __init__(self, layer, multiplier):
+        self.lo = layer.lo
+        self.start = layer.start
+        self.end = layer.end
+        self.groups = layer.groups
+        self.weights = np.rint(layer.weights * np.float64(multiplier))
+        self.weights = self.weights.astype(np.int64)
+        self.bias = np.rint(layer.bias * np.float64(multiplier))
+        self.bias = self.bias.astype(np.int64)
+        self.steepness = np.rint(layer.steepness * np.float64(multiplier))
+        self.steepness = self.steepness.astype(np.int64)
+
+def _fixed_decimal_point(engine):
+    '''
+    Choose the decimal point as fann_save_to_fixed does: the largest sum
+    of absolute weights of any neuron must fit in a 32 bit integer, with
+    room for multiplying two fixed point numbers.
+    '''
+    max_possible_value = 0.0
+    for layer in engine._layers:
+        if layer.end > layer.start:
+            sums = np.abs(layer.weights).sum(axis=0) + np.abs(layer.bias)
+            max_possible_value = max(max_possible_value, float(sums.max()))
+    bits_used_for_max = 0
+    while max_possible_value >= 1:
+        max_possible_value /= 2.0
+        bits_used_for_max += 1
+    return max((32 - 2 - bits_used_for_max) // 2, 0)
+
+def _fixed_stepwise(neuron_sums, multiplier, results, low, high):
+    '''
+    The stepwise linear approximation of a sigmoid on fixed point sums,
+    with integer arithmetic.
+    '''
+    sums = np.rint(np.asarray(_STEPWISE_SUMS) * multiplier).astype(np.int64)
+    results = np.rint(np.asarray(results) * multiplier).astype(np.int64)
+    step = np.searchsorted(sums, neuron_sums, side='right') - 1
+    k = np.clip(step, 0, len(sums) - 2)
+    numerator = (results[k + 1] - results[k]) * (neuron_sums - sums[k])
+    value = results[k] + np.sign(numerator) * (
+        np.abs(numerator) // (sums[k + 1] - sums[k]))
+    return np.where(step < 0, low * multiplier,
+                    np.where(step >= len(sums) - 1, high * multiplier, value))
+
+def _fixed_sigmoid(neuron_sums, multiplier):
+    return _fixed_stepwise(neuron_sums, multiplier, _SIGMOID_STEPWISE_VALUES,
+                           0, 1)
+
+def _fixed_sigmoid_symmetric(neuron_sums, multiplier):
+    return _fixed_stepwise(neuron_sums, multiplier,
+                           _SIGMOID_SYMMETRIC_STEPWISE_VALUES, -1, 1)
+
+_fixed_activation_funcs = {
+    activation_func.LINEAR: lambda x, m: x,
+    activation_func.THRESHOLD: lambda x, m: np.where(x < 0, 0, m),
+    activation_func.THRESHOLD_SYMMETRIC: lambda x, m: np.where(x < 0, -m, m),
+    activation_func.SIGMOID: _fixed_sigmoid,
+    activation_func.SIGMOID_STEPWISE: _fixed_sigmoid,
+    activation_func.SIGMOID_SYMMETRIC: _fixed_sigmoid_symmetric,
+    activation_func.SIGMOID_SYMMETRIC_STEPWISE: _fixed_sigmoid_symmetric,
+    activation_func.LINEAR_PIECE: lambda x, m: np.clip(x, 0, m),
+    activation_func.LINEAR_PIECE_SYMMETRIC: lambda x, m: np.clip(x, -m, m),
+}
+
+class _EngineLayer(object):
+    '''
+    The dense form of one layer of a ForwardEngine.
+    '''
+
+    def __init__(self, lo, start, end, weights, bias, groups, steepness,
+                 weight_index, bias_index):
+        self.lo = lo
+        self.start = start
+        self.end = end
+        self.weights = weights
+        self.bias = bias
+        self.groups = groups
+        self.steepness = steepness
+        self.max_sum = 150.0 / steepness
+        # libfann halves the error of symmetric functions for the MSE and
+        # the bit fail count.
+        self.error_scale = np.ones(end - start, dtype=np.float32)
+        for func, neurons in groups:
+            if func in _symmetric_funcs:
+                self.error_scale[slice(None) if neurons is None
+                                 else neurons] = 0.5
+        self.weight_index = weight_index
+        self.bias_index = bias_index
+        # The _CSRMatrix replacing weights in a SparseNeuralNet.
+        self.sparse = None
+
+def _group_neurons(funcs):
+    '''
+    Group the neurons of a layer by activation function, as a list of
+    (activation_func, neuron indices).  The indices are None when the whole
+    layer uses the same function.
+    '''
+    if len(set(funcs)) == 1:
+        return [(funcs[0], None)]
+    groups = {}
+    for neuron, func in enumerate(funcs):
+        groups.setdefault(func, []).append(neuron)
+    return [(func, np.asarray(neurons, dtype=np.intp))
+            for func, neurons in groups.items()]
@@ -0,0 +1,184 @@
+import itertools
+import math
+import multiprocessing
+import random
+from .trainer import Trainer
+
+def search_training_parameters(neural_net, train_data, space,
+                               num_configs=None, validation_data=None,
+                               min_epochs=10, max_epochs=100,
+                               reduction_factor=3, processes=None, seed=None):
+    '''
+    Searches the training propaties of a Trainer for those that train
+    neural_net best on train_data.
+
+    Every configuration trains its own NeuralNet.copy() of neural_net in
+    one of a group of worker processes.  The search uses successive
+    halving: all the configurations are first trained for min_epochs, then
+    only the best 1/reduction_factor of them carry on, for reduction_factor
+    times as many epochs in total, and so on until max_epochs or a single
+    configuration is left.  Configurations are ranked by Trainer.test on
+    validation_data, or on train_data if none is given.
+
+    Every configuration stays with the worker it was first given to, which
+    keeps its network and its Trainer from one round to the next, so the
+    configurations that carry on keep their training state, such as the
+    RPROP step sizes, as well as their weights.  Since configurations do not
+    move, the later rounds may keep fewer workers busy.
+
+    The workers are forked, so that they inherit the network and the
+    training data instead of receiving them pickled; this needs a platform
+    that supports fork.
+
+    @param space: A dict from the names of get_training_propaties to the
+        values to try.  For a grid search every value is a list and every
+        combination is tried.  For a random search, num_configs
+        configurations are drawn, every value being either a list to choose
+        from or a callable drawing a value from a random.Random, e.g.
+        lambda r: 10 ** r.uniform(-3, 0).
+    @param num_configs: The number of random configurations, or None for a
+        grid search.
+    @param processes: The number of worker processes, by default the number
+        of CPUs.
+    @param seed: The seed of the random search.
+    @return: A (propaties, neural_net, MSE) tuple of the best configuration,
+        a copy of neural_net trained with it (and with its training
+        propaties set), and its MSE.
+    '''
+    if reduction_factor < 2:
+        raise ValueError('reduction_factor must be at least 2')
+    if min_epochs < 1 or max_epochs < min_epochs:
+        raise ValueError('expected 1 <= min_epochs <= max_epochs')
+    configs = _draw_configs(space, num_configs, seed)
+    if not configs:
+        raise ValueError('space has no configuration')
+    for name in sorted(space):
+        if name not in Trainer._prop_names:
+            raise ValueError('unknown training propaty ' + name)
+
+    # Hand the libfann training data to the workers ready to use.
+    scaling = neural_net._scaling
+    train_data._scaled(scaling)._native()
+    if validation_data is not None:
+        validation_data._scaled(scaling)._native()
+    num = min(processes or multiprocessing.cpu_count(), len(configs))
+    context = multiprocessing.get_context('fork')
+    pipes = []
+    workers = []
+    try:
+        for index in range(num):
+            pipe, child_pipe = context.Pipe()
+            worker = context.Process(
+                target=_search_worker,
+                args=(neural_net, train_data, validation_data,
+                      [(i, configs[i])
+                       for i in range(index, len(configs), num)],
+                      child_pipe))
+            worker.daemon = True
+            worker.start()
+            child_pipe.close()
+            pipes.append(pipe)
+            workers.append(worker)
+        order = list(range(len(configs)))
+        trained = 0
+        epochs = min_epochs
+        while True:
+            for pipe in pipes:
+                pipe.send(('train', order, epochs - trained))
+            mses = {}
+            for pipe in pipes:
+                mses.update(pipe.recv())
+            trained = epochs
+            order = sorted(order, key=lambda i: _rank(mses[i]))
+            if len(order) == 1 or epochs >= max_epochs:
+                break
+            order = order[:max(1, len(order) // reduction_factor)]
+            if len(order) == 1:
+                epochs = max_epochs
+            else:
+                epochs = min(epochs * reduction_factor, max_epochs)
+        best = order[0]
+        pipe = pipes[best % num]
+        pipe.send(('weights', best))
+        weights = pipe.recv()
+    finally:
+        for pipe in pipes:
+            try:
+                pipe.send(None)
+            except (IOError, OSError):
+                pass
+            pipe.close()
+        for worker in workers:
+            worker.join()
+
+    best_net = neural_net.copy()
+    best_net.set_weights(weights)
+    Trainer(best_net, train_data).set_training_propaties(**configs[best])
+    return configs[best], best_net, mses[best]
+
+def _draw_configs(space, num_configs, seed):
+    '''
+    Returns the configurations of a grid search, if num_configs is None,
+    or num_configs random configurations, as dicts.
+    '''
+    names = sorted(space)
+    if num_configs is None:
+        for name in names:
+            if callable(space[name]):
+                raise ValueError('a grid search needs a list of values for ' +
+                                 name)
+        return [dict(zip(names, values)) for values in
+                itertools.product(*[space[name] for name in names])]
+    generator = random.Random(seed)
+    configs = []
+    for _ in range(num_configs):
+        config = {}
+        for name in names:
+            values = space[name]
+            if callable(values):
+                config[name] = values(generator)
+            else:
+                config[name] = generator.choice(values)
+        configs.append(config)
+    return configs
+
+def _rank(mse):
+    '''
+    Sort key of a test MSE, a diverged training ranking last.
+    '''
+    if math.isnan(mse):
+        return float('inf')
+    return mse
+
+def _search_worker(neural_net, train_data, validation_data, configs,
+                   pipe):
+    '''
+    The loop of a search process, which keeps a copy of neural_net and a
+    Trainer for each of its (index, config) configs for as long as they
+    carry on.
+    '''
+    trainers = {}
+    for index, config in configs:
+        trainer = Trainer(neural_net.copy(), train_data)
+        trainer.set_training_propaties(**config)
+        trainers[index] = trainer
+    while True:
+        command = pipe.recv()
+        if command is None:
+            break
+        if command[0] == 'train':
+            carry_on, epochs = set(command[1]), command[2]
+            for index in list(trainers):
+                if index not in carry_on:
+                    del trainers[index]
+            mses = []
+            for index, trainer in sorted(trainers.items()):
+                trainer.train_datas = train_data
+                trainer.train_for(epochs)
+                if validation_data is not None:
+                    trainer.train_datas = validation_data
+                mses.append((index, trainer.test()))
+            pipe.send(mses)
+        else:
+            pipe.send(trainers[command[1]].neural_net.get_weights())
+    pipe.close()
@@ -0,0 +1,187 @@
+import copy
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from .neural_net import ForwardEngine
+
+class ProcessPoolNet(object):
+    '''
+    Runs batches through a neural network on a pool of worker processes.
+
+    The weights, biases and steepnesses of the network are laid out once in
+    a block of shared memory that every worker maps, so the model is not
+    copied per worker.  A batch is copied into a shared input array, split
+    into one share of rows per worker, and every worker writes its outputs
+    straight into a shared result array.
+
+    The pool should be closed with close, or used as a context manager,
+    so that the shared memory is released.
+    '''
+
+    def __init__(self, neural_net, processes=None):
+        '''
+        Constructor
+
+        @param processes: The number of worker processes, by default the
+            number of CPUs.
+        '''
+        engine = ForwardEngine(neural_net)
+        arrays = []
+        for layer in engine._layers:
+            arrays.extend([layer.weights, layer.bias, layer.steepness])
+        size = sum(array.nbytes for array in arrays)
+        self._model = shared_memory.SharedMemory(create=True,
+                                                 size=max(size, 1))
+        layout = []
+        offset = 0
+        for array in arrays:
+            view = np.ndarray(array.shape, dtype=np.float32,
+                              buffer=self._model.buf, offset=offset)
+            view[...] = array
+            layout.append((offset, array.shape))
+            offset += array.nbytes
+        self._num_input = engine._num_input
+        self._num_output = engine._num_output
+        self._processes = processes or multiprocessing.cpu_count()
+        self._input = None
+        self._output = None
+        self._pool = multiprocessing.Pool(
+            self._processes, _init_worker,
+            (_skeleton(engine), self._model.name, layout))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        '''
+        Stops the worker processes and releases the shared memory.
+        '''
+        if self._pool is None:
+            return
+        self._pool.close()
+        self._pool.join()
+        self._pool = None
+        for block in (self._model, self._input, self._output):
+            if block is not None:
+                block.close()
+                block.unlink()
+        self._model = self._input = self._output = None
+
+    def get_num_input(self):
+        '''
+        Get the number of input neurons.
+        '''
+        return self._num_input
+
+    def get_num_output(self):
+        '''
+        Get the number of output neurons.
+        '''
+        return self._num_output
+
+    def run_batch(self, input_data, out=None):
+        '''
+        Will run every row of a 2-D array through the neural network on the
+        worker processes, returning an array of shape
+        (n_samples, num_output).
+
+        out behaves as in NeuralNet.run_batch.
+        '''
+        inputs = np.asarray(input_data, dtype=np.float32)
+        if inputs.ndim != 2 or inputs.shape[1] != self._num_input:
+            raise ValueError('input_data must have shape (n_samples, ' +
+                             str(self._num_input) + ')')
+        num = inputs.shape[0]
+        shape = (num, self._num_output)
+        if out is None:
+            out = np.empty(shape, dtype=np.float32)
+        elif out.shape != shape or out.dtype != np.float32:
+            raise ValueError('out must be a float32 array of shape ' +
+                             str(shape))
+        if num == 0:
+            return out
+        self._reserve(num)
+        shared_input = np.ndarray((num, self._num_input), dtype=np.float32,
+                                  buffer=self._input.buf)
+        shared_output = np.ndarray(shape, dtype=np.float32,
+                                   buffer=self._output.buf)
+        shared_input[...] = inputs
+        bounds = np.linspace(0, num, self._processes + 1).astype(int).tolist()
+        self._pool.map(_run_share, [
+            (self._input.name, self._output.name, num, lo, hi)
+            for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo])
+        out[...] = shared_output
+        return out
+
+    def _reserve(self, num):
+        '''
+        Grows the shared input and result arrays to hold num rows.
+        '''
+        if (self._input is not None and
+                self._input.size >= 4 * num * self._num_input and
+                self._output.size >= 4 * num * self._num_output):
+            return
+        for block in (self._input, self._output):
+            if block is not None:
+                block.close()
+                block.unlink()
+        capacity = max(num, 1024)
+        self._input = shared_memory.SharedMemory(
+            create=True, size=4 * capacity * max(self._num_input, 1))
+        self._output = shared_memory.SharedMemory(
+            create=True, size=4 * capacity * max(self._num_output, 1))
+
+def _skeleton(engine):
+    '''
+    A copy of engine without any of its arrays, to be sent to the workers.
+    '''
+    skeleton = copy.copy(engine)
+    skeleton._from_neuron = skeleton._to_neuron = None
+    skeleton._layers = []
+    for layer in engine._layers:
+        layer = copy.copy(layer)
+        layer.weights = layer.bias = layer.steepness = layer.max_sum = None
+        layer.weight_index = layer.bias_index = None
+        skeleton._layers.append(layer)
+    return skeleton
+
+# State of a worker process: the engine over the shared model, and the
+# shared batch arrays it is attached to, by name.
+_worker_engine = None
+_worker_model = None
+_worker_blocks = {}
+
+def _init_worker(skeleton, model_name, layout):
+    global _worker_engine, _worker_model
+    model = _worker_model = shared_memory.SharedMemory(name=model_name)
+    views = [np.ndarray(shape, dtype=np.float32, buffer=model.buf,
+                        offset=offset)
+             for offset, shape in layout]
+    for i, layer in enumerate(skeleton._layers):
+        layer.weights, layer.bias, layer.steepness = views[3 * i:3 * i + 3]
+        layer.max_sum = 150.0 / layer.steepness
+    skeleton._freeze()
+    _worker_engine = skeleton
+
+def _attach(name):
+    block = _worker_blocks.get(name)
+    if block is None:
+        block = shared_memory.SharedMemory(name=name)
+        _worker_blocks[name] = block
+    return block
+
+def _run_share(share):
+    input_name, output_name, num, lo, hi = share
+    # Let go of the arrays the pool replaced with bigger ones.
+    for name in list(_worker_blocks):
+        if name not in (input_name, output_name):
+            _worker_blocks.pop(name).close()
+    engine = _worker_engine
+    inputs = np.ndarray((num, engine._num_input), dtype=np.float32,
+                        buffer=_attach(input_name).buf)
+    outputs = np.ndarray((num, engine._num_output), dtype=np.float32,
+                         buffer=_attach(output_name).buf)
+    engine._run_batch(inputs[lo:hi], outputs[lo:hi])
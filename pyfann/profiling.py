@@ -0,0 +1,194 @@
+'''
+Opt-in profiling of every call into libfann.
+
+Profiling is enabled with the profile() context manager, with enable() and
+disable(), or for a whole process by setting the PYFANN_PROFILE environment
+variable, in which case a report is printed to stderr at exit.
+
+While enabled, every method of the fann2 neural_net and training_data
+classes, those they inherit from neural_net_parent and
+training_data_parent included, and so every native call made by
+NeuralNet, TrainData and Trainer, records its number of calls, its
+cumulative and maximum latency and an estimate of the bytes marshalled
+across the Python/C boundary: eight bytes (one fann_type, a double) per
+number in its arguments and result.  The
+methods are only wrapped while profiling is enabled, so it costs nothing
+otherwise.
+'''
+import atexit
+import os
+import sys
+import threading
+from timeit import default_timer
+import fann2.libfann
+import numpy as np
+
+_profiled_classes = [fann2.libfann.neural_net, fann2.libfann.training_data]
+
+# Attributes SWIG gives every wrapped object, which are not libfann calls.
+_swig_names = set(['this', 'thisown'])
+
+_lock = threading.Lock()
+_stats = {}
+_originals = {}
+_depth = 0
+
+class CallStats(object):
+    '''
+    The statistics of one libfann method.
+    '''
+
+    def __init__(self):
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.bytes = 0
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'total_time': self.total_time,
+            'max_time': self.max_time,
+            'bytes': self.bytes,
+        }
+
+def enable():
+    '''
+    Start profiling.  Calls nest with disable.
+    '''
+    global _depth
+    with _lock:
+        _depth += 1
+        if _depth > 1:
+            return
+        for cls, name, method in _methods():
+            _originals[(cls, name)] = (method, name in vars(cls))
+            setattr(cls, name, _wrap(cls.__name__ + '.' + name, method))
+
+def disable():
+    '''
+    Stop profiling, restoring the unwrapped libfann methods.  The
+    statistics are kept until reset.
+    '''
+    global _depth
+    with _lock:
+        if _depth == 0:
+            return
+        _depth -= 1
+        if _depth > 0:
+            return
+        for (cls, name), (method, own) in _originals.items():
+            if own:
+                setattr(cls, name, method)
+            else:
+                # Inherited again from the parent class.
+                delattr(cls, name)
+        _originals.clear()
+
+def is_enabled():
+    '''
+    Return whether profiling is enabled.
+    '''
+    return _depth > 0
+
+def reset():
+    '''
+    Forget all the statistics recorded so far.
+    '''
+    with _lock:
+        _stats.clear()
+
+def get_stats():
+    '''
+    Return the statistics as a dict from 'class.method' to a dict of calls,
+    total_time, max_time (both in seconds) and bytes.
+    '''
+    with _lock:
+        return dict((name, stats.as_dict()) for name, stats in _stats.items())
+
+def report(file=None):
+    '''
+    Print the statistics as a table, the most expensive method first.
+    '''
+    file = file or sys.stdout
+    stats = sorted(get_stats().items(), key=lambda item: -item[1]['total_time'])
+    file.write('%-40s %10s %12s %12s %14s\n' %
+               ('method', 'calls', 'total s', 'max s', 'bytes'))
+    for name, s in stats:
+        file.write('%-40s %10d %12.6f %12.6f %14d\n' %
+                   (name, s['calls'], s['total_time'], s['max_time'],
+                    s['bytes']))
+
+class profile(object):
+    '''
+    Context manager enabling profiling inside its block.
+    '''
+
+    def __enter__(self):
+        enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        disable()
+
+def _methods():
+    '''
+    Yields the profiled class, name and method of every libfann method,
+    the inherited ones as they resolve on the profiled class.
+    '''
+    for cls in _profiled_classes:
+        seen = set()
+        for base in cls.__mro__:
+            if base is object:
+                continue
+            for name, method in list(vars(base).items()):
+                # A class earlier in the MRO hides the later ones.
+                if name in seen:
+                    continue
+                seen.add(name)
+                if (name.startswith('_') or name in _swig_names or
+                        not callable(method)):
+                    continue
+                yield cls, name, method
+
+def _wrap(name, method):
+    def profiled(*args, **kwargs):
+        start = default_timer()
+        result = method(*args, **kwargs)
+        elapsed = default_timer() - start
+        marshalled = _marshalled(args[1:]) + _marshalled(kwargs) + \
+            _marshalled(result)
+        with _lock:
+            stats = _stats.get(name)
+            if stats is None:
+                stats = _stats[name] = CallStats()
+            stats.calls += 1
+            stats.total_time += elapsed
+            stats.max_time = max(stats.max_time, elapsed)
+            stats.bytes += marshalled
+        return result
+    profiled.__name__ = method.__name__
+    profiled.__doc__ = method.__doc__
+    return profiled
+
+def _marshalled(value):
+    '''
+    Estimate the bytes needed to pass value to or from libfann.
+    '''
+    if isinstance(value, np.ndarray):
+        return 8 * value.size
+    if isinstance(value, (list, tuple)):
+        return sum(_marshalled(item) for item in value)
+    if isinstance(value, dict):
+        return sum(_marshalled(item) for item in value.values())
+    if isinstance(value, (bool, type(None))):
+        return 0
+    if isinstance(value, (int, float, np.number)):
+        return 8
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    return 0
+
+if os.environ.get('PYFANN_PROFILE'):
+    enable()
+    atexit.register(report, sys.stderr)
@@ -1,4 +1,20 @@
-import fann2.libfann
+import struct
+import numpy as np
+from .neural_net import _libfann
+
+# Header of the binary training data format: magic, format version,
+# num_train_data, num_input and num_output.  It is followed by the input
+# rows and then the output rows, as little-endian 32 bit floats.
+_BINARY_MAGIC = b'FANNTRNB'
+_BINARY_VERSION = 1
+_BINARY_HEADER = struct.Struct('<8sIIII')
+
+# A view of a range of patterns gets its libfann training data by copying
+# that of the training data it was made from, and cutting it down, if it
+# holds at least 1/_SUBSET_RATIO of the patterns.  Copying within libfann
+# is much cheaper per pattern than handing patterns over from Python, but
+# copies all the patterns.
+_SUBSET_RATIO = 16
 
 class TrainData(object):
     
@@ -6,36 +22,328 @@ class TrainData(object):
     def __init__(self):
         self._training_data = None
         self._addDone = True
+        self._input = None
+        self._output = None
+        self._length = 0
+        self._scaled_data = None
     
     def __del__(self):
-        self._training_data.destroy_train()
+        if self._training_data is not None:
+            self._training_data.destroy_train()
     
+    @classmethod
+    def from_arrays(cls, input_data, output_data):
+        '''
+        Creates training data from a 2-D array of inputs and a 2-D array of
+        outputs, with one training pattern per row.
+
+        Any object supporting the buffer protocol may be given.  The rows are
+        copied once into contiguous float arrays; no text file is involved.
+        '''
+        train_data = cls()
+        train_data.add(input_data, output_data)
+        return train_data
+
     def add(self, input_data, ouput_data):
+        '''
+        Appends training patterns.
+
+        input_data and ouput_data are either a single pattern or 2-D arrays
+        with one pattern per row.  The patterns are kept in growable
+        contiguous float arrays and handed to libfann in one bulk copy the
+        next time the training data is used.
+        '''
+        inputs = np.atleast_2d(np.asarray(input_data, dtype=np.float32))
+        outputs = np.atleast_2d(np.asarray(ouput_data, dtype=np.float32))
+        if inputs.ndim != 2 or outputs.ndim != 2:
+            raise ValueError('training patterns must be 1-D or 2-D')
+        if len(inputs) != len(outputs):
+            raise ValueError('input_data and ouput_data must have the same '
+                             'number of patterns')
+        if self._input is None:
+            self._load_arrays()
+        if self._input is None:
+            self._input = np.empty((0, inputs.shape[1]), dtype=np.float32)
+            self._output = np.empty((0, outputs.shape[1]), dtype=np.float32)
+        if (inputs.shape[1] != self._input.shape[1] or
+                outputs.shape[1] != self._output.shape[1]):
+            raise ValueError('training patterns must have ' +
+                             str(self._input.shape[1]) + ' inputs and ' +
+                             str(self._output.shape[1]) + ' outputs')
+        length = self._length + len(inputs)
+        self._reserve(length)
+        self._input[self._length:length] = inputs
+        self._output[self._length:length] = outputs
+        self._length = length
         self._addDone = False
 
+    def _reserve(self, length):
+        '''
+        Grows the pattern arrays so that they hold at least length rows.
+        '''
+        capacity = len(self._input)
+        if length <= capacity:
+            return
+        capacity = max(length, 2 * capacity, 16)
+        for name in ('_input', '_output'):
+            old = getattr(self, name)
+            new = np.empty((capacity, old.shape[1]), dtype=np.float32)
+            new[:self._length] = old[:self._length]
+            setattr(self, name, new)
+
+    def _load_arrays(self):
+        '''
+        Copies the patterns held by libfann into the pattern arrays.
+        '''
+        if self._training_data is None:
+            return
+        self._input = np.array(self._training_data.get_input(),
+                               dtype=np.float32, ndmin=2)
+        self._output = np.array(self._training_data.get_output(),
+                                dtype=np.float32, ndmin=2)
+        self._length = len(self._input)
+
+    def _get_arrays(self):
+        '''
+        Returns the (inputs, outputs) arrays of all the training patterns.
+        '''
+        if self._input is None:
+            self._load_arrays()
+        return self._input[:self._length], self._output[:self._length]
+
     def _add_commit(self):
+        '''
+        Hands the added patterns to libfann in one bulk copy.
+        '''
+        inputs, outputs = self._get_arrays()
+        training_data = _libfann().training_data()
+        training_data.set_train_data(inputs, outputs)
+        if self._training_data is not None:
+            self._training_data.destroy_train()
+        self._training_data = training_data
         self._addDone = True
 
+    def _scaled(self, scaling):
+        '''
+        Returns the training data as seen by a network with the given
+        scaling parameters, or self if there are none.  The scaled copy is
+        made in one vectorized pass and kept until the patterns or the
+        scaling change.
+        '''
+        if scaling is None:
+            return self
+        inputs, outputs = self._get_arrays()
+        cached = self._scaled_data
+        if (cached is None or cached[0] is not scaling or
+                cached[1] != len(inputs)):
+            scaled = TrainData.from_arrays(scaling.scale_input(inputs),
+                                           scaling.scale_output(outputs))
+            cached = self._scaled_data = (scaling, len(inputs), scaled)
+        return cached[2]
+
+    def _native(self):
+        '''
+        Returns the libfann training data, committing pending patterns first.
+        '''
+        if not self._addDone:
+            self._add_commit()
+        return self._training_data
+
+    def length(self):
+        '''
+        Returns the number of training patterns.
+        '''
+        if self._input is not None:
+            return self._length
+        return self._native().length_train_data()
+
     def num_input(self):
         '''
         Returns the number of inputs in each of the training patterns.
         '''
-        return self._training_data.num_input()
+        return self._native().num_input()
 
     def num_output(self):
         '''
         Returns the number of outputs in each of the training patterns
         '''
-        return self._training_data.num_output()
+        return self._native().num_output()
 
-    def save(self, filename):
+    def view(self, indices):
+        '''
+        Returns a TrainDataView of the training patterns selected by
+        indices, a slice, an array of pattern indices or a boolean mask,
+        without copying them.
+
+        A view of a range of patterns shares the pattern arrays of this
+        training data.  A view of any other selection only holds the
+        indices, and gathers its patterns once, when it is first trained or
+        tested on.
+        '''
+        return TrainDataView(self, _normalize_index(indices, self.length()))
+
+    def shuffled(self, seed=None):
+        '''
+        Returns a TrainDataView of all the training patterns in a random
+        order, drawn from a numpy.random.RandomState(seed).
+        '''
+        order = np.random.RandomState(seed).permutation(self.length())
+        return self.view(order)
+
+    def batches(self, size):
+        '''
+        Yields consecutive TrainDataViews of size training patterns, the
+        last one possibly smaller, for mini-batch training with
+        Trainer.train(batch).  Take the batches of shuffled() to reshuffle
+        every epoch; every batch is then a new view, so its patterns are
+        copied into libfann each epoch.  Keep the batches in a list to
+        train on the same batches, copied once, every epoch.
+        '''
+        if size < 1:
+            raise ValueError('size must be at least 1')
+        for start in range(0, self.length(), size):
+            yield self.view(slice(start, start + size))
+
+    def save(self, filename, binary=False):
         '''
         Save the training structure to a file, with the format
         as specified in read_train_from_file
+
+        If binary is true, the binary format read by
+        read_train_data_from_binary_file is written instead.
         '''
-        if self._training_data.save_train(filename) < 0:
+        if binary:
+            self._save_binary(filename)
+            return
+        if self._native().save_train(filename) < 0:
             raise IOError("Failed to save.")
 
+    def _save_binary(self, filename):
+        inputs, outputs = self._get_arrays()
+        with open(filename, 'wb') as f:
+            f.write(_BINARY_HEADER.pack(_BINARY_MAGIC, _BINARY_VERSION,
+                                        len(inputs), inputs.shape[1],
+                                        outputs.shape[1]))
+            np.ascontiguousarray(inputs, dtype='<f4').tofile(f)
+            np.ascontiguousarray(outputs, dtype='<f4').tofile(f)
+
+class TrainDataView(TrainData):
+    '''
+    A selection of the training patterns of a TrainData, made by
+    TrainData.view, shuffled or batches.
+
+    A view can be used wherever a TrainData can, but no patterns can be
+    added to it.  It sees the patterns of the training data it was made
+    from, which must not be changed while the view is used.  Views of views
+    select from the same underlying training data.
+
+    Selecting patterns copies nothing, but training or testing on a view
+    through libfann does copy its patterns into libfann training data of
+    its own: fann2 cannot point libfann at a part of other training data,
+    nor refill a libfann buffer in place.  The copy is made when the view
+    is first used and kept for later uses of the same view, so an epoch
+    over a view already trained on copies nothing.  A new view, such as
+    every batch of a new shuffled() order, is copied again.  A view of a
+    large enough range of patterns is copied within libfann from the
+    training data it was made from; any other view is gathered and handed
+    over as with TrainData.from_arrays.
+    '''
+
+    def __init__(self, base, index):
+        '''
+        Constructor
+
+        Use TrainData.view rather than calling this directly.
+        '''
+        TrainData.__init__(self)
+        self._base = base
+        # A slice with a step of 1, or an array of pattern indices.
+        self._index = index
+        self._gathered = None
+        self._addDone = False
+
+    def add(self, input_data, ouput_data):
+        raise ValueError('cannot add training patterns to a view')
+
+    def view(self, indices):
+        index = _normalize_index(indices, self.length())
+        if isinstance(self._index, slice):
+            if isinstance(index, slice):
+                index = slice(self._index.start + index.start,
+                              self._index.start + index.stop)
+            else:
+                index = index + self._index.start
+        else:
+            index = _normalize_index(self._index[index], self._base.length())
+        return TrainDataView(self._base, index)
+
+    def _get_arrays(self):
+        inputs, outputs = self._base._get_arrays()
+        if isinstance(self._index, slice):
+            return inputs[self._index], outputs[self._index]
+        if self._gathered is None:
+            self._gathered = (np.take(inputs, self._index, axis=0),
+                              np.take(outputs, self._index, axis=0))
+        return self._gathered
+
+    def _add_commit(self):
+        if (not isinstance(self._index, slice) or
+                self.length() * _SUBSET_RATIO < self._base.length()):
+            TrainData._add_commit(self)
+            return
+        training_data = _libfann().training_data(self._base._native())
+        training_data.subset_train_data(self._index.start, self.length())
+        self._training_data = training_data
+        self._addDone = True
+
+    def _scaled(self, scaling):
+        if scaling is None:
+            return self
+        cached = self._scaled_data
+        if cached is None or cached[0] is not scaling:
+            scaled = TrainDataView(self._base._scaled(scaling), self._index)
+            cached = self._scaled_data = (scaling, 0, scaled)
+        return cached[2]
+
+    def length(self):
+        if isinstance(self._index, slice):
+            return self._index.stop - self._index.start
+        return len(self._index)
+
+    def num_input(self):
+        return self._base._get_arrays()[0].shape[1]
+
+    def num_output(self):
+        return self._base._get_arrays()[1].shape[1]
+
+def _normalize_index(indices, length):
+    '''
+    Turns a slice, an index array or a boolean mask over length patterns
+    into a slice with a step of 1 or an array of non-negative indices.
+    Contiguous index arrays become slices, which select without copying.
+    '''
+    if isinstance(indices, slice):
+        start, stop, step = indices.indices(length)
+        if step == 1:
+            return slice(start, max(start, stop))
+        indices = np.arange(start, stop, step)
+    indices = np.asarray(indices)
+    if indices.dtype == bool:
+        if indices.shape != (length,):
+            raise IndexError('the mask must have one value per pattern')
+        indices = np.nonzero(indices)[0]
+    if indices.ndim != 1 or (indices.size and
+                             not np.issubdtype(indices.dtype, np.integer)):
+        raise IndexError('indices must be a slice, a 1-D array of integers '
+                         'or a boolean mask')
+    indices = indices.astype(np.intp)
+    indices[indices < 0] += length
+    if indices.size and (indices.min() < 0 or indices.max() >= length):
+        raise IndexError('pattern index out of range')
+    if indices.size and np.all(np.diff(indices) == 1):
+        return slice(int(indices[0]), int(indices[-1]) + 1)
+    return indices
+
 def read_train_data_from_file(filename):
     '''
     Reads a file that stores training data.
@@ -49,8 +357,97 @@ def read_train_data_from_file(filename):
     inputdata seperated by space
     outputdata seperated by space
     '''
-    training_data = fann2.libfann.training_data()
+    training_data = _libfann().training_data()
     training_data.read_train_from_file(filename)
     train_data = TrainData()
     train_data._training_data = training_data
     return train_data
+
+class TrainDataChunks(object):
+    '''
+    Reads a training data file chunk by chunk, for Trainer.train_stream.
+
+    Iterating yields (input_data, output_data) array pairs of at most
+    chunk_size training patterns, so only one chunk is in memory at a time.
+    The file is read again each time the object is iterated, once per epoch.
+    Both the text format of read_train_data_from_file and the binary format
+    of read_train_data_from_binary_file are understood.
+    '''
+
+    def __init__(self, filename, chunk_size):
+        self._filename = filename
+        self._chunk_size = chunk_size
+
+    def __iter__(self):
+        with open(self._filename, 'rb') as f:
+            binary = f.read(len(_BINARY_MAGIC)) == _BINARY_MAGIC
+        if binary:
+            return self._iter_binary()
+        return self._iter_text()
+
+    def _iter_binary(self):
+        inputs, outputs = \
+            read_train_data_from_binary_file(self._filename)._get_arrays()
+        for start in range(0, len(inputs), self._chunk_size):
+            stop = start + self._chunk_size
+            yield np.array(inputs[start:stop]), np.array(outputs[start:stop])
+
+    def _iter_text(self):
+        with open(self._filename) as f:
+            num_data, num_input, num_output = \
+                [int(v) for v in f.readline().split()[:3]]
+            width = num_input + num_output
+            remaining = num_data
+            pending = []
+            for line in f:
+                pending.extend(line.split())
+                while (remaining and
+                       len(pending) >= min(self._chunk_size, remaining) * width):
+                    rows = min(self._chunk_size, remaining)
+                    block = np.array(pending[:rows * width], dtype=np.float32)
+                    block = block.reshape(rows, width)
+                    del pending[:rows * width]
+                    remaining -= rows
+                    yield block[:, :num_input], block[:, num_input:]
+            if remaining:
+                raise IOError('unexpected end of ' + self._filename)
+
+def read_train_data_from_binary_file(filename):
+    '''
+    Opens a file that stores training data in the binary format written by
+    TrainData.save(filename, binary=True).
+
+    The file is memory-mapped read-only rather than parsed, so opening it
+    is nearly instant whatever its size, and the pages are shared by every
+    process on the host that opens the same file.  The patterns are only
+    copied when libfann needs them or more patterns are added.
+    '''
+    with open(filename, 'rb') as f:
+        header = f.read(_BINARY_HEADER.size)
+    if len(header) < _BINARY_HEADER.size:
+        raise IOError(filename + ' is not a binary training data file')
+    magic, version, num_data, num_input, num_output = \
+        _BINARY_HEADER.unpack(header)
+    if magic != _BINARY_MAGIC:
+        raise IOError(filename + ' is not a binary training data file')
+    if version != _BINARY_VERSION:
+        raise IOError('unsupported binary training data version ' +
+                      str(version))
+    train_data = TrainData()
+    train_data._input = _map_rows(filename, _BINARY_HEADER.size,
+                                  num_data, num_input)
+    train_data._output = _map_rows(
+        filename, _BINARY_HEADER.size + 4 * num_data * num_input,
+        num_data, num_output)
+    train_data._length = num_data
+    train_data._addDone = False
+    return train_data
+
+def _map_rows(filename, offset, num_rows, num_columns):
+    '''
+    Memory-maps num_rows rows of num_columns floats read-only.
+    '''
+    if num_rows * num_columns == 0:
+        return np.zeros((num_rows, num_columns), dtype=np.float32)
+    return np.memmap(filename, dtype='<f4', mode='r', offset=offset,
+                     shape=(num_rows, num_columns))
@@ -1,12 +1,38 @@
-from enums import train_algorithm, error_func, stop_func
+import multiprocessing
+import threading
+from collections import namedtuple
+from multiprocessing import shared_memory
+from multiprocessing.pool import ThreadPool
+from timeit import default_timer
+import queue
+import numpy as np
+from .enums import train_algorithm, error_func, stop_func
+from .neural_net import ForwardEngine
+from .train_data import TrainData
+
+class EpochRecord(namedtuple('EpochRecord', [
+        'epoch', 'MSE', 'bit_fail', 'wall_time', 'samples_per_second',
+        'fann_time', 'python_time'])):
+    '''
+    What a training callback is told about an epoch.
+
+    epoch counts from 1.  MSE and bit_fail are those reported by the epoch.
+    wall_time is the length of the epoch in seconds, of which fann_time was
+    spent inside libfann (or computing slopes, in multi-threaded training)
+    and python_time in the wrapper.
+    '''
+    __slots__ = ()
 
 class Trainer():
     
     def __init__(self, neural_net, train_datas):
         self.neural_net = neural_net
         self.train_datas = train_datas
+        self._parallel = None
+        self._data_parallel = None
+        self._callbacks = []
     
-    def train(self):
+    def train(self, train_data=None):
         '''
         Train one epoch with a set of training data.
 
@@ -18,10 +44,30 @@ class Trainer():
         training epoch, but since calculating this will require to go through
         the entire training set once more, it is more than adequate to use
         this value during training.
-        '''
-        return self.neural_net.train_epoch(self.train_datas)
 
-    def train_for(self, max_epochs, epochs_between_reports=0, disired_error=0.0):
+        With data-parallel training (see set_num_processes), every call
+        forks the worker processes for a single epoch and averages their
+        weights when it ends, so train several epochs with train_for there.
+
+        @param train_data: The TrainData to train on instead of the one of
+            the trainer, such as a mini-batch of TrainData.batches.
+        '''
+        if train_data is None:
+            train_data = self.train_datas
+        if self._uses_processes():
+            return self._train_processes(1, 0, 0.0, [],
+                                         train_data=train_data)[0]
+        if self._uses_threads():
+            return self._train_threaded(1, 0, 0.0, [],
+                                        train_data=train_data)[0]
+        mse = self.neural_net._fann.train_epoch(
+            self._scaled(train_data)._native())
+        self.neural_net._apply_pruning()
+        return mse
+
+    def train_for(self, max_epochs, epochs_between_reports=0, disired_error=0.0,
+                  validation_data=None, epochs_between_validations=1,
+                  patience=10):
         '''
         Trains on an entire dataset, for a period of time.
 
@@ -29,59 +75,466 @@ class Trainer():
         set_training_algorithm, and the parameters set for these training
         algorithms.
 
+        If validation_data is given, the training stops early: the MSE of
+        validation_data is tested every epochs_between_validations epochs,
+        and the training stops once it has not improved for patience
+        epochs.  The weights with the lowest validation MSE are kept in
+        memory and put back when the training ends.
+
+        @param max_epochs:The maximum number of epochs the training should continue
+        @param epochs_between_reports: The number of epochs between printing
+            a status report to stdout. A value of zero means no reports should
+            be printed
+        @param desired_error: The desired MSE or bit fail, depending on
+            which stop function is chosen by set_train_stop_function.
+        @param validation_data: The TrainData to stop early on, or None.
+        @param patience: The number of epochs, at least 1, the validation
+            MSE may go without improving before the training stops.
+        '''
+        callbacks = list(self._callbacks)
+        early_stopping = None
+        if validation_data is not None:
+            early_stopping = _EarlyStopping(validation_data,
+                                            epochs_between_validations,
+                                            patience)
+            callbacks.append(early_stopping)
+        if self._uses_processes():
+            self._train_processes(max_epochs, epochs_between_reports,
+                                  disired_error, callbacks, early_stopping)
+            return
+        if self._uses_threads():
+            self._train_threaded(max_epochs, epochs_between_reports,
+                                 disired_error, callbacks, early_stopping)
+            return
+        # libfann's own loop cannot keep pruned connections at zero.
+        if callbacks or self.neural_net._pruned is not None:
+            fann = self.neural_net._fann
+            data = self._scaled(self.train_datas)._native()
+            num_data = self.train_datas.length()
+
+            def train_epoch():
+                start = default_timer()
+                mse = fann.train_epoch(data)
+                self.neural_net._apply_pruning()
+                return mse, fann.get_bit_fail(), num_data, \
+                    default_timer() - start
+
+            if early_stopping is not None:
+                validation = self._scaled(validation_data)._native()
+                early_stopping.bind(lambda: fann.test_data(validation),
+                                    self.neural_net.get_weights,
+                                    self.neural_net.set_weights)
+            self._train_epochs(train_epoch, max_epochs,
+                               epochs_between_reports, disired_error,
+                               callbacks)
+            if early_stopping is not None:
+                early_stopping.restore()
+            return
+        return self.neural_net._fann.train_on_data(
+            self._scaled(self.train_datas)._native(), max_epochs, epochs_between_reports,
+            disired_error)
+
+    def train_stream(self, source, prefetch=True):
+        '''
+        Train one epoch with training data read chunk by chunk.
+
+        source yields (input_data, output_data) chunks with one training
+        pattern per row, e.g. a TrainDataChunks reader or a list of array
+        pairs.  A callable returning such an iterable may be given instead,
+        which is how a generator can be walked again on every epoch.  Only
+        one chunk, plus the next one when prefetch is true, is held in
+        memory at a time.
+
+        Every chunk is trained as with train, so the batch training
+        algorithms update the weights once per chunk.
+
+        @param prefetch: Read the next chunk on a background thread while
+            training on the current one.
+        @return: A (MSE, bit fail) pair accumulated across all the chunks of
+            the epoch.
+        '''
+        return self._train_stream_epoch(source, prefetch)[:2]
+
+    def _train_stream_epoch(self, source, prefetch):
+        '''
+        train_stream, also returning the number of patterns and the seconds
+        spent inside libfann.
+        '''
+        fann = self.neural_net._fann
+        scaling = self.neural_net._scaling
+        chunks = _iter_source(source)
+        if prefetch:
+            chunks = _prefetch(chunks)
+        mse_sum = 0.0
+        bit_fail = 0
+        num_data = 0
+        fann_time = 0.0
+        for input_data, output_data in chunks:
+            if scaling is not None:
+                input_data = scaling.scale_input(
+                    np.asarray(input_data, dtype=np.float32))
+                output_data = scaling.scale_output(
+                    np.asarray(output_data, dtype=np.float32))
+            chunk = TrainData.from_arrays(input_data, output_data)
+            native = chunk._native()
+            start = default_timer()
+            mse_sum += fann.train_epoch(native) * chunk._length
+            self.neural_net._apply_pruning()
+            fann_time += default_timer() - start
+            bit_fail += fann.get_bit_fail()
+            num_data += chunk._length
+        if num_data == 0:
+            return 0.0, 0, 0, fann_time
+        return mse_sum / num_data, bit_fail, num_data, fann_time
+
+    def train_stream_for(self, source, max_epochs, epochs_between_reports=0,
+                         disired_error=0.0, prefetch=True):
+        '''
+        Trains on training data read chunk by chunk, for a period of time.
+
+        Each epoch walks source once with train_stream, so the data set
+        never has to fit in memory.  source must be iterable once per epoch;
+        pass a callable returning a fresh iterable rather than a generator.
+
         @param max_epochs:The maximum number of epochs the training should continue
         @param epochs_between_reports: The number of epochs between printing
             a status report to stdout. A value of zero means no reports should
             be printed
         @param desired_error: The desired MSE or bit fail, depending on
             which stop function is chosen by set_train_stop_function.
+        @return: The (MSE, bit fail) pair of the last epoch.
+        '''
+        if max_epochs > 1 and not callable(source) and iter(source) is source:
+            raise ValueError('source can only be walked once; pass a '
+                             'callable returning a fresh iterable')
+        return self._train_epochs(
+            lambda: self._train_stream_epoch(source, prefetch), max_epochs,
+            epochs_between_reports, disired_error, self._callbacks)
+
+    def _train_epochs(self, train_epoch, max_epochs, epochs_between_reports,
+                      disired_error, callbacks):
+        '''
+        Call train_epoch until max_epochs or the desired error is reached,
+        reporting to stdout like libfann does and calling callbacks.
+
+        train_epoch returns the MSE, the bit fail, the number of patterns
+        and the seconds spent inside libfann of one epoch.
+        '''
+        stop_function = self.get_train_stop_function()
+        mse, bit_fail = 0.0, 0
+        for epoch in range(1, max_epochs + 1):
+            start = default_timer()
+            mse, bit_fail, num_data, fann_time = train_epoch()
+            error = bit_fail if stop_function == stop_func.BIT else mse
+            if (epochs_between_reports and
+                    (epoch % epochs_between_reports == 0 or
+                     epoch == max_epochs or epoch == 1 or
+                     error <= disired_error)):
+                print('Epochs %8d. Current error: %.10f. Bit fail %d.' %
+                      (epoch, mse, bit_fail))
+            if callbacks:
+                wall_time = default_timer() - start
+                record = EpochRecord(
+                    epoch, mse, bit_fail, wall_time,
+                    num_data / wall_time if wall_time > 0 else 0.0,
+                    fann_time, wall_time - fann_time)
+                if -1 in [callback(record) for callback in callbacks]:
+                    break
+            if error <= disired_error:
+                break
+        return mse, bit_fail
+
+    def add_callback(self, callback):
+        '''
+        Register a function called with an EpochRecord after every epoch of
+        train_for and train_stream_for.
+
+        If the callback returns -1, the training stops.  Without any
+        callback, train_for runs entirely inside libfann.
+        '''
+        self._callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        '''
+        Unregister a function registered with add_callback.
+        '''
+        self._callbacks.remove(callback)
+
+    def get_num_threads(self):
+        '''
+        Return the number of threads used for training.
+
+        With more than one thread, the batch training algorithms (BATCH,
+        RPROP, QUICKPROP and SARPROP) split the training data across the
+        threads, which compute the partial slopes of their share with the
+        GIL released.  The slopes are summed before the weights are updated
+        the way libfann does it.  INCREMENTAL training always runs in
+        libfann on one thread.
+
+        The default number of threads is 1.
+        '''
+        if self._parallel is None:
+            return 1
+        return self._parallel.num_threads
+
+    def set_num_threads(self, num_threads):
+        '''
+        Set the number of threads used for training.
+
+        More info available in get_num_threads
+        '''
+        if num_threads < 1:
+            raise ValueError('num_threads must be at least 1')
+        if self._parallel is not None:
+            self._parallel.close()
+            self._parallel = None
+        if num_threads > 1:
+            self._parallel = _ParallelTraining(num_threads)
+
+    def get_num_processes(self):
+        '''
+        Return the number of processes used for data-parallel training.
+
+        With more than one process, INCREMENTAL and BATCH training split
+        the training data into one shard per process, and every process
+        trains its own copy of the network on its shard with libfann.  The
+        weights of the copies are averaged, weighted by the size of their
+        shards, every get_epochs_between_averages epochs, before every
+        validation of train_for and when the training ends, and the
+        average is written back into the network.
+
+        The processes are forked when the training starts, so that they
+        inherit the network and the training data instead of receiving
+        them pickled, and the weights are averaged in shared memory.  This
+        needs a platform that supports fork.  They are stopped when the
+        training ends: only train_for keeps them for several epochs, while
+        train forks them anew for every epoch.  The other training
+        algorithms are not affected.
+
+        The default number of processes is 1.
+        '''
+        if self._data_parallel is None:
+            return 1
+        return self._data_parallel.num_processes
+
+    def get_epochs_between_averages(self):
+        '''
+        Return the number of epochs the processes of data-parallel training
+        train on their own between two averages of their weights.
+
+        More info available in get_num_processes
         '''
-        return self.neural_net.train_on_data(self.train_datas, max_epochs,
-                                         epochs_between_reports, disired_error)
+        if self._data_parallel is None:
+            return 1
+        return self._data_parallel.epochs_between_averages
+
+    def set_num_processes(self, num_processes, epochs_between_averages=1):
+        '''
+        Set the number of processes used for data-parallel training, and
+        the number of epochs between two averages of their weights.
+
+        More info available in get_num_processes
+        '''
+        if num_processes < 1:
+            raise ValueError('num_processes must be at least 1')
+        if epochs_between_averages < 1:
+            raise ValueError('epochs_between_averages must be at least 1')
+        self._data_parallel = None
+        if num_processes > 1:
+            self._data_parallel = _DataParallel(num_processes,
+                                                epochs_between_averages)
+
+    def get_parallel_stats(self):
+        '''
+        Return statistics of the multi-threaded training as a dict.
+
+        epochs is the number of epochs trained on several threads,
+        wall_time the seconds they spent computing slopes and thread_time
+        the sum of the seconds each thread spent on it.  speedup is
+        thread_time divided by wall_time, the number of threads that were
+        busy on average.  MSE and bit_fail are those of the last epoch.
+        '''
+        parallel = self._parallel
+        if parallel is None:
+            return None
+        return {
+            'epochs': parallel.epochs,
+            'wall_time': parallel.wall_time,
+            'thread_time': parallel.thread_time,
+            'speedup': (parallel.thread_time / parallel.wall_time
+                        if parallel.wall_time else 0.0),
+            'MSE': parallel.mse,
+            'bit_fail': parallel.bit_fail,
+        }
+
+    def _uses_processes(self):
+        return (self._data_parallel is not None and
+                self.get_training_algorithm() in (train_algorithm.INCREMENTAL,
+                                                  train_algorithm.BATCH))
+
+    def _train_processes(self, max_epochs, epochs_between_reports,
+                         disired_error, callbacks, early_stopping=None,
+                         train_data=None):
+        '''
+        Train copies of the network on shards of the training data in
+        worker processes, and write the average of their weights back into
+        the network when done.
+        '''
+        if train_data is None:
+            train_data = self.train_datas
+        inputs, outputs = self._scaled(train_data)._get_arrays()
+        every = self._data_parallel.epochs_between_averages
+        group = _ProcessGroup(self.neural_net, inputs, outputs,
+                              self._data_parallel.num_processes)
+
+        def train_epoch():
+            return group.train_epoch(every)
+
+        try:
+            if early_stopping is not None:
+                fann = self.neural_net._fann
+                validation = self._scaled(
+                    early_stopping.validation_data)._native()
+
+                def test():
+                    self.neural_net.set_weights(group.average())
+                    return fann.test_data(validation)
+
+                early_stopping.bind(test, self.neural_net.get_weights,
+                                    self.neural_net.set_weights)
+            result = self._train_epochs(train_epoch, max_epochs,
+                                        epochs_between_reports, disired_error,
+                                        callbacks)
+            self.neural_net.set_weights(group.average())
+            if early_stopping is not None:
+                early_stopping.restore()
+            return result
+        finally:
+            group.close()
+
+    def _uses_threads(self):
+        return (self._parallel is not None and
+                self.get_training_algorithm() in _threaded_updates)
+
+    def _train_threaded(self, max_epochs, epochs_between_reports,
+                        disired_error, callbacks, early_stopping=None,
+                        train_data=None):
+        '''
+        Train on several threads on a NumPy copy of the network, and write
+        the weights back into the network when done.
+
+        The engine runs in single precision, but the weights are updated in
+        double precision, as libfann keeps them, and the engine gets a copy
+        of them after every epoch.
+        '''
+        if train_data is None:
+            train_data = self.train_datas
+        engine = ForwardEngine(self.neural_net)
+        engine._check_trainable()
+        inputs, outputs = self._scaled(train_data)._get_arrays()
+        algorithm = self.get_training_algorithm()
+        update = _threaded_updates[algorithm]
+        parallel = self._parallel
+        weights = self.neural_net.get_weights()
+        parallel.prepare(self, algorithm, len(weights))
+        error_function = self.get_train_error_function()
+        bit_fail_limit = self.get_bit_fail_limit()
+        pruned = self.neural_net._pruned
+
+        def train_epoch():
+            slopes = parallel.slopes(engine, inputs, outputs, error_function,
+                                     bit_fail_limit)
+            update(self, parallel, weights, slopes, len(inputs))
+            if pruned is not None:
+                weights[pruned] = 0.0
+            engine.set_weights(weights)
+            return parallel.mse, parallel.bit_fail, len(inputs), \
+                parallel.epoch_time
+
+        if early_stopping is not None:
+            validation_inputs, validation_outputs = self._scaled(
+                early_stopping.validation_data)._get_arrays()
+
+            def test():
+                squared_error = engine._output_errors(
+                    validation_inputs, validation_outputs, error_function,
+                    bit_fail_limit)[3]
+                return squared_error / max(validation_outputs.size, 1)
+
+            def set_weights(best_weights):
+                weights[:] = best_weights
+                engine.set_weights(weights)
+
+            early_stopping.bind(test, weights.copy, set_weights)
+        try:
+            result = self._train_epochs(train_epoch, max_epochs,
+                                        epochs_between_reports, disired_error,
+                                        callbacks)
+            if early_stopping is not None:
+                early_stopping.restore()
+            return result
+        finally:
+            self.neural_net.set_weights(weights)
     
+    def _scaled(self, train_data):
+        '''
+        Returns train_data scaled with the scaling parameters of the
+        neural network, if it has any.
+        '''
+        return train_data._scaled(self.neural_net._scaling)
+
     def test(self):
         '''
         Test a set of training data and calculates the MSE for the training data.
 
         This function updates the MSE and the bit fail values.
         '''
-        return self.neural_net.test_data()
-
-    _prop_funcs = [
-    ('training_algorithm', None, None),
-    ('learning_late', None, None),
-    ('learning_momentum', None, None),
-    ('train_error_function', None,None),
-    ('train_stop_function', None,None),
-    ('bit_fail_limit', None,None),
-    ('quickprop_decay', None,None),
-    ('rprop_increase_factor', None,None),
-    ('rprop_decrease_factor', None,None),
-    ('rprop_delta_min',None,None),
-    ('rprop_delta_max',None,None),
-    ('rprop_delta_zero',None,None),
-    ('sarprop_weight_decay_shift',None,None),
-    ('sarprop_step_error_threshold_factor',None,None),
-    ('sarprop_step_error_shift',None,None),
-    ('sarprop_temperature',None,None)
+        return self.neural_net._fann.test_data(
+            self._scaled(self.train_datas)._native())
+
+    _prop_names = [
+    'training_algorithm',
+    'learning_rate',
+    'learning_momentum',
+    'train_error_function',
+    'train_stop_function',
+    'bit_fail_limit',
+    'quickprop_decay',
+    'quickprop_mu',
+    'rprop_increase_factor',
+    'rprop_decrease_factor',
+    'rprop_delta_min',
+    'rprop_delta_max',
+    'rprop_delta_zero',
+    'sarprop_weight_decay_shift',
+    'sarprop_step_error_threshold_factor',
+    'sarprop_step_error_shift',
+    'sarprop_temperature'
     ]
     
     def get_training_propaties(self):
         '''
-        Get the training propaties including berow:
+        Get the training propaties as a dict from their names to their values.
+
+        The names are those of the get_ and set_ methods below, from
+        training_algorithm to sarprop_temperature.
         '''
         propaties = {}
-        for pf in self._prop_funcs:
-            propaties[pf[0]] = pf[1]()
+        for name in self._prop_names:
+            propaties[name] = getattr(self, 'get_' + name)()
+        return propaties
 
     def set_training_propaties(self, **kwargs):
         '''
-        Set training propaties
+        Set training propaties, given as keyword arguments named as in
+        get_training_propaties.
         '''
-        
-        for pf in self._prop_funcs:
-            if pf[0] in kwargs:
-                pf[2](kwargs[pf[0]],)
+        for name in kwargs:
+            if name not in self._prop_names:
+                raise ValueError('unknown training propaty ' + name)
+        for name in self._prop_names:
+            if name in kwargs:
+                getattr(self, 'set_' + name)(kwargs[name])
 
     def get_training_algorithm(self):
         '''
@@ -95,12 +548,13 @@ class Trainer():
         
         The default training algorithm is RPROP.
         '''
-        return train_algorithm.RPROP
+        return train_algorithm(self.neural_net._fann.get_training_algorithm())
     
     def set_training_algorithm(self, algorithm):
         '''
         Set the training algorithm.
         '''
+        self.neural_net._fann.set_training_algorithm(algorithm.value)
     
     def get_learning_rate(self):
         '''
@@ -113,7 +567,7 @@ class Trainer():
         
         The default learning rate is 0.7.
         '''
-        return 0.7
+        return self.neural_net._fann.get_learning_rate()
 
     def set_learning_rate(self, lerning_rate):
         '''
@@ -121,6 +575,7 @@ class Trainer():
         
         More info available in get_learning_rate
         '''
+        self.neural_net._fann.set_learning_rate(lerning_rate)
 
     def get_learning_momentum(self):
         '''
@@ -134,7 +589,7 @@ class Trainer():
 
         The default momentum is 0.
         '''
-        return 0.0
+        return self.neural_net._fann.get_learning_momentum()
 
     def set_learning_momentum(self, learning_momentum):
         '''
@@ -142,6 +597,7 @@ class Trainer():
 
         More info available in get_learning_momentum
         '''
+        self.neural_net._fann.set_learning_momentum(learning_momentum)
 
     def get_train_error_function(self):
         '''
@@ -151,12 +607,13 @@ class Trainer():
         
         The default error function is TANH
         '''
-        return error_func.TANH
+        return error_func(self.neural_net._fann.get_train_error_function())
 
     def set_train_error_function(self, error_function):
         '''
         Set the error function used during training.
         '''
+        self.neural_net._fann.set_train_error_function(error_function.value)
 
     def get_train_stop_function(self):
         '''
@@ -166,12 +623,13 @@ class Trainer():
         
         The default stop function is MSE
         '''
-        return stop_func.MSE
+        return stop_func(self.neural_net._fann.get_train_stop_function())
     
     def set_train_stop_function(self, stop_function):
         '''
         Set the stop function used during training.
         '''
+        self.neural_net._fann.set_train_stop_function(stop_function.value)
 
     def get_bit_fail_limit(self):
         '''
@@ -188,12 +646,13 @@ class Trainer():
         
         The default bit fail limit is 0.35.
         '''
-        return 0.35
+        return self.neural_net._fann.get_bit_fail_limit()
 
     def set_bit_fail_limit(self, bit_fail_limit):
         '''
         Set the bit fail limit used during training.
         '''
+        self.neural_net._fann.set_bit_fail_limit(bit_fail_limit)
 
     def get_quickprop_decay(self):
         '''
@@ -201,117 +660,518 @@ class Trainer():
         the weights should become smaller in each iteration during quickprop
         training.
         '''
+        return self.neural_net._fann.get_quickprop_decay()
 
-    def set_quickprop_decay(self):
+    def set_quickprop_decay(self, quickprop_decay):
         '''
         Sets the quickprop decay factor.
         '''
+        self.neural_net._fann.set_quickprop_decay(quickprop_decay)
 
     def get_quickprop_mu(self):
         '''
         The mu factor is used to increase and decrease the step-size during
         quickprop training.
         '''
+        return self.neural_net._fann.get_quickprop_mu()
 
-    def set_quickprop_mu(self):
+    def set_quickprop_mu(self, quickprop_mu):
         '''
         Sets the quickprop mu factor.
         '''
+        self.neural_net._fann.set_quickprop_mu(quickprop_mu)
 
     def get_rprop_increase_factor(self):
         '''
         The increase factor is a value larger than 1, which is used to
         increase the step-size during RPROP training.
         '''
+        return self.neural_net._fann.get_rprop_increase_factor()
 
-    def set_rprop_increase_factor(self):
+    def set_rprop_increase_factor(self, rprop_increase_factor):
         '''
         The increase factor used during RPROP training.
         '''
+        self.neural_net._fann.set_rprop_increase_factor(rprop_increase_factor)
     def get_rprop_decrease_factor(self):
         '''
         The decrease factor is a value smaller than 1, which is used to
         decrease the step-size during RPROP training.
         '''
+        return self.neural_net._fann.get_rprop_decrease_factor()
 
-    def set_rprop_decrease_factor(self):
+    def set_rprop_decrease_factor(self, rprop_decrease_factor):
         '''
         The decrease factor is a value smaller than 1, which is used to
         decrease the step-size during RPROP training.
         '''
+        self.neural_net._fann.set_rprop_decrease_factor(rprop_decrease_factor)
 
     def get_rprop_delta_min(self):
         '''
         The minimum step-size is a small positive number determining how small
         the minimum step-size may be.
         '''
+        return self.neural_net._fann.get_rprop_delta_min()
 
-    def set_rprop_delta_min(self):
+    def set_rprop_delta_min(self, rprop_delta_min):
         '''
         The minimum step-size is a small positive number determining how small
         the minimum step-size may be.
         '''
+        self.neural_net._fann.set_rprop_delta_min(rprop_delta_min)
 
     def get_rprop_delta_max(self):
         '''
         The maximum step-size is a positive number determining how large the
         maximum step-size may be.
         '''
+        return self.neural_net._fann.get_rprop_delta_max()
 
-    def set_rprop_delta_max(self):
+    def set_rprop_delta_max(self, rprop_delta_max):
         '''
         The maximum step-size is a positive number determining how large the
         maximum step-size may be.
         '''
+        self.neural_net._fann.set_rprop_delta_max(rprop_delta_max)
 
     def get_rprop_delta_zero(self):
         '''
         The initial step-size is a positive number determining the initial step
         size.
         '''
+        return self.neural_net._fann.get_rprop_delta_zero()
 
-    def set_rprop_delta_zero(self):
+    def set_rprop_delta_zero(self, rprop_delta_zero):
         '''
         The initial step-size is a positive number determining the initial step
         size.
         '''
+        self.neural_net._fann.set_rprop_delta_zero(rprop_delta_zero)
 
     def get_sarprop_weight_decay_shift(self):
         '''
         The sarprop weight decay shift.
         '''
+        return self.neural_net._fann.get_sarprop_weight_decay_shift()
 
-    def set_sarprop_weight_decay_shift(self):
+    def set_sarprop_weight_decay_shift(self, weight_decay_shift):
         '''
         Set the sarprop weight decay shift.
         '''
+        self.neural_net._fann.set_sarprop_weight_decay_shift(
+            weight_decay_shift)
 
     def get_sarprop_step_error_threshold_factor(self):
         '''
         The sarprop step error threshold factor.
         '''
+        return self.neural_net._fann.get_sarprop_step_error_threshold_factor()
 
-    def set_sarprop_step_error_threshold_factor(self):
+    def set_sarprop_step_error_threshold_factor(self, threshold_factor):
         '''
         Set the sarprop step error threshold factor.
         '''
+        self.neural_net._fann.set_sarprop_step_error_threshold_factor(
+            threshold_factor)
 
     def get_sarprop_step_error_shift(self):
         '''
         The get sarprop step error shift.
         '''
+        return self.neural_net._fann.get_sarprop_step_error_shift()
 
-    def set_sarprop_step_error_shift(self):
+    def set_sarprop_step_error_shift(self, step_error_shift):
         '''
         Set the sarprop step error shift.
         '''
+        self.neural_net._fann.set_sarprop_step_error_shift(
+            step_error_shift)
 
     def get_sarprop_temperature(self):
         '''
         The sarprop weight decay shift.
         '''
+        return self.neural_net._fann.get_sarprop_temperature()
 
-    def set_sarprop_temperature(self):
+    def set_sarprop_temperature(self, sarprop_temperature):
         '''
         Set the sarprop_temperature.
         '''
+        self.neural_net._fann.set_sarprop_temperature(sarprop_temperature)
+
+class _EarlyStopping(object):
+    '''
+    A training callback testing the validation MSE, which keeps a snapshot
+    of the best weights and stops the training once the MSE has not
+    improved for patience epochs.
+    '''
+
+    def __init__(self, validation_data, epochs_between_validations, patience):
+        if epochs_between_validations < 1:
+            raise ValueError('epochs_between_validations must be at least 1')
+        if patience < 1:
+            raise ValueError('patience must be at least 1')
+        self.validation_data = validation_data
+        self.epochs_between_validations = epochs_between_validations
+        self.patience = patience
+        self.best_mse = float('inf')
+        self.best_epoch = 0
+        self.best_weights = None
+
+    def bind(self, test, get_weights, set_weights):
+        '''
+        Set the functions returning the validation MSE, and getting and
+        setting the weights of what is being trained.
+        '''
+        self.test = test
+        self.get_weights = get_weights
+        self.set_weights = set_weights
+
+    def __call__(self, record):
+        if record.epoch % self.epochs_between_validations:
+            return 0
+        mse = self.test()
+        if mse < self.best_mse:
+            self.best_mse = mse
+            self.best_epoch = record.epoch
+            self.best_weights = self.get_weights()
+        elif record.epoch - self.best_epoch >= self.patience:
+            return -1
+        return 0
+
+    def restore(self):
+        '''
+        Put back the weights with the lowest validation MSE.
+        '''
+        if self.best_weights is not None:
+            self.set_weights(self.best_weights)
+
+class _DataParallel(object):
+    '''
+    The settings of data-parallel training.
+    '''
+
+    def __init__(self, num_processes, epochs_between_averages):
+        self.num_processes = num_processes
+        self.epochs_between_averages = epochs_between_averages
+
+class _ProcessGroup(object):
+    '''
+    The worker processes of one data-parallel training, each training a
+    copy of the network on a shard of the training data, and the shared
+    memory their weights are averaged in.
+
+    The shared block holds one row of weights per worker, which the worker
+    writes when asked to, and a last row with their average, which the
+    workers load before their next epoch.  Only commands and MSEs go
+    through the pipes.
+    '''
+
+    def __init__(self, neural_net, inputs, outputs, num_processes):
+        num = min(num_processes, len(inputs))
+        if num == 0:
+            raise ValueError('no training data')
+        bounds = np.linspace(0, len(inputs), num + 1).astype(int).tolist()
+        self.lengths = np.diff(bounds)
+        num_connections = neural_net.get_total_connections()
+        self._block = shared_memory.SharedMemory(
+            create=True, size=max(8 * (num + 1) * num_connections, 1))
+        self.weights = np.ndarray((num + 1, num_connections),
+                                  dtype=np.float64, buffer=self._block.buf)
+        self.weights[num] = neural_net.get_weights()
+        self.epochs = 0
+        self._load = False
+        self._pipes = []
+        self._processes = []
+        context = multiprocessing.get_context('fork')
+        for index, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:])):
+            pipe, child_pipe = context.Pipe()
+            process = context.Process(
+                target=_data_parallel_worker,
+                args=(neural_net, inputs[lo:hi], outputs[lo:hi],
+                      self.weights, index, child_pipe))
+            process.daemon = True
+            process.start()
+            child_pipe.close()
+            self._pipes.append(pipe)
+            self._processes.append(process)
+
+    def train_epoch(self, epochs_between_averages):
+        '''
+        Train one epoch on every worker, averaging the weights when due,
+        and return what Trainer._train_epochs expects.
+        '''
+        start = default_timer()
+        results = self._command(('train', self._load))
+        self._load = False
+        self.epochs += 1
+        if self.epochs % epochs_between_averages == 0:
+            self.average()
+        mse = float(np.average([mse for mse, _ in results],
+                               weights=self.lengths))
+        bit_fail = sum(bit_fail for _, bit_fail in results)
+        return mse, bit_fail, int(self.lengths.sum()), \
+            default_timer() - start
+
+    def average(self):
+        '''
+        Average the weights of the workers, which start their next epoch
+        from it, and return it.
+        '''
+        if not self._load:
+            self._command(('store',))
+            shares = self.lengths / float(self.lengths.sum())
+            self.weights[-1] = np.dot(shares, self.weights[:-1])
+            self._load = True
+        return self.weights[-1].copy()
+
+    def close(self):
+        for pipe in self._pipes:
+            try:
+                pipe.send(None)
+            except (IOError, OSError):
+                pass
+            pipe.close()
+        for process in self._processes:
+            process.join()
+        self._pipes = self._processes = []
+        self.weights = None
+        self._block.close()
+        self._block.unlink()
+
+    def _command(self, command):
+        for pipe in self._pipes:
+            pipe.send(command)
+        return [pipe.recv() for pipe in self._pipes]
+
+def _data_parallel_worker(neural_net, inputs, outputs, weights, index, pipe):
+    '''
+    The loop of a data-parallel training process, which trains its own copy
+    of neural_net on its shard of the training data.
+    '''
+    neural_net = neural_net.copy()
+    fann = neural_net._fann
+    data = TrainData.from_arrays(inputs, outputs)._native()
+    while True:
+        command = pipe.recv()
+        if command is None:
+            break
+        if command[0] == 'train':
+            if command[1]:
+                neural_net.set_weights(weights[-1])
+            mse = fann.train_epoch(data)
+            neural_net._apply_pruning()
+            pipe.send((mse, fann.get_bit_fail()))
+        else:
+            weights[index] = neural_net.get_weights()
+            pipe.send(None)
+    pipe.close()
+
+class _ParallelTraining(object):
+    '''
+    The threads and the training state of multi-threaded batch training.
+    '''
+
+    def __init__(self, num_threads):
+        self.num_threads = num_threads
+        self.pool = ThreadPool(num_threads)
+        self.algorithm = None
+        self.prev_steps = None
+        self.prev_slopes = None
+        self.sarprop_epoch = 0
+        self.epochs = 0
+        self.wall_time = 0.0
+        self.epoch_time = 0.0
+        self.thread_time = 0.0
+        self.mse = 0.0
+        self.bit_fail = 0
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def prepare(self, trainer, algorithm, num_connections):
+        '''
+        Reset the previous steps and slopes, as libfann does, when the
+        training algorithm or the network changed since the last epoch.
+        '''
+        if (algorithm == self.algorithm and self.prev_steps is not None and
+                len(self.prev_steps) == num_connections):
+            return
+        self.algorithm = algorithm
+        initial_step = 0.0
+        if algorithm == train_algorithm.RPROP:
+            initial_step = trainer.get_rprop_delta_zero()
+        self.prev_steps = np.full(num_connections, initial_step,
+                                  dtype=np.float32)
+        self.prev_slopes = np.zeros(num_connections, dtype=np.float32)
+        self.sarprop_epoch = 0
+
+    def slopes(self, engine, inputs, outputs, error_function, bit_fail_limit,
+               gradient=None):
+        '''
+        Compute the slopes of one epoch, one share of the patterns per
+        thread, and sum them.
+
+        gradient computes the slopes of a share as ForwardEngine._gradient
+        does, which is the default.
+        '''
+        gradient = gradient or engine._gradient
+        bounds = np.linspace(0, len(inputs), self.num_threads + 1)
+        bounds = bounds.astype(int).tolist()
+        shares = [(lo, hi) for lo, hi in zip(bounds[:-1], bounds[1:])
+                  if hi > lo]
+
+        def work(share):
+            start = default_timer()
+            lo, hi = share
+            slopes, squared_error, bit_fail = gradient(
+                inputs[lo:hi], outputs[lo:hi], error_function, bit_fail_limit)
+            return slopes, squared_error, bit_fail, default_timer() - start
+
+        start = default_timer()
+        results = self.pool.map(work, shares)
+        self.epoch_time = default_timer() - start
+        self.wall_time += self.epoch_time
+        self.epochs += 1
+        slopes = results[0][0]
+        for result in results[1:]:
+            slopes += result[0]
+        self.mse = (sum(result[1] for result in results) /
+                    max(inputs.shape[0] * outputs.shape[1], 1))
+        self.bit_fail = sum(result[2] for result in results)
+        self.thread_time += sum(result[3] for result in results)
+        return slopes
+
+# The weight updates below follow fann_update_weights_batch,
+# fann_update_weights_irpropm, fann_update_weights_quickprop and
+# fann_update_weights_sarprop, one connection per array element.
+
+def _update_batch(trainer, state, weights, slopes, num_data):
+    weights += slopes * (trainer.get_learning_rate() / num_data)
+
+def _update_rprop(trainer, state, weights, slopes, num_data):
+    prev_steps = np.maximum(state.prev_steps, 0.0001)
+    grow = state.prev_slopes * slopes >= 0.0
+    next_steps = np.where(
+        grow,
+        np.minimum(prev_steps * trainer.get_rprop_increase_factor(),
+                   trainer.get_rprop_delta_max()),
+        np.maximum(prev_steps * trainer.get_rprop_decrease_factor(),
+                   trainer.get_rprop_delta_min()))
+    slopes = np.where(grow, slopes, 0.0)
+    weights += np.where(slopes < 0.0, -next_steps, next_steps)
+    np.clip(weights, -1500.0, 1500.0, out=weights)
+    state.prev_steps[...] = next_steps
+    state.prev_slopes[...] = slopes
+
+def _update_quickprop(trainer, state, weights, slopes, num_data):
+    epsilon = trainer.get_learning_rate() / num_data
+    mu = trainer.get_quickprop_mu()
+    shrink_factor = mu / (1.0 + mu)
+    prev_steps = state.prev_steps
+    prev_slopes = state.prev_slopes
+    slopes = slopes + trainer.get_quickprop_decay() * weights
+    linear = epsilon * slopes
+    with np.errstate(divide='ignore', invalid='ignore'):
+        quadratic = prev_steps * slopes / (prev_slopes - slopes)
+    positive = prev_steps > 0.001
+    negative = prev_steps < -0.001
+    next_steps = np.where(
+        positive,
+        np.where(slopes > 0.0, linear, 0.0) +
+        np.where(slopes > shrink_factor * prev_slopes,
+                 mu * prev_steps, quadratic),
+        np.where(
+            negative,
+            np.where(slopes < 0.0, linear, 0.0) +
+            np.where(slopes < shrink_factor * prev_slopes,
+                     mu * prev_steps, quadratic),
+            linear))
+    weights += next_steps
+    np.clip(weights, -1500.0, 1500.0, out=weights)
+    state.prev_steps[...] = next_steps
+    state.prev_slopes[...] = slopes
+
+def _update_sarprop(trainer, state, weights, slopes, num_data):
+    temperature = trainer.get_sarprop_temperature()
+    epoch = state.sarprop_epoch
+    prev_steps = np.maximum(state.prev_steps, 0.000001)
+    slopes = -slopes - weights * np.exp2(
+        -temperature * epoch + trainer.get_sarprop_weight_decay_shift())
+    same_sign = state.prev_slopes * slopes
+    grow = same_sign > 0.0
+    shrink = same_sign < 0.0
+    decreased = prev_steps * trainer.get_rprop_decrease_factor()
+    threshold = trainer.get_sarprop_step_error_threshold_factor() * state.mse
+    noise = (np.random.random_sample(len(weights)) * np.sqrt(state.mse) *
+             np.exp2(-temperature * epoch +
+                     trainer.get_sarprop_step_error_shift()))
+    next_steps = np.where(
+        grow,
+        np.minimum(prev_steps * trainer.get_rprop_increase_factor(),
+                   trainer.get_rprop_delta_max()),
+        np.where(
+            shrink,
+            np.where(prev_steps < threshold,
+                     decreased + noise, np.maximum(decreased, 0.000001)),
+            prev_steps))
+    steps = np.where(shrink, 0.0, next_steps)
+    weights += np.where(slopes < 0.0, steps, -steps)
+    state.prev_steps[...] = next_steps
+    state.prev_slopes[...] = np.where(shrink, 0.0, slopes)
+    state.sarprop_epoch += 1
+
+_threaded_updates = {
+    train_algorithm.BATCH: _update_batch,
+    train_algorithm.RPROP: _update_rprop,
+    train_algorithm.QUICKPROP: _update_quickprop,
+    train_algorithm.SARPROP: _update_sarprop,
+}
+
+def _iter_source(source):
+    '''
+    Returns an iterator over a chunk source or a callable returning one.
+    '''
+    if callable(source):
+        source = source()
+    return iter(source)
+
+def _prefetch(chunks):
+    '''
+    Walks chunks on a background thread, one chunk ahead of the consumer.
+    '''
+    done = object()
+    chunk_queue = queue.Queue(maxsize=1)
+    stop = threading.Event()
+    errors = []
+
+    def read():
+        try:
+            for chunk in chunks:
+                if stop.is_set():
+                    return
+                chunk_queue.put(chunk)
+        except Exception as e:
+            errors.append(e)
+        chunk_queue.put(done)
+
+    reader = threading.Thread(target=read)
+    reader.daemon = True
+    reader.start()
+    try:
+        while True:
+            chunk = chunk_queue.get()
+            if chunk is done:
+                break
+            yield chunk
+    finally:
+        stop.set()
+        while reader.is_alive():
+            try:
+                chunk_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+    if errors:
+        raise errors[0]
@@ -0,0 +1,24 @@
+import asyncio
+import pytest
+
+pytest.importorskip('fann2.libfann')
+
+import numpy as np
+from pyfann import AsyncNeuralNet, create_standard_network
+
+def test_predict():
+    neural_net = create_standard_network([3, 4, 2])
+    inputs = np.random.RandomState(0).uniform(-1, 1, (5, 3))
+    expected = neural_net.freeze().run_batch(inputs)
+    front = AsyncNeuralNet(neural_net, max_batch_size=4, max_latency=0.01)
+
+    async def predict_all():
+        return await asyncio.gather(*[front.predict(row) for row in inputs])
+
+    outputs = asyncio.run(predict_all())
+    assert np.allclose(outputs, expected)
+    stats = front.get_stats()
+    assert stats['requests'] == 5
+    assert stats['batches'] == 2
+    with pytest.raises(ValueError):
+        asyncio.run(front.predict([0.0]))
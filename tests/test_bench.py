@@ -0,0 +1,41 @@
+import json
+import pytest
+
+pytest.importorskip('fann2.libfann')
+
+from pyfann import bench
+
+def test_check_import_budget():
+    result, failures = bench.check_import_budget(budget=10.0)
+    assert failures == []
+    assert result['loaded_modules'] == []
+
+def test_main(tmpdir):
+    output = str(tmpdir.join('results.json'))
+    bench.main(['--layers', '3,4,2', '--samples', '20', '--batch-repeat',
+                '1', '--epochs', '1', '--sparsity', '0.5', '--output',
+                output])
+    with open(output) as f:
+        results = json.load(f)
+    assert [r['network'] for r in results['results']] == [
+        'standard', 'sparse', 'shortcut']
+    assert results['import']['loaded_modules'] == []
+    assert set(results['results'][0]['train_epoch_seconds']) == set(
+        algorithm.name for algorithm in bench.train_algorithm)
+    assert [r['sparsity'] for r in results['results'][0]['pruning']] == [0.5]
+    for result in results['results']:
+        assert result['peak_memory_bytes'] >= 0
+
+def test_cases_run_in_fresh_interpreters(monkeypatch):
+    check_output = bench.subprocess.check_output
+    cases = []
+
+    def record(args, **kwargs):
+        if 'input' in kwargs:
+            cases.append(json.loads(kwargs['input'])['network'])
+        return check_output(args, **kwargs)
+    monkeypatch.setattr(bench.subprocess, 'check_output', record)
+    results = bench.run_benchmarks([[2, 3, 1]], samples=5, batch_repeat=1,
+                                   epochs=1, sparsities=[0.5])
+    assert cases == ['standard', 'sparse', 'shortcut']
+    assert [r['network'] for r in results['results']] == cases
@@ -0,0 +1,64 @@
+import pytest
+
+pytest.importorskip('fann2.libfann')
+
+import numpy as np
+from pyfann import (CascadeTrainer, TrainData, activation_func,
+                    create_shortcut_network, train_algorithm)
+
+def _data(num=30, seed=0):
+    random = np.random.RandomState(seed)
+    inputs = random.uniform(-1, 1, (num, 2))
+    outputs = np.sin(inputs.sum(axis=1, keepdims=True))
+    return TrainData.from_arrays(inputs, outputs)
+
+def test_candidate_settings():
+    trainer = CascadeTrainer(create_shortcut_network([2, 1]), _data())
+    assert trainer.get_cascade_activation_functions()[0] == \
+        activation_func.SIGMOID
+    assert trainer.get_cascade_num_candidates() == 80
+    trainer.set_cascade_activation_functions([activation_func.SIGMOID])
+    trainer.set_cascade_activation_steepnesses([0.5, 1.0])
+    trainer.set_cascade_min_out_epochs(2)
+    trainer.set_cascade_min_cand_epochs(3)
+    assert trainer.get_cascade_activation_steepnesses() == [0.5, 1.0]
+    assert trainer.get_cascade_min_out_epochs() == 2
+    assert trainer.get_cascade_min_cand_epochs() == 3
+    assert trainer.get_cascade_num_candidates() == 1 * 2 * 2
+
+def test_cascade_threaded():
+    neural_net = create_shortcut_network([2, 1])
+    trainer = CascadeTrainer(neural_net, _data())
+    trainer.set_training_algorithm(train_algorithm.RPROP)
+    trainer.set_num_threads(2)
+    trainer.set_cascade_activation_functions([activation_func.SIGMOID,
+                                              activation_func.GAUSSIAN])
+    trainer.set_cascade_min_out_epochs(1)
+    trainer.set_cascade_max_out_epochs(5)
+    trainer.set_cascade_min_cand_epochs(1)
+    trainer.set_cascade_max_cand_epochs(5)
+    trainer.cascade_train(2)
+    assert neural_net._fann.get_num_layers() == 4
+    assert trainer.get_cascade_min_out_epochs() == 1
+
+def test_one_thread_matches_threads():
+    results = []
+    for num_threads in (1, 3):
+        neural_net = create_shortcut_network([2, 1])
+        neural_net.set_weights(np.linspace(-0.5, 0.5, 3))
+        trainer = CascadeTrainer(neural_net, _data())
+        trainer.set_training_algorithm(train_algorithm.RPROP)
+        trainer.set_num_threads(num_threads)
+        trainer.set_cascade_activation_functions([activation_func.GAUSSIAN])
+        trainer.set_cascade_min_out_epochs(1)
+        trainer.set_cascade_max_out_epochs(5)
+        trainer.set_cascade_min_cand_epochs(1)
+        trainer.set_cascade_max_cand_epochs(5)
+        np.random.seed(0)
+        trainer.cascade_train(2)
+        assert trainer.get_num_threads() == num_threads
+        assert neural_net._fann.get_num_layers() == 4
+        assert neural_net._fann.get_activation_function(1, 0) == \
+            activation_func.GAUSSIAN.value
+        results.append(neural_net.get_weights())
+    assert np.allclose(results[0], results[1], rtol=1e-4, atol=1e-5)
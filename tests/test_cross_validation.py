@@ -0,0 +1,53 @@
+import pytest
+
+pytest.importorskip('fann2.libfann')
+
+import numpy as np
+from pyfann import (TrainData, Trainer, create_standard_network,
+                    cross_validate, train_algorithm)
+from pyfann.cross_validation import _fold_indices
+
+def test_cross_validate():
+    random = np.random.RandomState(0)
+    train_data = TrainData.from_arrays(random.uniform(-1, 1, (30, 2)),
+                                       random.uniform(-1, 1, (30, 1)))
+    neural_net = create_standard_network([2, 3, 1])
+    results = cross_validate(neural_net, train_data, k=3, max_epochs=5,
+                             seed=1, processes=2)
+    assert [result.fold for result in results] == [0, 1, 2]
+    assert [(result.num_train, result.num_test) for result in results] == \
+        [(20, 10)] * 3
+    assert all(result.MSE >= 0.0 for result in results)
+
+def test_fold_matches_serial_training():
+    random = np.random.RandomState(0)
+    train_data = TrainData.from_arrays(random.uniform(-1, 1, (30, 2)),
+                                       random.uniform(-1, 1, (30, 1)))
+    neural_net = create_standard_network([2, 3, 1])
+    results = cross_validate(neural_net, train_data, k=3, max_epochs=5,
+                             seed=1, processes=2)
+    folds = _fold_indices(30, 3, True, 1)
+    candidate = neural_net.copy()
+    trainer = Trainer(candidate,
+                      train_data.view(np.concatenate(folds[1:])))
+    trainer.train_for(5)
+    trainer.train_datas = train_data.view(folds[0])
+    mse = trainer.test()
+    assert results[0].MSE == pytest.approx(mse)
+    assert results[0].bit_fail == candidate._fann.get_bit_fail()
+
+def test_unseeded_folds_partition_the_patterns():
+    random = np.random.RandomState(0)
+    train_data = TrainData.from_arrays(random.uniform(-1, 1, (30, 2)),
+                                       random.uniform(-1, 1, (30, 1)))
+    neural_net = create_standard_network([2, 3, 1])
+    # Training does not move the weights, so the squared errors of the
+    # folds add up to those of all the patterns only if every pattern is
+    # held out exactly once.
+    neural_net._fann.set_training_algorithm(train_algorithm.INCREMENTAL.value)
+    neural_net._fann.set_learning_rate(0.0)
+    results = cross_validate(neural_net, train_data, k=3, max_epochs=2,
+                             processes=3)
+    mse = Trainer(neural_net, train_data).test()
+    assert sum(result.MSE * result.num_test for result in results) == \
+        pytest.approx(mse * 30)
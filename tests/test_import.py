@@ -0,0 +1,52 @@
+import os
+import subprocess
+import sys
+import pytest
+from pyfann.bench import IMPORT_BUDGET, bench_import
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _run(code):
+    env = dict(os.environ)
+    env.pop('PYFANN_PROFILE', None)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [_root] + [p for p in [env.get('PYTHONPATH')] if p])
+    return subprocess.check_output([sys.executable, '-c', code], env=env,
+                                   cwd=_root, universal_newlines=True)
+
+def test_import_is_light():
+    # The best of a few fresh interpreters, so a busy machine does not fail.
+    result = bench_import(repeat=3)
+    assert result['loaded_modules'] == []
+    assert result['seconds'] < IMPORT_BUDGET
+
+def test_enums_without_extension():
+    out = _run('import sys, pyfann\n'
+               'print(pyfann.train_algorithm.BATCH.name)\n'
+               'print("fann2.libfann" in sys.modules)\n')
+    assert out.split() == ['BATCH', 'False']
+
+def test_bench_without_extension():
+    out = _run('import sys\n'
+               'sys.modules["fann2"] = None\n'
+               'from pyfann import bench\n'
+               'print(bench.IMPORT_BUDGET)\n')
+    assert float(out) == IMPORT_BUDGET
+
+def test_unknown_name():
+    import pyfann
+    with pytest.raises(AttributeError):
+        pyfann.no_such_name
+    assert 'NeuralNet' in dir(pyfann)
+
+def test_names_resolve_to_submodules():
+    pytest.importorskip('fann2.libfann')
+    import pyfann
+    from pyfann import enums, neural_net, trainer
+    assert pyfann.NeuralNet is neural_net.NeuralNet
+    assert pyfann.Trainer is trainer.Trainer
+    assert pyfann.train_algorithm is enums.train_algorithm
+    assert trainer.train_algorithm is pyfann.train_algorithm
+    assert neural_net.activation_func is pyfann.activation_func
+    for name in pyfann.__all__:
+        assert getattr(pyfann, name) is not None
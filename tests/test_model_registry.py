@@ -0,0 +1,99 @@
+import os
+import time
+import pytest
+
+pytest.importorskip('fann2.libfann')
+
+from pyfann import (ModelRegistry, create_network_from_file,
+                    create_standard_network, model_registry)
+from pyfann.model_registry import _Entry
+
+def _save(tmpdir, name, layers):
+    filename = str(tmpdir.join(name))
+    create_standard_network(layers)._fann.save(filename)
+    return filename
+
+def test_get_caches(tmpdir):
+    registry = ModelRegistry(max_entries=1)
+    first = _save(tmpdir, 'first.net', [2, 3, 1])
+    second = _save(tmpdir, 'second.net', [2, 3, 1])
+    model = registry.get(first)
+    assert registry.get(first) is model
+    registry.get(second)
+    assert len(registry) == 1
+
+def test_reload(tmpdir):
+    registry = ModelRegistry()
+    filename = _save(tmpdir, 'net.net', [2, 3, 1])
+    old = registry.get(filename)
+    create_standard_network([2, 5, 1])._fann.save(filename)
+    os.utime(filename, (time.time() + 10, time.time() + 10))
+    assert registry.get(filename) is old
+    deadline = time.time() + 30
+    while registry.get(filename) is old and time.time() < deadline:
+        time.sleep(0.05)
+    assert registry.get(filename).get_total_neurons() > \
+        old.get_total_neurons()
+
+def test_deleted_file_keeps_serving(tmpdir):
+    registry = ModelRegistry()
+    filename = _save(tmpdir, 'net.net', [2, 3, 1])
+    model = registry.get(filename)
+    os.remove(filename)
+    assert registry.get(filename) is model
+    registry.remove(filename)
+    with pytest.raises(Exception):
+        registry.get(filename)
+
+def test_reload_stays_within_budget(tmpdir):
+    small = _save(tmpdir, 'small.net', [2, 2, 1])
+    other = _save(tmpdir, 'other.net', [2, 2, 1])
+    size = _Entry(None, create_standard_network([2, 2, 1])).size
+    registry = ModelRegistry(max_bytes=2 * size)
+    registry.get(other)
+    old = registry.get(small)
+    assert len(registry) == 2
+    # Replace small.net with a larger network, with a new stamp.
+    create_standard_network([2, 20, 1])._fann.save(small)
+    os.utime(small, (time.time() + 10, time.time() + 10))
+    assert registry.get(small) is old
+    deadline = time.time() + 30
+    while registry.get(small) is old and time.time() < deadline:
+        time.sleep(0.05)
+    assert registry.get(small) is not old
+    assert len(registry) == 1
+
+def test_failed_reload_waits_for_a_new_version(tmpdir, monkeypatch):
+    registry = ModelRegistry()
+    filename = _save(tmpdir, 'net.net', [2, 3, 1])
+    old = registry.get(filename)
+    loads = []
+
+    def load(key):
+        loads.append(key)
+        return create_network_from_file(key)
+
+    monkeypatch.setattr(model_registry, 'create_network_from_file', load)
+    with open(filename, 'w') as f:
+        f.write('not a network\n')
+    os.utime(filename, (time.time() + 10, time.time() + 10))
+    for _ in range(5):
+        assert registry.get(filename) is old
+        deadline = time.time() + 30
+        while registry._reloading and time.time() < deadline:
+            time.sleep(0.05)
+    assert len(loads) == 1
+    create_standard_network([2, 5, 1])._fann.save(filename)
+    os.utime(filename, (time.time() + 20, time.time() + 20))
+    deadline = time.time() + 30
+    while registry.get(filename) is old and time.time() < deadline:
+        time.sleep(0.05)
+    assert len(loads) == 2
+    assert registry.get(filename) is not old
+
+def test_unreadable_file(tmpdir):
+    filename = str(tmpdir.join('net.net'))
+    with open(filename, 'w') as f:
+        f.write('not a network\n')
+    with pytest.raises(IOError):
+        create_network_from_file(filename)
@@ -0,0 +1,235 @@
+from multiprocessing.pool import ThreadPool
+import os
+import subprocess
+import sys
+import pytest
+
+pytest.importorskip('fann2.libfann')
+
+import numpy as np
+from pyfann import (ForwardEngine, TrainData, activation_func,
+                    connection_dtype, create_engine_from_binary_file,
+                    create_network_from_binary_file,
+                    create_network_from_file, create_shortcut_network,
+                    create_standard_network)
+from pyfann.neural_net import _BINARY_HEADER, _BINARY_MAGIC, _read_topology
+
+def test_run_batch():
+    neural_net = create_standard_network([3, 4, 2])
+    inputs = np.random.RandomState(0).uniform(-1, 1, (5, 3))
+    out = np.empty((5, 2), dtype=np.float32)
+    assert neural_net.run_batch(inputs, out) is out
+    expected = [neural_net.run(row) for row in inputs.astype(np.float32)]
+    assert np.allclose(out, expected)
+    assert np.allclose(ForwardEngine(neural_net).run_batch(inputs), expected,
+                       atol=1e-6)
+    assert np.allclose(neural_net.freeze().run_batch(inputs), expected,
+                       atol=1e-6)
+    with pytest.raises(ValueError):
+        neural_net.run_batch(np.zeros((5, 2)))
+
+def test_engine_matches_libfann():
+    inputs = np.random.RandomState(0).uniform(-1, 1, (6, 3))
+    for neural_net in (create_standard_network([3, 4, 2]),
+                       create_shortcut_network([3, 4, 2])):
+        neural_net.randomize_weights(-1.0, 1.0)
+        engine = ForwardEngine(neural_net)
+        assert (engine.get_num_input(), engine.get_num_output()) == (3, 2)
+        assert np.allclose(engine.run_batch(inputs),
+                           neural_net.run_batch(inputs), atol=1e-6)
+        assert np.allclose(engine.run(inputs[0]), neural_net.run(inputs[0]),
+                           atol=1e-6)
+
+def test_engine_activation_functions():
+    inputs = np.random.RandomState(0).uniform(-1, 1, (6, 3))
+    neural_net = create_standard_network([3, 4, 2])
+    neural_net.randomize_weights(-1.0, 1.0)
+    for func in (activation_func.SIGMOID, activation_func.SIGMOID_SYMMETRIC,
+                 activation_func.GAUSSIAN, activation_func.ELLIOT,
+                 activation_func.SIN, activation_func.COS,
+                 activation_func.SIN_SYMMETRIC,
+                 activation_func.COS_SYMMETRIC):
+        neural_net._fann.set_activation_function_hidden(func.value)
+        neural_net._fann.set_activation_function_output(func.value)
+        assert np.allclose(ForwardEngine(neural_net).run_batch(inputs),
+                           neural_net.run_batch(inputs), atol=1e-6), func
+
+def _inputs(num=6, seed=0):
+    return np.random.RandomState(seed).uniform(-1, 1, (num, 3))
+
+def test_freeze():
+    neural_net = create_standard_network([3, 4, 2])
+    frozen = neural_net.freeze()
+    assert frozen.get_num_input() == 3
+    expected = neural_net.run_batch(_inputs())
+    pool = ThreadPool(4)
+    try:
+        outputs = pool.map(lambda seed: frozen.run_batch(_inputs(seed=0)),
+                           range(8))
+    finally:
+        pool.close()
+    for output in outputs:
+        assert np.allclose(output, expected, atol=1e-6)
+    assert np.allclose(frozen.run(_inputs()[0]), expected[0], atol=1e-6)
+    neural_net.randomize_weights(-1.0, 1.0)
+    assert np.allclose(frozen.run_batch(_inputs()), expected, atol=1e-6)
+
+def test_save(tmpdir):
+    neural_net = create_standard_network([3, 4, 2])
+    neural_net.randomize_weights(-1.0, 1.0)
+    filename = str(tmpdir.join('net.net'))
+    neural_net.save(filename)
+    loaded = create_network_from_file(filename)
+    assert np.allclose(loaded.run_batch(_inputs()),
+                       neural_net.run_batch(_inputs()))
+
+def test_binary_network(tmpdir):
+    neural_net = create_shortcut_network([3, 4, 2])
+    neural_net.randomize_weights(-1.0, 1.0)
+    filename = str(tmpdir.join('net.bin'))
+    neural_net.save(filename, binary=True)
+    loaded = create_network_from_binary_file(filename)
+    assert np.allclose(loaded.run_batch(_inputs()),
+                       neural_net.run_batch(_inputs()), atol=1e-6)
+    engine = create_engine_from_binary_file(filename)
+    assert np.allclose(engine.run_batch(_inputs()),
+                       neural_net.run_batch(_inputs()), atol=1e-6)
+
+_engine_code = '''
+import sys
+sys.modules['fann2'] = None
+import numpy as np
+from pyfann import ForwardEngine, create_engine_from_binary_file
+engine = create_engine_from_binary_file(sys.argv[1])
+assert isinstance(engine, ForwardEngine)
+np.save(sys.argv[3], engine.run_batch(np.load(sys.argv[2])))
+try:
+    from pyfann import create_standard_network
+    create_standard_network([2, 1])
+except ImportError:
+    pass
+else:
+    raise AssertionError('fann2 was imported')
+'''
+
+def test_engine_without_extension(tmpdir):
+    neural_net = create_shortcut_network([3, 4, 2])
+    neural_net.randomize_weights(-1.0, 1.0)
+    filename = str(tmpdir.join('net.bin'))
+    neural_net.save(filename, binary=True)
+    inputs = str(tmpdir.join('inputs.npy'))
+    outputs = str(tmpdir.join('outputs.npy'))
+    np.save(inputs, _inputs())
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [root] + [p for p in [env.get('PYTHONPATH')] if p])
+    subprocess.check_call([sys.executable, '-c', _engine_code, filename,
+                           inputs, outputs], env=env)
+    assert np.allclose(np.load(outputs), neural_net.run_batch(_inputs()),
+                       atol=1e-6)
+
+def test_binary_round_trip(tmpdir):
+    neural_net = create_standard_network([3, 4, 2])
+    neural_net.randomize_weights(-1.0, 1.0)
+    neural_net._fann.set_activation_steepness(0.3, 1, 2)
+    filename = str(tmpdir.join('net.bin'))
+    neural_net.save(filename, binary=True)
+    loaded = create_network_from_binary_file(filename)
+    assert np.array_equal(loaded.get_weights(), neural_net.get_weights())
+    assert loaded._fann.get_activation_steepness(1, 2) == 0.3
+    assert loaded.run([0.1, 0.2, 0.3]) == neural_net.run([0.1, 0.2, 0.3])
+
+def test_binary_reads_single_precision_files(tmpdir):
+    neural_net = create_standard_network([2, 2, 1])
+    (network_type, layers, biases, from_neuron, to_neuron, weights, funcs,
+     steepnesses) = _read_topology(neural_net._fann)
+    filename = str(tmpdir.join('net.bin'))
+    with open(filename, 'wb') as f:
+        f.write(_BINARY_HEADER.pack(_BINARY_MAGIC, 1, network_type.value,
+                                    len(layers), len(funcs), len(weights)))
+        for array, dtype in [(layers, '<u4'), (biases, '<u4'),
+                             (funcs, '<u4'), (steepnesses, '<f4'),
+                             (from_neuron, '<u4'), (to_neuron, '<u4'),
+                             (weights, '<f4')]:
+            np.asarray(array, dtype=dtype).tofile(f)
+    loaded = create_network_from_binary_file(filename)
+    assert np.array_equal(loaded.get_weights(),
+                          weights.astype(np.float32).astype(np.float64))
+
+def test_copy():
+    neural_net = create_standard_network([2, 3, 1])
+    neural_net._fann.set_learning_rate(0.25)
+    copy = neural_net.copy()
+    assert copy._fann.get_connection_array() == \
+        neural_net._fann.get_connection_array()
+    assert copy._fann.get_learning_rate() == 0.25
+    assert copy.run([0.5, -0.5]) == neural_net.run([0.5, -0.5])
+    copy.randomize_weights(0.5, 1.0)
+    assert copy._fann.get_connection_array() != \
+        neural_net._fann.get_connection_array()
+
+def test_to_fixed():
+    neural_net = create_standard_network([3, 4, 2])
+    fixed = neural_net.to_fixed()
+    assert fixed.get_decimal_point() > 0
+    expected = neural_net.run_batch(_inputs())
+    assert np.allclose(fixed.run_batch(_inputs()), expected, atol=0.05)
+    fixed_inputs = np.round(_inputs() * fixed.get_multiplier())
+    assert np.allclose(fixed.run_batch_fixed(fixed_inputs) /
+                       float(fixed.get_multiplier()), expected, atol=0.05)
+    loss = fixed.get_accuracy_loss(
+        TrainData.from_arrays(_inputs(), expected))
+    assert loss['max_output_error'] < 0.05
+    assert loss['float_MSE'] < 1e-10
+
+def test_scaling(tmpdir):
+    neural_net = create_standard_network([3, 4, 2])
+    inputs = (_inputs() * 10.0).astype(np.float32)
+    train_data = TrainData.from_arrays(inputs, inputs[:, :2] * 5.0)
+    neural_net.set_scaling_params(train_data)
+    scaling = neural_net._scaling
+    scaled = scaling.scale_input(inputs)
+    assert np.allclose(scaled.mean(axis=0), 0.0, atol=1e-5)
+    raw = np.array([neural_net._fann.run(row) for row in scaled],
+                   dtype=np.float32)
+    outputs = neural_net.run_batch(inputs)
+    assert np.allclose(outputs, scaling.descale_output(raw), atol=1e-5)
+    assert np.allclose(outputs[0], neural_net.run(inputs[0]), atol=1e-5)
+    assert np.allclose(ForwardEngine(neural_net).run_batch(inputs), outputs,
+                       atol=1e-4)
+    filename = str(tmpdir.join('net.bin'))
+    neural_net.save(filename, binary=True)
+    assert np.allclose(create_engine_from_binary_file(filename).run_batch(
+        inputs), outputs, atol=1e-4)
+    neural_net.clear_scaling_params()
+    assert np.allclose(neural_net.run_batch(scaled), raw, atol=1e-6)
+
+def test_prune_and_to_sparse():
+    neural_net = create_standard_network([3, 4, 2])
+    neural_net.randomize_weights(-1.0, 1.0)
+    neural_net.prune(sparsity=0.5)
+    assert neural_net.get_sparsity() >= 0.5
+    sparse = neural_net.to_sparse()
+    assert sparse.get_num_connections() < neural_net.get_total_connections()
+    assert np.allclose(sparse.run_batch(_inputs()),
+                       neural_net.run_batch(_inputs()), atol=1e-5)
+    neural_net.clear_pruning()
+    assert neural_net.get_sparsity() == 0.0
+
+def test_weights_round_trip():
+    neural_net = create_standard_network([3, 4, 2])
+    neural_net.randomize_weights(-1.0, 1.0)
+    weights = neural_net.get_weights()
+    assert weights.shape == (neural_net.get_total_connections(),)
+    assert weights.dtype == np.float64
+    neural_net.set_weights(weights)
+    assert np.array_equal(neural_net.get_weights(), weights)
+    connections = neural_net.get_weights(structured=True)
+    assert connections.dtype == connection_dtype
+    connections['weight'] *= 2.0
+    neural_net.set_weights(connections[:3])
+    assert np.array_equal(neural_net.get_weights()[:3], weights[:3] * 2.0)
+    assert np.array_equal(neural_net.get_weights()[3:], weights[3:])
+    with pytest.raises(ValueError):
+        neural_net.set_weights(weights[:3])
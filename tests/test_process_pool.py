@@ -0,0 +1,18 @@
+import pytest
+
+pytest.importorskip('fann2.libfann')
+
+import numpy as np
+from pyfann import ForwardEngine, ProcessPoolNet, create_standard_network
+
+def test_run_batch():
+    neural_net = create_standard_network([3, 4, 2])
+    engine = ForwardEngine(neural_net)
+    random = np.random.RandomState(0)
+    with ProcessPoolNet(neural_net, processes=2) as pool:
+        assert pool.get_num_input() == 3
+        assert pool.get_num_output() == 2
+        for num in (10, 50, 3):
+            inputs = random.uniform(-1, 1, (num, 3))
+            assert np.allclose(pool.run_batch(inputs),
+                               engine.run_batch(inputs))
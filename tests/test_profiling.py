@@ -0,0 +1,43 @@
+import io
+import pytest
+
+pytest.importorskip('fann2.libfann')
+
+import fann2.libfann
+import numpy as np
+from pyfann import TrainData, Trainer, create_standard_network, profiling
+
+def test_profile():
+    neural_net = create_standard_network([2, 3, 1])
+    run = fann2.libfann.neural_net.run
+    profiling.reset()
+    with profiling.profile():
+        assert profiling.is_enabled()
+        neural_net.run([0.5, 0.5])
+        neural_net.run([0.5, 0.5])
+    neural_net.run([0.5, 0.5])
+    stats = profiling.get_stats()
+    assert stats['neural_net.run']['calls'] == 2
+    assert stats['neural_net.run']['bytes'] > 0
+    assert not profiling.is_enabled()
+    assert fann2.libfann.neural_net.run is run
+    report = io.StringIO()
+    profiling.report(report)
+    assert 'neural_net.run' in report.getvalue()
+
+def test_profile_inherited_methods():
+    neural_net = create_standard_network([2, 3, 1])
+    train_data = TrainData.from_arrays(np.zeros((4, 2)), np.zeros((4, 1)))
+    run = fann2.libfann.neural_net.run
+    profiling.reset()
+    with profiling.profile():
+        neural_net.run([0.5, 0.5])
+        neural_net.get_total_connections()
+        Trainer(neural_net, train_data).train()
+    stats = profiling.get_stats()
+    assert stats['neural_net.run']['calls'] == 1
+    assert stats['neural_net.get_total_connections']['calls'] == 1
+    assert stats['neural_net.train_epoch']['calls'] == 1
+    assert not profiling.is_enabled()
+    assert fann2.libfann.neural_net.run is run
+    assert 'train_epoch' not in vars(fann2.libfann.neural_net)
@@ -0,0 +1,92 @@
+import pytest
+
+pytest.importorskip('fann2.libfann')
+
+import numpy as np
+from pyfann import (TrainData, TrainDataChunks,
+                    read_train_data_from_binary_file,
+                    read_train_data_from_file)
+
+def _data(num=40, seed=0):
+    random = np.random.RandomState(seed)
+    return TrainData.from_arrays(random.uniform(-1, 1, (num, 3)),
+                                 random.uniform(-1, 1, (num, 2)))
+
+def _native_arrays(train_data):
+    native = train_data._native()
+    return (np.array(native.get_input(), dtype=np.float32),
+            np.array(native.get_output(), dtype=np.float32))
+
+def test_from_arrays():
+    random = np.random.RandomState(0)
+    inputs = random.uniform(-1, 1, (40, 3))
+    outputs = random.uniform(-1, 1, (40, 2))
+    train_data = TrainData.from_arrays(inputs[:30], outputs[:30])
+    train_data.add(inputs[30], outputs[30])
+    train_data.add(inputs[31:], outputs[31:])
+    assert train_data.length() == 40
+    assert train_data.num_input() == 3
+    assert train_data.num_output() == 2
+    for arrays in (train_data._get_arrays(), _native_arrays(train_data)):
+        assert np.array_equal(arrays[0], inputs.astype(np.float32))
+        assert np.array_equal(arrays[1], outputs.astype(np.float32))
+    with pytest.raises(ValueError):
+        train_data.add([0.0, 0.0], [0.0, 0.0])
+    with pytest.raises(ValueError):
+        train_data.add(inputs[:2], outputs[:1])
+
+def test_views():
+    train_data = _data()
+    inputs, outputs = train_data._get_arrays()
+    for view, index in [(train_data.view(slice(5, 35)), slice(5, 35)),
+                        (train_data.view(slice(5, 7)), slice(5, 7)),
+                        (train_data.view([3, 1, 2]), [3, 1, 2]),
+                        (train_data.view(slice(5, 35)).view([0, 2]),
+                         [5, 7])]:
+        assert view.length() == len(inputs[index])
+        assert view.num_input() == 3
+        native_inputs, native_outputs = _native_arrays(view)
+        assert np.array_equal(native_inputs, inputs[index])
+        assert np.array_equal(native_outputs, outputs[index])
+        # The libfann copy is made once per view.
+        assert view._native() is view._native()
+    with pytest.raises(ValueError):
+        train_data.view(slice(0, 2)).add([0, 0, 0], [0, 0])
+
+def test_shuffled_and_batches():
+    train_data = _data()
+    inputs, _ = train_data._get_arrays()
+    shuffled = train_data.shuffled(seed=1)
+    assert sorted(shuffled._get_arrays()[0][:, 0]) == sorted(inputs[:, 0])
+    batches = list(train_data.batches(16))
+    assert [batch.length() for batch in batches] == [16, 16, 8]
+    assert np.array_equal(batches[1]._get_arrays()[0], inputs[16:32])
+
+def test_files(tmpdir):
+    train_data = _data()
+    inputs, outputs = train_data._get_arrays()
+    text = str(tmpdir.join('data.train'))
+    binary = str(tmpdir.join('data.bin'))
+    train_data.save(text)
+    train_data.save(binary, binary=True)
+    assert np.allclose(_native_arrays(read_train_data_from_file(text))[0],
+                       inputs)
+    loaded = read_train_data_from_binary_file(binary)
+    assert np.array_equal(loaded._get_arrays()[0], inputs)
+    assert np.array_equal(loaded._get_arrays()[1], outputs)
+    assert np.array_equal(_native_arrays(loaded)[1], outputs)
+    loaded.add(inputs[0], outputs[0])
+    assert np.array_equal(loaded._get_arrays()[0][-1], inputs[0])
+
+def test_chunks(tmpdir):
+    train_data = _data()
+    inputs, outputs = train_data._get_arrays()
+    text = str(tmpdir.join('data.train'))
+    binary = str(tmpdir.join('data.bin'))
+    train_data.save(text)
+    train_data.save(binary, binary=True)
+    for filename in (text, binary):
+        chunks = list(TrainDataChunks(filename, 16))
+        assert [len(chunk[0]) for chunk in chunks] == [16, 16, 8]
+        assert np.allclose(np.concatenate([c[0] for c in chunks]), inputs)
+        assert np.allclose(np.concatenate([c[1] for c in chunks]), outputs)
@@ -0,0 +1,224 @@
+import pytest
+
+pytest.importorskip('fann2.libfann')
+
+import numpy as np
+from pyfann import (EpochRecord, TrainData, Trainer, activation_func,
+                    create_standard_network, search_training_parameters,
+                    train_algorithm)
+from pyfann.trainer import _ProcessGroup
+
+def _data(num=40, seed=0):
+    random = np.random.RandomState(seed)
+    inputs = random.uniform(-1, 1, (num, 3))
+    outputs = random.uniform(-1, 1, (num, 2))
+    return TrainData.from_arrays(inputs, outputs)
+
+def _twins(layers):
+    '''
+    Two networks with the same weights.
+    '''
+    neural_net = create_standard_network(layers)
+    neural_net.randomize_weights(-1.0, 1.0)
+    twin = create_standard_network(layers)
+    twin._fann.set_weight_array(neural_net._fann.get_connection_array())
+    return neural_net, twin
+
+def _connections(neural_net):
+    return np.array([weight for _, _, weight in
+                     neural_net._fann.get_connection_array()])
+
+def test_train_stream():
+    train_data = _data()
+    inputs, outputs = train_data._get_arrays()
+    chunks = [(inputs[:15], outputs[:15]), (inputs[15:], outputs[15:])]
+    streamed, in_memory = _twins([3, 4, 2])
+    for neural_net in (streamed, in_memory):
+        # Incremental training updates after every pattern, so walking the
+        # chunks in order is the same as one epoch over the whole data.
+        neural_net._fann.set_training_algorithm(
+            train_algorithm.INCREMENTAL.value)
+    mse, _ = Trainer(streamed, None).train_stream(chunks)
+    expected = Trainer(in_memory, train_data).train()
+    assert mse == pytest.approx(expected)
+    assert np.allclose(_connections(streamed), _connections(in_memory))
+    Trainer(streamed, None).train_stream_for(lambda: iter(chunks), 2)
+    Trainer(in_memory, train_data).train_for(2)
+    assert np.allclose(_connections(streamed), _connections(in_memory))
+    with pytest.raises(ValueError):
+        Trainer(streamed, None).train_stream_for(iter(chunks), 2)
+
+def test_train_views():
+    neural_net, twin = _twins([3, 4, 2])
+    train_data = _data()
+    trainers = Trainer(neural_net, train_data), Trainer(twin, train_data)
+    shuffled = train_data.shuffled(seed=0)
+    inputs, outputs = shuffled._get_arrays()
+    for start, batch in zip(range(0, 40, 16), shuffled.batches(16)):
+        trainers[0].train(batch)
+        trainers[1].train(TrainData.from_arrays(
+            inputs[start:start + 16], outputs[start:start + 16]))
+    assert np.array_equal(_connections(neural_net), _connections(twin))
+
+def test_threaded_training():
+    neural_net = create_standard_network([3, 4, 2])
+    neural_net.randomize_weights(-1.0, 1.0)
+    weights = _connections(neural_net)
+    trainer = Trainer(neural_net, _data())
+    trainer.set_training_algorithm(train_algorithm.RPROP)
+    trainer.set_num_threads(2)
+    assert trainer.get_num_threads() == 2
+    mses = [trainer.train() for _ in range(20)]
+    assert mses[-1] < mses[0]
+    assert not np.allclose(_connections(neural_net), weights)
+    stats = trainer.get_parallel_stats()
+    assert stats['epochs'] == 20
+    assert stats['MSE'] == mses[-1]
+    trainer.set_num_threads(1)
+    assert trainer.get_parallel_stats() is None
+
+def test_threaded_training_keeps_double_weights():
+    neural_net = create_standard_network([3, 4, 2])
+    neural_net.randomize_weights(-1.0, 1.0)
+    weights = neural_net.get_weights()
+    trainer = Trainer(neural_net, _data())
+    trainer.set_training_algorithm(train_algorithm.BATCH)
+    trainer.set_learning_rate(0.0)
+    trainer.set_num_threads(2)
+    trainer.train_for(2)
+    assert np.array_equal(neural_net.get_weights(), weights)
+
+def test_callbacks():
+    neural_net = create_standard_network([3, 4, 2])
+    trainer = Trainer(neural_net, _data())
+    records = []
+    trainer.add_callback(records.append)
+    trainer.train_for(3)
+    assert [record.epoch for record in records] == [1, 2, 3]
+    assert isinstance(records[0], EpochRecord)
+    assert records[0].samples_per_second > 0
+    trainer.add_callback(lambda record: -1 if record.epoch == 2 else 0)
+    trainer.set_num_threads(2)
+    trainer.set_training_algorithm(train_algorithm.RPROP)
+    trainer.train_for(5)
+    assert [record.epoch for record in records[3:]] == [1, 2]
+    trainer.remove_callback(records.append)
+
+def test_search_training_parameters():
+    neural_net = create_standard_network([3, 4, 2])
+    propaties, best, mse = search_training_parameters(
+        neural_net, _data(), {'learning_rate': [0.1, 0.3, 0.7]},
+        min_epochs=1, max_epochs=3, processes=2)
+    assert propaties['learning_rate'] in (0.1, 0.3, 0.7)
+    assert best._fann.get_learning_rate() == propaties['learning_rate']
+    assert best.get_total_connections() == neural_net.get_total_connections()
+
+def test_search_keeps_training_state():
+    neural_net = create_standard_network([3, 4, 2])
+    neural_net.randomize_weights(-1.0, 1.0)
+    propaties, best, mse = search_training_parameters(
+        neural_net, _data(), {'rprop_delta_zero': [0.05, 0.1, 0.2]},
+        min_epochs=2, max_epochs=6, processes=2)
+    # The best configuration carried on after 2 epochs without losing its
+    # RPROP step sizes, as if trained on its own.
+    candidate = neural_net.copy()
+    trainer = Trainer(candidate, _data())
+    trainer.set_training_propaties(**propaties)
+    trainer.train_for(2)
+    trainer.train_for(4)
+    assert mse == pytest.approx(trainer.test())
+    assert np.array_equal(best.get_weights(), candidate.get_weights())
+
+@pytest.mark.parametrize('algorithm', [
+    train_algorithm.BATCH, train_algorithm.RPROP, train_algorithm.QUICKPROP,
+    train_algorithm.SARPROP])
+def test_threads_match_libfann(algorithm):
+    single, threaded = _twins([3, 4, 2])
+    mses = []
+    for neural_net, num_threads in ((single, 1), (threaded, 3)):
+        neural_net._fann.set_activation_function_output(
+            activation_func.SIGMOID_SYMMETRIC.value)
+        trainer = Trainer(neural_net, _data())
+        trainer.set_training_algorithm(algorithm)
+        # Without the random steps SARPROP takes on small steps, it is
+        # deterministic.
+        trainer.set_sarprop_step_error_threshold_factor(0.0)
+        trainer.set_num_threads(num_threads)
+        mses.append([trainer.train() for _ in range(3)])
+    assert np.allclose(mses[0], mses[1], rtol=1e-4)
+    assert np.allclose(_connections(single), _connections(threaded),
+                       rtol=1e-4, atol=1e-5)
+
+def test_early_stopping():
+    neural_net = create_standard_network([3, 4, 2])
+    inputs = _data()._get_arrays()[0]
+    # The training moves the outputs away from the validation outputs, so
+    # the validation MSE stops improving early.
+    train_data = TrainData.from_arrays(inputs, np.full((40, 2), 0.9))
+    validation_data = TrainData.from_arrays(inputs, np.full((40, 2), 0.1))
+    validation = validation_data._native()
+    history = []
+
+    def record(record):
+        history.append((neural_net._fann.test_data(validation),
+                        _connections(neural_net)))
+
+    trainer = Trainer(neural_net, train_data)
+    trainer.add_callback(record)
+    trainer.train_for(100, validation_data=validation_data, patience=3)
+    best = int(np.argmin([mse for mse, _ in history]))
+    assert len(history) == best + 1 + 3 < 100
+    assert np.array_equal(_connections(neural_net), history[best][1])
+    assert not np.array_equal(_connections(neural_net), history[-1][1])
+    for patience in (0, -1):
+        with pytest.raises(ValueError):
+            trainer.train_for(10, validation_data=validation_data,
+                              patience=patience)
+
+def test_pruned_connections_stay_zero():
+    neural_net = create_standard_network([3, 4, 2])
+    neural_net.randomize_weights(-1.0, 1.0)
+    neural_net.prune(sparsity=0.5)
+    pruned = _connections(neural_net) == 0.0
+    trainer = Trainer(neural_net, _data())
+    trainer.set_training_algorithm(train_algorithm.RPROP)
+    for num_threads in (1, 2):
+        trainer.set_num_threads(num_threads)
+        trainer.train()
+        trainer.train_for(2)
+        assert np.all(_connections(neural_net)[pruned] == 0.0)
+    assert not np.all(_connections(neural_net) == 0.0)
+
+def test_data_parallel_training():
+    neural_net = create_standard_network([3, 4, 2])
+    trainer = Trainer(neural_net, _data())
+    trainer.set_training_algorithm(train_algorithm.INCREMENTAL)
+    trainer.set_num_processes(2, epochs_between_averages=2)
+    assert trainer.get_num_processes() == 2
+    assert trainer.get_epochs_between_averages() == 2
+    before = neural_net.get_weights()
+    trainer.train_for(3)
+    assert not np.array_equal(neural_net.get_weights(), before)
+
+def test_process_group_averages_by_shard_length():
+    neural_net = create_standard_network([3, 4, 2])
+    neural_net.randomize_weights(-1.0, 1.0)
+    Trainer(neural_net, _data()).set_training_algorithm(
+        train_algorithm.INCREMENTAL)
+    inputs, outputs = _data()._get_arrays()
+    group = _ProcessGroup(neural_net, inputs, outputs, 3)
+    try:
+        assert group.lengths.tolist() == [13, 13, 14]
+        group.train_epoch(1)
+        average = group.average()
+    finally:
+        group.close()
+    shards = []
+    for lo, hi in [(0, 13), (13, 26), (26, 40)]:
+        shard = neural_net.copy()
+        Trainer(shard, TrainData.from_arrays(inputs[lo:hi],
+                                             outputs[lo:hi])).train()
+        shards.append(shard.get_weights())
+    assert np.allclose(average,
+                       np.average(shards, axis=0, weights=[13, 13, 14]),
+                       rtol=1e-12, atol=0.0)